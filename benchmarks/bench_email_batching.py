@@ -0,0 +1,76 @@
+"""Email throughput, one Mailgun request per email versus batched requests.
+
+Usage: python -m benchmarks.bench_email_batching [--emails 2000] [--response-ms 50]
+
+Sends `--emails` registration-style emails to distinct recipients against a
+local stub of the Mailgun API that takes `--response-ms` to answer each
+request. "single" calls tasks.send_simple_email for every email, at most
+`--concurrency` requests in flight, as the app used to. "batched" goes
+through tasks.email_dispatcher, which coalesces them into batch requests.
+Both share tasks.http_client, as the app does.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import configure_environment, print_table, start_stub_mailgun
+
+DB_PATH = "bench_email_batching.db"
+
+
+async def run(emails: int, concurrency: int, response_ms: float) -> None:
+    configure_environment(DB_PATH)
+
+    from storeapi import tasks
+
+    server = await start_stub_mailgun(response_s=response_ms / 1000)
+    await tasks.open_http_client()
+    recipients = [f"user{i}@example.net" for i in range(emails)]
+    template = "Hi %recipient.email%! Please confirm: %recipient.url%"
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def single(to: str):
+        async with semaphore:
+            await tasks.send_simple_email(to, "Hi", f"Hi {to}! Please confirm: /c")
+
+    async def batched(to: str):
+        await tasks.send_batched_email(to, "Hi", template, url="/c")
+
+    rows = []
+    for mode, send in (("single", single), ("batched", batched)):
+        requests_before = tasks.email_dispatcher.batches
+        start = time.perf_counter()
+        await asyncio.gather(*(send(to) for to in recipients))
+        elapsed = time.perf_counter() - start
+        requests = (
+            emails
+            if mode == "single"
+            else tasks.email_dispatcher.batches - requests_before
+        )
+        rows.append(
+            [mode, requests, f"{elapsed * 1000:.0f}", f"{emails / elapsed:.0f}"]
+        )
+
+    await tasks.close_http_client()
+    server.close()
+    await server.wait_closed()
+
+    print(
+        f"{emails} emails, {response_ms:g} ms per Mailgun request,"
+        f" {concurrency} single requests at a time"
+    )
+    print_table(["mode", "requests", "total ms", "emails/s"], rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--emails", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--response-ms", type=float, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.emails, args.concurrency, args.response_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Memory and latency of the NDJSON post export as the table grows.
+
+Usage: python -m benchmarks.bench_export [--sizes 10000 100000 1000000]
+
+Seeds posts with two comments each and drains iter_posts_export, recording
+the time until the first chunk, the total time and the peak Python memory
+allocated during the export. The peak should stay flat across sizes.
+"""
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+
+from benchmarks.common import configure_environment, print_table, seed_rows
+
+DB_PATH = "bench_export.db"
+
+
+async def run(sizes: list[int], users: int) -> None:
+    configure_environment(DB_PATH)
+
+    from storeapi.config import config
+    from storeapi.database import (
+        comment_table,
+        database,
+        engine,
+        post_table,
+        user_table,
+    )
+    from storeapi.routers.post import iter_posts_export
+
+    seed_rows(
+        engine,
+        user_table,
+        [{"email": f"user{i}@example.net", "password": "x"} for i in range(users)],
+    )
+
+    await database.connect()
+    rows = []
+    seeded = 0
+    for size in sorted(sizes):
+        seed_rows(
+            engine,
+            post_table,
+            [
+                {"body": f"Post {i}", "user_id": random.randint(1, users)}
+                for i in range(seeded, size)
+            ],
+        )
+        seed_rows(
+            engine,
+            comment_table,
+            [
+                {
+                    "body": f"Comment {i}",
+                    "post_id": post_id,
+                    "user_id": random.randint(1, users),
+                }
+                for post_id in range(seeded + 1, size + 1)
+                for i in range(2)
+            ],
+        )
+        seeded = size
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        first_chunk_ms = None
+        exported = 0
+        async for chunk in iter_posts_export(0, config.EXPORT_CHUNK_SIZE):
+            if first_chunk_ms is None:
+                first_chunk_ms = (time.perf_counter() - start) * 1000
+            exported += chunk.count("\n")
+        total_s = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        rows.append(
+            [
+                size,
+                exported,
+                f"{first_chunk_ms:.1f}",
+                f"{total_s:.2f}",
+                f"{peak / 1024 / 1024:.1f}",
+            ]
+        )
+    await database.disconnect()
+
+    print(f"Export with chunk size {config.EXPORT_CHUNK_SIZE}")
+    print_table(
+        ["posts", "lines", "first chunk ms", "total s", "peak MiB"],
+        rows,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--users", type=int, default=1_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.users))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Per-call latency of outbound HTTP calls, per-call client versus shared pool.
+
+Usage: python -m benchmarks.bench_http_client [--calls 500] [--handshake-ms 0 20]
+
+Runs tasks.send_simple_email against a local stub of the Mailgun API. "per
+call" is how the tasks used to work: a new client, and so a new connection,
+for every call. "shared" goes through tasks.http_client, as the app does.
+The stub speaks plain HTTP on localhost, so connecting is nearly free; it
+can delay the first response on every connection by `--handshake-ms` to
+stand in for the TCP and TLS round trips to a remote API.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.common import configure_environment, print_table, start_stub_mailgun
+
+DB_PATH = "bench_http_client.db"
+
+
+async def run(calls: int, concurrency: int, handshakes_ms: list[float]) -> None:
+    configure_environment(DB_PATH)
+
+    from storeapi import tasks
+
+    rows = []
+    for handshake_ms in handshakes_ms:
+        server = await start_stub_mailgun(handshake_s=handshake_ms / 1000)
+
+        for mode in ("per call", "shared"):
+            if mode == "shared":
+                await tasks.open_http_client()
+            semaphore = asyncio.Semaphore(concurrency)
+            latencies = []
+
+            async def call():
+                async with semaphore:
+                    start = time.perf_counter()
+                    await tasks.send_simple_email("user@example.net", "Hi", "Body")
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(call() for _ in range(calls)))
+            elapsed = time.perf_counter() - start
+            await tasks.close_http_client()
+
+            latencies.sort()
+            rows.append(
+                [
+                    f"{handshake_ms:g}",
+                    mode,
+                    f"{statistics.median(latencies):.2f}",
+                    f"{latencies[int(len(latencies) * 0.99) - 1]:.2f}",
+                    f"{calls / elapsed:.0f}",
+                ]
+            )
+        server.close()
+        await server.wait_closed()
+
+    print(f"send_simple_email latency in ms, {calls} calls, {concurrency} at a time")
+    print_table(["handshake ms", "client", "p50", "p99", "calls/s"], rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--handshake-ms", type=float, nargs="+", default=[0, 20])
+    args = parser.parse_args()
+    asyncio.run(run(args.calls, args.concurrency, args.handshake_ms))
+
+
+if __name__ == "__main__":
+    main()
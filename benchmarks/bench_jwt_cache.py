@@ -0,0 +1,80 @@
+"""Cost of verifying the bearer token per request, with and without the cache.
+
+Usage: python -m benchmarks.bench_jwt_cache [--users 1000] [--requests 100000]
+
+Every user holds one access token and reuses it for all their requests,
+with a few users making most of the requests. "before" is a full
+python-jose decode on every request. The "after" rows go through
+security.verify_token with caches of different sizes, starting cold.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.common import configure_environment, print_table
+
+DB_PATH = "bench_jwt_cache.db"
+
+
+def run(users: int, requests: int, cache_sizes: list[int]) -> None:
+    configure_environment(DB_PATH)
+
+    from jose import jwt
+
+    from storeapi import security
+
+    tokens = [
+        security.create_access_token(f"user{i}@example.net", user_id=i)
+        for i in range(users)
+    ]
+    weights = [1 / rank for rank in range(1, users + 1)]
+    stream = random.choices(tokens, weights, k=requests)
+
+    def per_request_us(verify) -> float:
+        start = time.perf_counter()
+        for token in stream:
+            verify(token)
+        return (time.perf_counter() - start) / requests * 1_000_000
+
+    before = per_request_us(
+        lambda token: jwt.decode(
+            token, key=security.SECRET_KEY, algorithms=[security.ALGORITHM]
+        )
+    )
+    rows = [["before (python-jose)", "-", f"{before:.1f}", "-", "1x"]]
+    cache = security.verified_token_cache
+    for size in cache_sizes:
+        asyncio.run(cache.clear())
+        cache.max_entries = size
+        before_stats = security.verified_token_cache_stats()
+        after = per_request_us(security.verify_token)
+        after_stats = security.verified_token_cache_stats()
+        hits = after_stats["hits"] - before_stats["hits"]
+        rows.append(
+            [
+                f"after, {size} entries",
+                f"{hits / requests:.1%}",
+                f"{after:.1f}",
+                after_stats["evictions"] - before_stats["evictions"],
+                f"{before / after:.0f}x",
+            ]
+        )
+
+    print(f"Per-request verification in µs, {users} tokens, {requests} requests")
+    print_table(["", "hit rate", "µs/request", "evictions", "speedup"], rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--requests", type=int, default=100_000)
+    parser.add_argument(
+        "--cache-sizes", type=int, nargs="+", default=[10_000, 500, 100]
+    )
+    args = parser.parse_args()
+    run(args.users, args.requests, args.cache_sizes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Cost of the post/comment/like lookups with and without their indexes.
+
+Usage: python -m benchmarks.bench_like_indexes [--posts 100000]
+
+Seeds posts, comments and likes, then times each lookup with the indexes on
+comments.post_id, posts.user_id and likes(post_id, user_id) dropped, and
+again after recreating them.
+"""
+import argparse
+import asyncio
+import random
+
+from benchmarks.common import configure_environment, measure, print_table, seed_rows
+
+DB_PATH = "bench_like_indexes.db"
+
+
+async def run(posts: int, users: int) -> None:
+    configure_environment(DB_PATH)
+
+    import sqlalchemy
+
+    from storeapi.database import (
+        comment_table,
+        database,
+        engine,
+        like_table,
+        post_table,
+        user_table,
+    )
+
+    seed_rows(
+        engine,
+        user_table,
+        [{"email": f"user{i}@example.net", "password": "x"} for i in range(users)],
+    )
+    seed_rows(
+        engine,
+        post_table,
+        [
+            {"body": f"Post {i}", "user_id": random.randint(1, users)}
+            for i in range(posts)
+        ],
+    )
+    seed_rows(
+        engine,
+        comment_table,
+        [
+            {
+                "body": f"Comment {i}",
+                "post_id": random.randint(1, posts),
+                "user_id": random.randint(1, users),
+            }
+            for i in range(posts * 2)
+        ],
+    )
+    pairs = {
+        (random.randint(1, posts), random.randint(1, users)) for _ in range(posts * 2)
+    }
+    seed_rows(
+        engine,
+        like_table,
+        [{"post_id": post_id, "user_id": user_id} for post_id, user_id in pairs],
+    )
+
+    post_id, user_id = next(iter(pairs))
+    queries = {
+        "comments on post": comment_table.select().where(
+            comment_table.c.post_id == post_id
+        ),
+        "posts by user": post_table.select().where(post_table.c.user_id == user_id),
+        "user liked post": like_table.select().where(
+            like_table.c.post_id == post_id, like_table.c.user_id == user_id
+        ),
+        "post with like join": sqlalchemy.select(
+            post_table, sqlalchemy.func.count(like_table.c.id)
+        )
+        .select_from(post_table.outerjoin(like_table))
+        .where(post_table.c.id == post_id)
+        .group_by(post_table.c.id),
+    }
+    indexes = [
+        index
+        for table in (post_table, comment_table, like_table)
+        for index in table.indexes
+        if index.name != "ix_posts_like_count"
+    ]
+
+    await database.connect()
+    results = {}
+    for phase in ("without indexes", "with indexes"):
+        for index in indexes:
+            if phase == "without indexes":
+                await database.execute(f"DROP INDEX IF EXISTS {index.name}")
+            else:
+                await database.execute(
+                    str(sqlalchemy.schema.CreateIndex(index).compile(engine))
+                )
+        for name, query in queries.items():
+            results.setdefault(name, []).append(
+                await measure(lambda: database.fetch_all(query))
+            )
+    await database.disconnect()
+
+    print(f"Median latency in ms, {posts} posts, {posts * 2} comments")
+    print_table(
+        ["query", "without indexes", "with indexes", "speedup"],
+        [
+            [name, f"{before:.3f}", f"{after:.3f}", f"{before / after:.0f}x"]
+            for name, (before, after) in results.items()
+        ],
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.posts, args.users))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Latency of unrelated reads while a burst of logins is being hashed.
+
+Usage: python -m benchmarks.bench_login_burst [--logins 50] [--readers 4]
+
+Drives the app in-process. While `--logins` concurrent POST /token requests
+verify their passwords, `--readers` clients keep calling GET /post and record
+their latencies. "inline" hashes on the event loop, as before the password
+hashing pool; "pool" uses security.password_hasher. The login rate limit is
+raised to fit both bursts, as they all log in to one account from one client
+and would otherwise mostly get 429s.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.common import configure_environment, print_table
+
+DB_PATH = "bench_login_burst.db"
+
+
+async def run(logins: int, readers: int) -> None:
+    configure_environment(DB_PATH)
+
+    from httpx import AsyncClient
+
+    from storeapi import security
+    from storeapi.config import config
+    from storeapi.database import database, user_table
+    from storeapi.main import app
+
+    config.LOGIN_RATE_LIMIT_EMAIL_ATTEMPTS = 2 * logins
+    config.LOGIN_RATE_LIMIT_IP_ATTEMPTS = 2 * logins
+
+    async def inline_run(fn, *args):
+        return fn(*args)
+
+    credentials = {"email": "user@example.net", "password": "1234"}
+    await database.connect()
+    await database.execute(
+        user_table.insert().values(
+            email=credentials["email"],
+            password=security.get_password_hash(credentials["password"]),
+            confirmed=True,
+        )
+    )
+
+    rows = []
+    pooled_run = security.password_hasher.run
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        for mode, hasher_run in (("inline", inline_run), ("pool", pooled_run)):
+            security.password_hasher.run = hasher_run
+            latencies = []
+            burst_done = asyncio.Event()
+
+            async def read():
+                while not burst_done.is_set():
+                    start = time.perf_counter()
+                    await client.get("/post")
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+            async def burst():
+                start = time.perf_counter()
+                responses = await asyncio.gather(
+                    *(client.post("/token", json=credentials) for _ in range(logins))
+                )
+                burst_done.set()
+                assert all(r.status_code == 200 for r in responses), [
+                    r.status_code for r in responses
+                ]
+                return time.perf_counter() - start
+
+            *_, burst_s = await asyncio.gather(
+                *(read() for _ in range(readers)), burst()
+            )
+            latencies.sort()
+            rows.append(
+                [
+                    mode,
+                    len(latencies),
+                    f"{statistics.median(latencies):.1f}",
+                    f"{latencies[int(len(latencies) * 0.99) - 1]:.1f}",
+                    f"{latencies[-1]:.1f}",
+                    f"{burst_s:.2f}",
+                ]
+            )
+    await database.disconnect()
+    security.password_hasher.shutdown()
+
+    print(f"GET /post latency in ms during {logins} concurrent logins")
+    print_table(["hashing", "reads", "p50", "p99", "max", "burst s"], rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(run(args.logins, args.readers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Page latency of GET /post as the posts table grows.
+
+Usage: python -m benchmarks.bench_post_pagination [--sizes 1000 10000 ...]
+
+For every size the table is grown in place and the first page and a page
+from the middle of the table are timed for each sorting mode. The old
+unbounded listing is timed as a baseline for sizes up to --baseline-max.
+"""
+import argparse
+import asyncio
+import random
+from collections import Counter
+
+from benchmarks.common import configure_environment, measure, print_table, seed_rows
+
+DB_PATH = "bench_pagination.db"
+
+
+async def run(sizes: list[int], limit: int, baseline_max: int) -> None:
+    configure_environment(DB_PATH)
+
+    from fastapi import Request, Response
+
+    from storeapi.cache import cache_backend
+    from storeapi.database import database, engine, like_table, post_table, user_table
+    from storeapi.pagination import encode_cursor
+    from storeapi.routers.post import (
+        PostSorting,
+        get_all_posts,
+        select_post_and_likes,
+    )
+
+    # No If-None-Match, and the cache is emptied, so every call runs the query.
+    request = Request({"type": "http", "method": "GET", "headers": []})
+
+    async def get_page(sorting, cursor):
+        await cache_backend.clear()
+        return await get_all_posts(request, Response(), sorting, limit, cursor)
+
+    seed_rows(engine, user_table, [{"email": "bench@example.net", "password": "x"}])
+    await database.connect()
+
+    rows = []
+    current = 0
+    for size in sorted(sizes):
+        new_ids = range(current + 1, size + 1)
+        # One like per post at most: likes are unique per (post_id, user_id).
+        likes = [
+            {"post_id": post_id, "user_id": 1}
+            for post_id in random.sample(new_ids, len(new_ids) // 4)
+        ]
+        like_counts = Counter(like["post_id"] for like in likes)
+        posts = [
+            {"body": f"Post {i}", "user_id": 1, "like_count": like_counts[i]}
+            for i in new_ids
+        ]
+        seed_rows(engine, post_table, posts)
+        seed_rows(engine, like_table, likes)
+        current = size
+
+        middle = size // 2
+        for sorting in PostSorting:
+            deep_cursor = encode_cursor(sorting=sorting.value, id=middle, likes=0)
+
+            first = await measure(lambda: get_page(sorting, None))
+            deep = await measure(lambda: get_page(sorting, deep_cursor))
+            rows.append([size, sorting.value, f"{first:.2f}", f"{deep:.2f}"])
+
+        if size <= baseline_max:
+            baseline = await measure(
+                lambda: database.fetch_all(
+                    select_post_and_likes.order_by(post_table.c.id.desc())
+                ),
+                repeat=3,
+            )
+            rows.append([size, "unbounded", f"{baseline:.2f}", "-"])
+
+    await database.disconnect()
+
+    print(f"Median latency in ms, limit={limit}")
+    print_table(["posts", "sorting", "first page", "middle page"], rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--baseline-max", type=int, default=100_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.limit, args.baseline_max))
+
+
+if __name__ == "__main__":
+    main()
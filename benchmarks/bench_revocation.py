@@ -0,0 +1,73 @@
+"""Cost of the per-request revocation check, Bloom filter versus table lookup.
+
+Usage: python -m benchmarks.bench_revocation [--revoked 10000] [--checks 20000]
+
+Seeds the revoked_tokens table with `--revoked` unexpired tokens, then checks
+`--checks` tokens that were not revoked, as almost all requests carry. "table"
+looks every token up in revoked_tokens; "bloom" goes through
+revocation.revocation_list, which only queries on a filter hit.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from benchmarks.common import configure_environment, print_table, seed_rows
+
+DB_PATH = "bench_revocation.db"
+
+
+async def run(revoked: int, checks: int) -> None:
+    configure_environment(DB_PATH)
+
+    import sqlalchemy
+
+    from storeapi.database import database, engine, revoked_token_table
+    from storeapi.revocation import revocation_list
+
+    expires_at = int(time.time()) + 3600
+    seed_rows(
+        engine,
+        revoked_token_table,
+        [{"jti": uuid.uuid4().hex, "expires_at": expires_at} for _ in range(revoked)],
+    )
+    tokens = [uuid.uuid4().hex for _ in range(checks)]
+    await database.connect()
+
+    async def table_lookup(jti: str) -> bool:
+        query = sqlalchemy.select(revoked_token_table.c.jti).where(
+            revoked_token_table.c.jti == jti
+        )
+        return await database.fetch_val(query) is not None
+
+    rows = []
+    for name, check in (("table", table_lookup), ("bloom", revocation_list.is_revoked)):
+        await check(tokens[0])  # load the filter
+        start = time.perf_counter()
+        for jti in tokens:
+            await check(jti)
+        per_check = (time.perf_counter() - start) / checks * 1_000_000
+        rows.append([name, f"{per_check:.1f}"])
+    await database.disconnect()
+
+    stats = revocation_list.stats()
+    rows[0].extend([checks, "-"])
+    rows[1].extend([stats["filter_hits"], stats["false_positives"]])
+    print(f"µs per check of a live token, {revoked} revoked tokens")
+    print_table(["check", "µs/check", "queries", "false positives"], rows)
+    print(
+        f"Bloom filter: {stats['filter_bits'] // 8} bytes, "
+        f"{stats['filter_hashes']} hashes"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--revoked", type=int, default=10_000)
+    parser.add_argument("--checks", type=int, default=20_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.revoked, args.checks))
+
+
+if __name__ == "__main__":
+    main()
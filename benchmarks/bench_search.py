@@ -0,0 +1,92 @@
+"""Full-text search through the FTS5 index against a LIKE '%term%' scan.
+
+Usage: python -m benchmarks.bench_search [--posts 1000000]
+
+Seeds posts whose words follow a Zipf-like distribution over a fixed
+vocabulary, so there are both common and rare terms, then times the first
+page of /search for each term against the same page found with LIKE.
+"""
+import argparse
+import asyncio
+import random
+
+from benchmarks.common import configure_environment, measure, print_table, seed_rows
+
+DB_PATH = "bench_search.db"
+PAGE_SIZE = 20
+
+
+def make_vocabulary(size: int) -> list[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < size:
+        words.add("".join(random.choices(letters, k=random.randint(4, 9))))
+    return sorted(words, key=lambda word: random.random())
+
+
+async def run(posts: int, users: int, vocabulary_size: int) -> None:
+    configure_environment(DB_PATH)
+
+    from storeapi.database import database, engine, post_table, user_table
+    from storeapi.routers.search import select_search_page
+
+    vocabulary = make_vocabulary(vocabulary_size)
+    weights = [1 / rank for rank in range(1, vocabulary_size + 1)]
+
+    seed_rows(
+        engine,
+        user_table,
+        [{"email": f"user{i}@example.net", "password": "x"} for i in range(users)],
+    )
+    seed_rows(
+        engine,
+        post_table,
+        [
+            {
+                "body": " ".join(
+                    random.choices(vocabulary, weights, k=random.randint(8, 20))
+                ),
+                "user_id": random.randint(1, users),
+            }
+            for _ in range(posts)
+        ],
+    )
+
+    rare = vocabulary[vocabulary_size // 2]
+    terms = {
+        "common word": vocabulary[0],
+        "rare word": rare,
+        "two words": f"{vocabulary[1]} {vocabulary[2]}",
+        "prefix": f"{rare[:3]}*",
+    }
+    columns = [*post_table.c, post_table.c.like_count.label("likes")]
+
+    await database.connect()
+    rows = []
+    for name, q in terms.items():
+        fts = select_search_page("posts_fts", columns, q, PAGE_SIZE, None)
+        like = post_table.select().limit(PAGE_SIZE + 1).order_by(post_table.c.id)
+        for word in q.split():
+            like = like.where(post_table.c.body.like(f"%{word.rstrip('*')}%"))
+        like_ms = await measure(lambda: database.fetch_all(like), repeat=5)
+        fts_ms = await measure(lambda: database.fetch_all(fts), repeat=5)
+        rows.append(
+            [name, q, f"{like_ms:.2f}", f"{fts_ms:.2f}", f"{like_ms / fts_ms:.0f}x"]
+        )
+    await database.disconnect()
+
+    print(f"Median latency in ms of a {PAGE_SIZE} post page, {posts} posts")
+    print_table(["query", "q", "LIKE", "FTS5", "speedup"], rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--posts", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--vocabulary", type=int, default=20_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.posts, args.users, args.vocabulary))
+
+
+if __name__ == "__main__":
+    main()
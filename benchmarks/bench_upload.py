@@ -0,0 +1,205 @@
+"""POST /upload, spooled to a temp file versus streamed to B2 in parts.
+
+Usage: python -m benchmarks.bench_upload [--files 4] [--size-mb 40] [--mbps 50]
+
+Uploads `--files` files of `--size-mb` at once through the app to a local
+stand-in for B2: an HTTP server on its own thread that takes `--latency-ms`
+plus the time to receive the body at `--mbps` MB/s per request. The b2sdk
+calls are replaced by plain HTTP posts to it, so the run needs no account.
+
+"temp file" is the handler as it was: the upload is written to a temporary
+file, then sent in one blocking call on the event loop. "streaming" is
+routers/upload.py, which sends B2_PART_SIZE parts from the b2_upload pool
+while the body arrives. "max stall ms" is the longest the event loop was
+blocked meanwhile, and "peak MB" the most memory Python allocated, the
+client's included. Streaming holds up to B2_UPLOAD_PARTS_IN_FLIGHT + 1
+parts per upload, however big the file.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.common import configure_environment, print_table
+
+DB_PATH = "bench_upload.db"
+SOURCE_PATH = "bench_upload.bin"
+
+
+def start_stand_in_storage(
+    latency_s: float, bytes_per_s: float
+) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+            time.sleep(latency_s + length / bytes_per_s)
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def use_stand_in_storage(url: str):
+    """Point the streaming handler's B2 calls at the stand-in, and return a
+    stand-in for b2_upload_file for the temp file handler."""
+    import httpx
+    import uploads
+
+    client = httpx.Client(timeout=60)
+
+    def post(path: str, data: bytes = b"") -> None:
+        client.post(f"{url}/{path}", content=data).raise_for_status()
+
+    def upload_local_file(local_file: str, file_name: str) -> str:
+        with open(local_file, "rb") as f:
+            post("b2_upload_file", f.read())
+        return f"{url}/file/{file_name}"
+
+    def upload_bytes(data: bytes, file_name: str) -> str:
+        post("b2_upload_file", data)
+        return f"{url}/file/{file_name}"
+
+    def start_large_file(file_name: str) -> str:
+        post("b2_start_large_file")
+        return uuid.uuid4().hex
+
+    def upload_part(file_id: str, part_number: int, data: bytes) -> str:
+        post("b2_upload_part", data)
+        return hashlib.sha1(data).hexdigest()
+
+    def finish_large_file(file_id: str, part_sha1s: list[str]) -> str:
+        post("b2_finish_large_file")
+        return f"{url}/file/{file_id}"
+
+    uploads.b2_upload_bytes = upload_bytes
+    uploads.b2_start_large_file = start_large_file
+    uploads.b2_upload_part = upload_part
+    uploads.b2_finish_large_file = finish_large_file
+    return upload_local_file
+
+
+def create_app(b2_upload_file):
+    import aiofiles
+    from fastapi import FastAPI, UploadFile
+
+    from storeapi.routers.upload import router
+
+    app = FastAPI()
+    app.include_router(router)
+
+    @app.post("/upload-tempfile", status_code=201)
+    async def upload_tempfile(file: UploadFile):
+        # routers/upload.py before streaming.
+        with tempfile.NamedTemporaryFile() as temp_file:
+            async with aiofiles.open(temp_file.name, "wb") as f:
+                while chunk := await file.read(1024 * 1024):
+                    await f.write(chunk)
+            file_url = b2_upload_file(temp_file.name, file.filename)
+        return {"file_url": file_url}
+
+    return app
+
+
+async def watch_loop(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """Longest delay, in ms, of a timer that should fire every `interval`."""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst * 1000
+
+
+async def run(
+    files: int, size_mb: float, latency_ms: float, mbps: float, part_mb: float
+) -> None:
+    configure_environment(DB_PATH)
+    from httpx import AsyncClient
+
+    from storeapi.config import config
+
+    config.B2_PART_SIZE = int(part_mb * 1024 * 1024)
+    server = start_stand_in_storage(latency_ms / 1000, mbps * 1024 * 1024)
+    b2_upload_file = use_stand_in_storage(
+        f"http://127.0.0.1:{server.server_address[1]}"
+    )
+    app = create_app(b2_upload_file)
+
+    size = int(size_mb * 1024 * 1024)
+    with open(SOURCE_PATH, "wb") as f:
+        f.write(os.urandom(size))
+
+    rows = []
+    async with AsyncClient(app=app, base_url="http://test", timeout=600) as client:
+
+        async def upload(path: str):
+            with open(SOURCE_PATH, "rb") as f:
+                response = await client.post(
+                    path, files={"file": ("bench.bin", f, "application/octet-stream")}
+                )
+            assert response.status_code == 201, response.text
+
+        async def upload_all(path: str) -> tuple[float, float]:
+            stop = asyncio.Event()
+            watcher = asyncio.create_task(watch_loop(stop))
+            start = time.perf_counter()
+            await asyncio.gather(*(upload(path) for _ in range(files)))
+            elapsed = time.perf_counter() - start
+            stop.set()
+            return elapsed, await watcher
+
+        for mode, path in (("temp file", "/upload-tempfile"), ("streaming", "/upload")):
+            elapsed, stall_ms = await upload_all(path)
+            # Again for the memory peak, as tracing slows everything down.
+            tracemalloc.start()
+            await upload_all(path)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            rows.append(
+                [
+                    mode,
+                    f"{elapsed:.2f}",
+                    f"{files * size_mb / elapsed:.1f}",
+                    f"{stall_ms:.0f}",
+                    f"{peak / 1024 / 1024:.0f}",
+                ]
+            )
+
+    server.shutdown()
+    os.remove(SOURCE_PATH)
+    print(
+        f"{files} uploads of {size_mb:g} MB at once, storage at {mbps:g} MB/s per"
+        f" request plus {latency_ms:g} ms, {part_mb:g} MB parts"
+    )
+    print_table(["handler", "seconds", "MB/s", "max stall ms", "peak MB"], rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--size-mb", type=float, default=40)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--mbps", type=float, default=50)
+    parser.add_argument("--part-mb", type=float, default=5)
+    args = parser.parse_args()
+    asyncio.run(
+        run(args.files, args.size_mb, args.latency_ms, args.mbps, args.part_mb)
+    )
+
+
+if __name__ == "__main__":
+    main()
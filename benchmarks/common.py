@@ -0,0 +1,101 @@
+"""Helpers shared by the benchmark scripts.
+
+Benchmarks run against a throwaway SQLite file instead of test.db so they can
+be seeded with millions of rows. `configure_environment` has to be called
+before anything is imported from storeapi, because the config and database
+modules read the environment at import time.
+"""
+import asyncio
+import json
+import os
+import statistics
+import time
+from typing import Awaitable, Callable
+
+
+def configure_environment(db_path: str) -> None:
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    os.environ["ENV_STATE"] = "test"
+    os.environ["TEST_DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["TEST_DB_FORCE_ROLL_BACK"] = "false"
+
+
+def seed_rows(engine, table, rows: list[dict], chunk_size: int = 50_000) -> None:
+    with engine.begin() as conn:
+        for start in range(0, len(rows), chunk_size):
+            conn.execute(table.insert(), rows[start : start + chunk_size])
+
+
+async def measure(fn: Callable[[], Awaitable], repeat: int = 20) -> float:
+    """Run `fn` `repeat` times and return the median latency in milliseconds."""
+    await fn()  # warm up caches and prepared statements
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+STUB_RESPONSE = json.dumps({"id": "<stub>", "message": "Queued. Thank you."}).encode()
+
+
+async def _handle_stub_connection(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    handshake_s: float,
+    response_s: float,
+) -> None:
+    await asyncio.sleep(handshake_s)
+    try:
+        while headers := await reader.readuntil(b"\r\n\r\n"):
+            length = 0
+            for line in headers.decode("latin-1").split("\r\n"):
+                name, _, value = line.partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            await asyncio.sleep(response_s)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                b"Content-Length: %d\r\n\r\n%s" % (len(STUB_RESPONSE), STUB_RESPONSE)
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_stub_mailgun(
+    handshake_s: float = 0, response_s: float = 0
+) -> asyncio.AbstractServer:
+    """Serve a stub of the Mailgun API on localhost and point the config at it.
+
+    The stub accepts any request. It delays the first response on every
+    connection by `handshake_s`, standing in for the TCP and TLS round trips
+    to the real API, and every response by `response_s`.
+    """
+    from storeapi.config import config
+
+    server = await asyncio.start_server(
+        lambda r, w: _handle_stub_connection(r, w, handshake_s, response_s),
+        "127.0.0.1",
+        0,
+    )
+    port = server.sockets[0].getsockname()[1]
+    config.MAILGUN_API_URL = f"http://127.0.0.1:{port}/v3"
+    config.MAILGUN_DOMAIN = "example.net"
+    config.MAILGUN_API_KEY = "stub-key"
+    return server
+
+
+def print_table(headers: list[str], rows: list[list]) -> None:
+    widths = [
+        max(len(str(value)) for value in [header, *(row[i] for row in rows)])
+        for i, header in enumerate(headers)
+    ]
+    print("  ".join(str(h).rjust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(v).rjust(w) for v, w in zip(row, widths)))
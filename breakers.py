@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency that is failing or saturated."""
+
+
+class CircuitBreaker:
+    """Guards calls to one outside dependency, such as an HTTP API.
+
+    At most `max_concurrency` calls run at a time (a bulkhead); others wait
+    for a slot. Each call, wait included, must finish within `deadline`
+    seconds, or it is cancelled with a TimeoutError. A call that found no
+    slot by then raises CircuitOpenError instead.
+
+    After `failure_threshold` failures in a row the circuit opens: calls
+    raise CircuitOpenError at once, without touching the dependency, for
+    `reset_timeout` seconds. Then it is half open and lets a single probe
+    call through. If that succeeds the circuit closes again, otherwise it
+    stays open for another `reset_timeout`.
+
+    Every exception counts as a failure, and a timeout too, unless
+    `is_failure` says otherwise; a rejected request, for instance, shows
+    that the dependency is up.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        deadline: float,
+        failure_threshold: int,
+        reset_timeout: float,
+        is_failure: Callable[[BaseException], bool] = lambda e: True,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.is_failure = is_failure
+        self.state = CLOSED
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self._probing = False
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.waiting = 0
+        self.running = 0
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.opened = 0
+        self._total_ms = 0.0
+        self.max_ms = 0.0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # One semaphore per event loop; tests run each in a loop of its own.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _admit(self) -> bool:
+        """Whether a call may go ahead; True for the half-open probe too."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() >= self._open_until:
+            logger.info(f"Circuit {self.name} half open, probing")
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def _open(self) -> None:
+        if self.state != OPEN:
+            logger.warning(
+                f"Circuit {self.name} open for {self.reset_timeout:g}s after"
+                f" {self._consecutive_failures} failures"
+            )
+            self.opened += 1
+        self.state = OPEN
+        self._open_until = time.monotonic() + self.reset_timeout
+
+    def _record_success(self) -> None:
+        self.successes += 1
+        self._consecutive_failures = 0
+        if self.state != CLOSED:
+            logger.info(f"Circuit {self.name} closed")
+            self.state = CLOSED
+
+    def _record_failure(self) -> None:
+        self.failures += 1
+        self._consecutive_failures += 1
+        if (
+            self.state == HALF_OPEN
+            or self._consecutive_failures >= self.failure_threshold
+        ):
+            self._open()
+
+    async def call(self, fn: Callable[..., Awaitable[Any]], *args) -> Any:
+        if not self._admit():
+            self.rejected += 1
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        probe = self.state == HALF_OPEN
+
+        semaphore = self._get_semaphore()
+        acquired = False
+        started = None
+        try:
+            async with asyncio.timeout(self.deadline):
+                self.waiting += 1
+                try:
+                    await semaphore.acquire()
+                    acquired = True
+                finally:
+                    self.waiting -= 1
+
+                started = time.perf_counter()
+                self.running += 1
+                self.calls += 1
+                result = await fn(*args)
+        except TimeoutError as e:
+            if not acquired:
+                self.rejected += 1
+                raise CircuitOpenError(
+                    f"No free {self.name} slot within {self.deadline:g}s"
+                ) from e
+            self.timeouts += 1
+            self._record_failure()
+            raise
+        except Exception as e:
+            if self.is_failure(e):
+                self._record_failure()
+            else:
+                self._record_success()
+            raise
+        else:
+            self._record_success()
+            return result
+        finally:
+            if probe:
+                self._probing = False
+            if acquired:
+                self.running -= 1
+                semaphore.release()
+            if started is not None:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self._total_ms += elapsed_ms
+                self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def reset(self) -> None:
+        """Close the circuit and forget the failures so far."""
+        self.state = CLOSED
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self._probing = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "max_concurrency": self.max_concurrency,
+            "waiting": self.waiting,
+            "running": self.running,
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "opened": self.opened,
+            "avg_ms": self._total_ms / self.calls if self.calls else 0,
+            "max_ms": self.max_ms,
+        }
@@ -0,0 +1,180 @@
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from storeapi.config import config
+from storeapi.metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+POSTS_NAMESPACE = "posts"
+NAMESPACE_VERSION_TTL = 24 * 60 * 60
+
+
+def post_namespace(post_id: int) -> str:
+    return f"post:{post_id}"
+
+
+class CacheBackend(ABC):
+    """Storage interface for the read-through cache.
+
+    A shared backend (for example one talking to Redis or memcached) only
+    needs these operations; invalidation is built on top of get/set.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store `value`. A `ttl` of None uses the backend's default TTL."""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None: ...
+
+    @abstractmethod
+    async def clear(self) -> None: ...
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """Backend counters such as size and evictions, merged into /metrics."""
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache whose entries also expire after a TTL."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self.get_nowait(key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.set_nowait(key, value, ttl)
+
+    # Being in-process, this backend can also be used from synchronous code.
+
+    def get_nowait(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set_nowait(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def create_cache_backend() -> CacheBackend:
+    backends = {"memory": MemoryCache}
+    backend = backends[config.CACHE_BACKEND]
+    logger.debug(f"Using {backend.__name__} for the read-through cache")
+    return backend(max_entries=config.CACHE_MAX_ENTRIES, ttl=config.CACHE_TTL_SECONDS)
+
+
+cache_backend = create_cache_backend()
+# Hits and misses are counted here rather than in the backend so that the
+# namespace version lookups below do not inflate the hit rate.
+_lookups = {"hits": 0, "misses": 0}
+
+
+def cache_stats() -> dict:
+    total = _lookups["hits"] + _lookups["misses"]
+    return {
+        **_lookups,
+        "hit_rate": _lookups["hits"] / total if total else 0.0,
+        **cache_backend.stats(),
+    }
+
+
+register_metrics("cache", cache_stats)
+
+
+async def get_or_load(key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+    """Return the cached value for `key`, calling `load` to fill it on a miss."""
+    value = await cache_backend.get(key)
+    if value is not None:
+        _lookups["hits"] += 1
+        return value
+
+    _lookups["misses"] += 1
+    value = await load()
+    await cache_backend.set(key, value)
+    return value
+
+
+# Invalidation works on namespaces rather than individual keys: every key is
+# built with the namespace's current version token, and invalidating replaces
+# the token so the old entries are never read again and age out of the LRU.
+# A token that was evicted or never set is simply regenerated, which is just
+# as safe as an explicit invalidation.
+
+
+def _version_key(namespace: str) -> str:
+    return f"version:{namespace}"
+
+
+async def _namespace_version(namespace: str) -> str:
+    version = await cache_backend.get(_version_key(namespace))
+    if version is None:
+        version = uuid.uuid4().hex
+        await cache_backend.set(
+            _version_key(namespace), version, ttl=NAMESPACE_VERSION_TTL
+        )
+    return version
+
+
+async def cache_key(namespace: str, *parts) -> str:
+    version = await _namespace_version(namespace)
+    return ":".join([namespace, version, *(str(part) for part in parts)])
+
+
+async def invalidate(*namespaces: str) -> None:
+    logger.debug(f"Invalidating cache namespaces {namespaces}")
+    for namespace in namespaces:
+        version = uuid.uuid4().hex
+        await cache_backend.set(
+            _version_key(namespace), version, ttl=NAMESPACE_VERSION_TTL
+        )
+
+
+async def invalidate_posts(post_ids: Iterable[int]) -> None:
+    """Drop cached listings and everything cached for the given posts."""
+    await invalidate(POSTS_NAMESPACE, *(post_namespace(id) for id in post_ids))
+
+
+async def invalidate_post(post_id: int) -> None:
+    await invalidate_posts([post_id])
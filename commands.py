@@ -0,0 +1,491 @@
+"""Maintenance commands for the storeapi database.
+
+Run from the project root, with ENV_STATE set as for the app:
+
+    python -m commands remove-duplicate-likes
+    python -m commands upgrade-schema
+    python -m commands repair-like-counts
+    python -m commands repair-comment-counts
+    python -m commands rebuild-search-index
+    python -m commands calibrate-password-hashing --target-ms 100
+    python -m commands revoke-token <access token>
+    python -m commands revoke-user-tokens <email>
+    python -m commands import-users users.csv --confirmation-base-url https://...
+
+On a database created before likes were unique, remove the duplicate likes
+first or the unique index cannot be created.
+"""
+import argparse
+import asyncio
+import csv
+import functools
+import itertools
+import json
+import logging
+import math
+import os
+import statistics
+import time
+from typing import Callable, Iterable, Iterator, Optional
+
+import sqlalchemy
+from passlib.registry import get_crypt_handler
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateColumn
+
+from storeapi.database import (
+    SEARCH_INDEXES,
+    comment_table,
+    database,
+    engine,
+    like_table,
+    metadata,
+    post_table,
+    user_table,
+)
+from storeapi.executors import BoundedExecutor
+from storeapi.jobs import job_queue
+from storeapi.models.user import UserIn
+from storeapi.security import (
+    create_confirmation_token,
+    decode_token,
+    get_password_hash,
+    get_user,
+    revoke_token,
+    revoke_user_tokens,
+)
+from storeapi.tasks import close_http_client, open_http_client
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade_schema() -> list[str]:
+    """Bring an existing database up to the current table definitions.
+
+    `metadata.create_all` only creates missing tables, so columns and indexes
+    added to existing tables are applied here. Search indexes created by
+    `create_all` start out empty, so any index that does not cover every row
+    of its table is rebuilt. Returns the changes made.
+    """
+    metadata.create_all(engine)
+    changes = []
+    inspector = sqlalchemy.inspect(engine)
+    with engine.begin() as conn:
+        for index, table in SEARCH_INDEXES.items():
+            # FTS5 keeps one row per indexed document in its docsize table.
+            indexed = conn.scalar(
+                sqlalchemy.text(f"SELECT count(*) FROM {index}_docsize")
+            )
+            rows = conn.scalar(
+                sqlalchemy.select(sqlalchemy.func.count()).select_from(table)
+            )
+            if indexed != rows:
+                conn.execute(_rebuild_search_index(index))
+                changes.append(f"rebuilt search index {index}")
+
+        for table in metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                conn.execute(
+                    sqlalchemy.text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+                )
+                changes.append(f"added column {table.name}.{column.name}")
+
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+                    changes.append(f"created index {index.name}")
+    return changes
+
+
+async def remove_duplicate_likes() -> int:
+    """Delete all but the first like of each (post_id, user_id) pair.
+
+    Returns the number of likes removed.
+    """
+    first_likes = sqlalchemy.select(sqlalchemy.func.min(like_table.c.id)).group_by(
+        like_table.c.post_id, like_table.c.user_id
+    )
+    duplicate = like_table.c.id.not_in(first_likes)
+
+    async with database.transaction():
+        count = await database.fetch_val(
+            sqlalchemy.select(sqlalchemy.func.count()).where(duplicate)
+        )
+        if count:
+            await database.execute(like_table.delete().where(duplicate))
+
+    logger.info(f"Removed {count} duplicate likes")
+    return count
+
+
+async def _repair_post_counts(column: sqlalchemy.Column, table: sqlalchemy.Table):
+    actual = (
+        sqlalchemy.select(sqlalchemy.func.count(table.c.id))
+        .where(table.c.post_id == post_table.c.id)
+        .scalar_subquery()
+    )
+    drifted = column != actual
+
+    async with database.transaction():
+        count = await database.fetch_val(
+            sqlalchemy.select(sqlalchemy.func.count()).where(drifted)
+        )
+        if count:
+            await database.execute(
+                post_table.update().where(drifted).values({column.name: actual})
+            )
+
+    logger.info(f"Repaired {column.name} on {count} posts")
+    return count
+
+
+async def repair_like_counts() -> int:
+    """Recompute posts.like_count from the likes table.
+
+    Returns the number of posts whose stored count had drifted.
+    """
+    return await _repair_post_counts(post_table.c.like_count, like_table)
+
+
+async def repair_comment_counts() -> int:
+    """Recompute posts.comment_count from the comments table.
+
+    Returns the number of posts whose stored count had drifted.
+    """
+    return await _repair_post_counts(post_table.c.comment_count, comment_table)
+
+
+def _rebuild_search_index(index: str) -> sqlalchemy.TextClause:
+    return sqlalchemy.text(f"INSERT INTO {index}({index}) VALUES ('rebuild')")
+
+
+async def rebuild_search_index() -> int:
+    """Rebuild the full-text search indexes from the posts and comments tables.
+
+    The triggers keep the indexes in step, so this is only needed after
+    writes that bypassed them. Returns the number of rows indexed.
+    """
+    count = 0
+    async with database.transaction():
+        for index, table in SEARCH_INDEXES.items():
+            await database.execute(_rebuild_search_index(index))
+            count += await database.fetch_val(
+                sqlalchemy.select(sqlalchemy.func.count()).select_from(table)
+            )
+
+    logger.info(f"Rebuilt search indexes over {count} rows")
+    return count
+
+
+def _time_hash(handler, rounds: int, samples: int = 3) -> float:
+    """Median milliseconds to hash a password with `rounds`."""
+    hasher = handler.using(rounds=rounds)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        hasher.hash("calibration password")
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate_password_hashing(schemes: list[str], target_ms: float) -> list[dict]:
+    """Find the rounds for each passlib scheme that take about `target_ms` to
+    hash a password on this machine.
+
+    Rounds are extrapolated from a timing at the scheme's default rounds,
+    linearly or in powers of two depending on the scheme, then timed again.
+    Schemes that cannot be used here are reported with an error instead.
+    """
+    results = []
+    for scheme in schemes:
+        try:
+            handler = get_crypt_handler(scheme)
+            rounds = handler.default_rounds
+            elapsed = _time_hash(handler, rounds)
+            if handler.rounds_cost == "log2":
+                rounds += math.floor(math.log2(target_ms / elapsed))
+            else:
+                rounds = int(rounds * target_ms / elapsed)
+            rounds = max(handler.min_rounds, min(rounds, handler.max_rounds or rounds))
+            results.append(
+                {"scheme": scheme, "rounds": rounds, "ms": _time_hash(handler, rounds)}
+            )
+        except Exception as e:
+            logger.debug(f"Could not calibrate {scheme}", exc_info=True)
+            results.append({"scheme": scheme, "error": str(e) or type(e).__name__})
+    return results
+
+
+async def revoke_access_token(token: str) -> str:
+    """Revoke one access token, for example one that leaked, until it expires."""
+    try:
+        claims = decode_token(token, "access")
+    except HTTPException as e:
+        return f"not revoked: {e.detail}"
+    if not await revoke_token(claims):
+        return "not revoked: token has no 'jti' claim, use revoke-user-tokens"
+    return f"revoked token {claims['jti']} of {claims['sub']}"
+
+
+async def revoke_all_user_tokens(email: str) -> str:
+    """Revoke every access token issued to the user so far."""
+    user = await get_user(email)
+    if user is None:
+        return f"no user {email}"
+    await revoke_user_tokens(user.id, user.email)
+    return f"revoked all tokens of {email}"
+
+
+def read_users(path: str) -> Iterator[dict]:
+    """Stream the rows of a CSV file with a header line, or of a JSON Lines
+    file (.jsonl or .ndjson), without loading the whole file."""
+    with open(path, newline="") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def _hash_passwords(passwords: list[str]) -> list[str]:
+    # Runs in a worker process of import_users; one call per chunk keeps the
+    # pickling overhead per password small.
+    return [get_password_hash(password) for password in passwords]
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+async def _import_batch(
+    rows: list[dict],
+    hasher: BoundedExecutor,
+    counts: dict,
+    confirmation_base_url: Optional[str],
+) -> None:
+    users = {}
+    for row in rows:
+        try:
+            user = UserIn(**row)
+        except (ValidationError, TypeError):
+            counts["invalid"] += 1
+            continue
+        if user.email in users:
+            counts["existing"] += 1
+        else:
+            users[user.email] = user.password
+
+    # Skip users that already exist before spending any time hashing.
+    existing = await database.fetch_all(
+        sqlalchemy.select(user_table.c.email).where(user_table.c.email.in_(users))
+    )
+    for row in existing:
+        del users[row.email]
+    counts["existing"] += len(existing)
+    if not users:
+        return
+
+    # One chunk per worker, so every process hashes its share of the batch.
+    emails = list(users)
+    chunk_size = math.ceil(len(emails) / hasher.max_workers)
+    hashed = await asyncio.gather(
+        *(
+            hasher.run(_hash_passwords, [users[email] for email in chunk])
+            for chunk in _chunks(emails, chunk_size)
+        )
+    )
+    values = [
+        {"email": email, "password": password, "confirmed": False}
+        for email, password in zip(emails, itertools.chain.from_iterable(hashed))
+    ]
+    # Users registered since the check above are skipped by the constraint.
+    query = (
+        sqlite.insert(user_table)
+        .values(values)
+        .on_conflict_do_nothing(index_elements=["email"])
+        .returning(user_table.c.email)
+    )
+    # The registration emails are jobs stored with the users, so that none is
+    # lost and a failed send is retried, as for /register.
+    async with database.transaction():
+        imported = [row.email for row in await database.fetch_all(query)]
+        if confirmation_base_url is not None:
+            base_url = confirmation_base_url.rstrip("/")
+            for email in imported:
+                token = create_confirmation_token(email)
+                await job_queue.store(
+                    "send_user_registration_email",
+                    email=email,
+                    confirmation_url=f"{base_url}/confirm/{token}",
+                )
+            counts["emails_queued"] += len(imported)
+    counts["imported"] += len(imported)
+    counts["existing"] += len(values) - len(imported)
+
+
+async def import_users(
+    path: str,
+    batch_size: int = 500,
+    workers: Optional[int] = None,
+    confirmation_base_url: Optional[str] = None,
+    progress: Callable[[dict], None] = lambda counts: None,
+) -> dict:
+    """Create unconfirmed users from a CSV or JSON Lines file with "email" and
+    "password" fields, as /register would.
+
+    Passwords are hashed across `workers` processes (one per CPU by default)
+    and each batch is written with a single INSERT. Emails that already
+    exist, in the database or earlier in the file, are skipped, as are rows
+    without an email or password. With `confirmation_base_url`, each batch
+    also queues the registration email jobs, with a link under that URL, and
+    the queued jobs are run once the file is imported; sent together, the
+    emails go out in tasks.email_dispatcher batches. Emails that fail stay
+    queued for the job workers to retry. `progress` is called after every
+    batch with the counts so far; they are also returned.
+    """
+    hasher = BoundedExecutor(
+        "user_import", kind="process", max_workers=workers or os.cpu_count() or 1
+    )
+    counts = {
+        "read": 0,
+        "imported": 0,
+        "existing": 0,
+        "invalid": 0,
+        "emails_queued": 0,
+    }
+    start = time.perf_counter()
+    try:
+        for rows in _chunks(read_users(path), batch_size):
+            counts["read"] += len(rows)
+            await _import_batch(rows, hasher, counts, confirmation_base_url)
+            counts["users_per_second"] = counts["read"] / (
+                time.perf_counter() - start
+            )
+            progress(counts)
+    finally:
+        hasher.shutdown()
+
+    if counts["emails_queued"]:
+        await job_queue.run_due("send_user_registration_email")
+
+    logger.info(f"Imported {counts['imported']} of {counts['read']} users")
+    return counts
+
+
+def _print_import_progress(counts: dict) -> None:
+    print(
+        f"{counts['read']} read, {counts['imported']} imported, "
+        f"{counts['existing']} existing, {counts['invalid']} invalid, "
+        f"{counts['emails_queued']} emails queued, "
+        f"{counts['users_per_second']:.0f} users/s",
+        flush=True,
+    )
+
+
+async def _run_async(command) -> None:
+    await database.connect()
+    await open_http_client()
+    try:
+        print(await command())
+    finally:
+        await close_http_client()
+        await database.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="storeapi maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser(
+        "remove-duplicate-likes", help="keep one like per user and post"
+    )
+    subparsers.add_parser(
+        "upgrade-schema", help="add missing columns and indexes to existing tables"
+    )
+    subparsers.add_parser(
+        "repair-like-counts", help="recompute posts.like_count from likes"
+    )
+    subparsers.add_parser(
+        "repair-comment-counts", help="recompute posts.comment_count from comments"
+    )
+    subparsers.add_parser(
+        "rebuild-search-index", help="reindex posts and comments for /search"
+    )
+    calibrate = subparsers.add_parser(
+        "calibrate-password-hashing",
+        help="suggest password hashing rounds for a target latency",
+    )
+    calibrate.add_argument("--target-ms", type=float, default=100.0)
+    calibrate.add_argument(
+        "--schemes", nargs="+", default=["pbkdf2_sha256", "pbkdf2_sha512", "bcrypt"]
+    )
+    revoke = subparsers.add_parser(
+        "revoke-token", help="revoke one access token until it expires"
+    )
+    revoke.add_argument("token")
+    revoke_user = subparsers.add_parser(
+        "revoke-user-tokens", help="revoke every access token of a user"
+    )
+    revoke_user.add_argument("email")
+    import_parser = subparsers.add_parser(
+        "import-users", help="create users from a CSV or JSON Lines file"
+    )
+    import_parser.add_argument("path")
+    import_parser.add_argument("--batch-size", type=int, default=500)
+    import_parser.add_argument("--workers", type=int, help="default: one per CPU")
+    import_parser.add_argument(
+        "--confirmation-base-url",
+        help="send the registration email, linking to this URL's /confirm",
+    )
+    args = parser.parse_args()
+
+    if args.command == "upgrade-schema":
+        for change in upgrade_schema():
+            print(change)
+    elif args.command == "remove-duplicate-likes":
+        asyncio.run(_run_async(remove_duplicate_likes))
+    elif args.command == "repair-like-counts":
+        asyncio.run(_run_async(repair_like_counts))
+    elif args.command == "repair-comment-counts":
+        asyncio.run(_run_async(repair_comment_counts))
+    elif args.command == "rebuild-search-index":
+        asyncio.run(_run_async(rebuild_search_index))
+    elif args.command == "revoke-token":
+        asyncio.run(_run_async(functools.partial(revoke_access_token, args.token)))
+    elif args.command == "revoke-user-tokens":
+        asyncio.run(_run_async(functools.partial(revoke_all_user_tokens, args.email)))
+    elif args.command == "import-users":
+        command = functools.partial(
+            import_users,
+            args.path,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            confirmation_base_url=args.confirmation_base_url,
+            progress=_print_import_progress,
+        )
+        asyncio.run(_run_async(command))
+    elif args.command == "calibrate-password-hashing":
+        results = calibrate_password_hashing(args.schemes, args.target_ms)
+        for result in results:
+            if "error" in result:
+                print(f"{result['scheme']}: unavailable ({result['error']})")
+            else:
+                print(
+                    f"{result['scheme']}: {result['rounds']} rounds, "
+                    f"{result['ms']:.1f} ms per hash"
+                )
+        rounds = {r["scheme"]: r["rounds"] for r in results if "error" not in r}
+        print(f"PASSWORD_HASH_ROUNDS='{json.dumps(rounds)}'")
+
+
+if __name__ == "__main__":
+    main()
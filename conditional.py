@@ -0,0 +1,48 @@
+import hashlib
+import logging
+from typing import Optional
+
+from fastapi import Request, Response
+from storeapi.config import config
+
+logger = logging.getLogger(__name__)
+
+# Clients may keep a copy but must revalidate it, which is cheap with ETags.
+DEFAULT_CACHE_CONTROL = "no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Build a strong ETag from everything the representation depends on."""
+    digest = hashlib.sha256(":".join(str(part) for part in parts).encode())
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def cache_control_for(route_name: str) -> str:
+    return config.CACHE_CONTROL.get(route_name, DEFAULT_CACHE_CONTROL)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored.
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def conditional_response(
+    request: Request, response: Response, route_name: str, etag: str
+) -> Optional[Response]:
+    """Return a 304 response if the client already has `etag`.
+
+    Otherwise set the validators on `response` and return None so the route
+    goes on to build the body.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control_for(route_name)}
+    if etag_matches(request, etag):
+        logger.debug(f"{route_name} not modified, ETag {etag}")
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return None
@@ -24,6 +24,106 @@ class GlobalConfig(BaseConfig):
     B2_APPLICATION_KEY: Optional[str] = None
     B2_BUCKET_NAME: Optional[str] = None
     DEEPAI_API_KEY: Optional[str] = None
+    # POST /upload streams files to B2 in parts of B2_PART_SIZE bytes (B2's
+    # minimum is 5 MB), up to B2_UPLOAD_PARTS_IN_FLIGHT at a time per upload,
+    # which bounds an upload's memory. B2_UPLOAD_WORKERS threads run the
+    # blocking B2 calls of all uploads.
+    B2_PART_SIZE: int = 5 * 1024 * 1024
+    B2_UPLOAD_PARTS_IN_FLIGHT: int = 4
+    B2_UPLOAD_WORKERS: int = 8
+    # Overridable to point outbound calls at a local stand-in server.
+    MAILGUN_API_URL: str = "https://api.mailgun.net/v3"
+    DEEPAI_API_URL: str = "https://api.deepai.org/api"
+    # tasks.http_client, the connection pool shared by all outbound calls.
+    # Idle connections are kept open for reuse for the keep-alive expiry.
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    HTTP_TIMEOUT_SECONDS: float = 5.0
+    # tasks.deepai_breaker and tasks.mailgun_breaker: at most
+    # *_MAX_CONCURRENCY calls to each API at a time, each given *_DEADLINE
+    # seconds including the wait for a slot. After CIRCUIT_FAILURE_THRESHOLD
+    # failures in a row, calls fail fast for CIRCUIT_RESET_SECONDS before a
+    # probe call is let through.
+    DEEPAI_MAX_CONCURRENCY: int = 4
+    DEEPAI_DEADLINE_SECONDS: float = 30.0
+    MAILGUN_MAX_CONCURRENCY: int = 10
+    MAILGUN_DEADLINE_SECONDS: float = 10.0
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RESET_SECONDS: float = 30.0
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    CACHE_BACKEND: str = "memory"
+    CACHE_MAX_ENTRIES: int = 10_000
+    CACHE_TTL_SECONDS: float = 60.0
+    # Cache-Control header per route name, e.g. {"get_all_posts": "max-age=5"}.
+    # Routes not listed use conditional.DEFAULT_CACHE_CONTROL.
+    CACHE_CONTROL: dict[str, str] = {}
+    # Write-behind mode for POST /like: likes are acknowledged with 202 and
+    # stored in batches by likes.like_buffer.
+    LIKE_BUFFER_ENABLED: bool = False
+    LIKE_BUFFER_MAX_SIZE: int = 500
+    LIKE_BUFFER_FLUSH_SECONDS: float = 1.0
+    # security.user_cache, used by get_current_user. Unknown emails are kept
+    # for the shorter negative TTL.
+    USER_CACHE_MAX_ENTRIES: int = 10_000
+    USER_CACHE_TTL_SECONDS: float = 60.0
+    USER_CACHE_NEGATIVE_TTL_SECONDS: float = 5.0
+    # How long a revoked access token can still pass the claims-only check
+    # in processes other than the one that revoked it.
+    TOKEN_VERSION_CACHE_TTL_SECONDS: float = 30.0
+    # Verified access and confirmation tokens kept by security.verify_token.
+    VERIFIED_TOKEN_CACHE_MAX_ENTRIES: int = 10_000
+    # revocation.revocation_list: the Bloom filter is sized for this many
+    # revoked, unexpired tokens at this false positive rate, and rebuilt from
+    # the revoked_tokens table this often, which is also how long a token
+    # revoked in another process can still be used here.
+    REVOCATION_FILTER_CAPACITY: int = 10_000
+    REVOCATION_FILTER_ERROR_RATE: float = 0.001
+    REVOCATION_REFRESH_SECONDS: float = 10.0
+    # security.password_hasher: "thread" or "process" pool, and the number of
+    # hashes computed at once. Further logins wait their turn.
+    PASSWORD_HASH_EXECUTOR: str = "thread"
+    PASSWORD_HASH_WORKERS: int = 4
+    # passlib schemes; the first hashes new passwords. Rounds per scheme, e.g.
+    # {"pbkdf2_sha256": 600000}, as suggested by
+    # `python -m commands calibrate-password-hashing`. Unlisted schemes use
+    # passlib's defaults.
+    PASSWORD_HASH_SCHEMES: list[str] = ["pbkdf2_sha256"]
+    PASSWORD_HASH_ROUNDS: dict[str, int] = {}
+    # Token buckets for /token and /token-form, per email and per client IP:
+    # each allows that many attempts per LOGIN_RATE_LIMIT_PERIOD seconds.
+    RATE_LIMIT_BACKEND: str = "memory"
+    RATE_LIMIT_MAX_KEYS: int = 100_000
+    LOGIN_RATE_LIMIT_PERIOD: float = 60.0
+    LOGIN_RATE_LIMIT_EMAIL_ATTEMPTS: int = 5
+    LOGIN_RATE_LIMIT_IP_ATTEMPTS: int = 20
+    # tasks.email_dispatcher: emails with the same subject and template sent
+    # within the window go out as one Mailgun batch of up to EMAIL_BATCH_SIZE
+    # recipients (Mailgun's limit is 1000). Senders wait while
+    # EMAIL_MAX_PENDING emails are waiting for delivery.
+    EMAIL_BATCH_SIZE: int = 1000
+    EMAIL_BATCH_WINDOW_SECONDS: float = 0.1
+    EMAIL_MAX_PENDING: int = 5000
+    # jobs.job_queue. With JOB_WORKERS_ENABLED the app runs the workers
+    # itself; without, it only queues jobs for `python -m jobs`. Each job
+    # type runs at most its concurrency at a time, and a job running longer
+    # than its visibility timeout is cancelled and retried. Failed jobs are
+    # retried with exponential backoff, up to JOB_MAX_ATTEMPTS runs in all.
+    JOB_WORKERS_ENABLED: bool = True
+    JOB_POLL_SECONDS: float = 1.0
+    IMAGE_JOB_CONCURRENCY: int = 2
+    IMAGE_JOB_VISIBILITY_TIMEOUT_SECONDS: float = 120.0
+    # High enough that queued emails can fill tasks.email_dispatcher batches.
+    EMAIL_JOB_CONCURRENCY: int = 200
+    EMAIL_JOB_VISIBILITY_TIMEOUT_SECONDS: float = 30.0
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BASE_SECONDS: float = 2.0
+    JOB_RETRY_MAX_SECONDS: float = 300.0
+    JOB_SHUTDOWN_GRACE_SECONDS: float = 10.0
+    # images.image_cache: a prompt generated within the TTL reuses its image.
+    IMAGE_CACHE_TTL_SECONDS: float = 7 * 24 * 3600.0
+    # Posts read per query by GET /post/export.
+    EXPORT_CHUNK_SIZE: int = 500
 
 
 class DevConfig(GlobalConfig):
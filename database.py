@@ -10,8 +10,28 @@ post_table = sqlalchemy.Table(
     metadata,
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
     sqlalchemy.Column("body", sqlalchemy.String),
-    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
-    sqlalchemy.Column("image_url", sqlalchemy.String)
+    sqlalchemy.Column(
+        "user_id", sqlalchemy.ForeignKey("users.id"), nullable=False, index=True
+    ),
+    sqlalchemy.Column("image_url", sqlalchemy.String),
+    # Denormalized COUNT of likes, kept in step by like_post. Indexed so that
+    # sorting by likes is an index scan (the index implicitly ends in id).
+    sqlalchemy.Column(
+        "like_count",
+        sqlalchemy.Integer,
+        nullable=False,
+        server_default="0",
+        index=True,
+    ),
+    # Denormalized COUNT of comments, kept in step by create_comment.
+    sqlalchemy.Column(
+        "comment_count", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
+    # Bumped on every write that changes how the post is rendered; see
+    # versions.py. Used to build ETags without reading the post itself.
+    sqlalchemy.Column(
+        "version", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
 )
 
 user_table = sqlalchemy.Table(
@@ -20,7 +40,12 @@ user_table = sqlalchemy.Table(
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
     sqlalchemy.Column("email", sqlalchemy.String, unique=True),
     sqlalchemy.Column("password", sqlalchemy.String),
-    sqlalchemy.Column("confirmed", sqlalchemy.Boolean, default=False)
+    sqlalchemy.Column("confirmed", sqlalchemy.Boolean, default=False),
+    # Copied into access tokens as the "ver" claim; bumping it revokes every
+    # token issued before. See security.revoke_user_tokens.
+    sqlalchemy.Column(
+        "token_version", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
 )
 
 
@@ -29,7 +54,9 @@ comment_table = sqlalchemy.Table(
     metadata,
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
     sqlalchemy.Column("body", sqlalchemy.String),
-    sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("posts.id"), nullable=False),
+    sqlalchemy.Column(
+        "post_id", sqlalchemy.ForeignKey("posts.id"), nullable=False, index=True
+    ),
     sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False)
 )
 
@@ -38,9 +65,96 @@ like_table = sqlalchemy.Table(
     metadata,
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
     sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("posts.id"), nullable=False),
-    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False)
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
+    # One like per user per post. Also serves lookups by post_id alone.
+    sqlalchemy.Index("ix_likes_post_id_user_id", "post_id", "user_id", unique=True),
+)
+
+# Access tokens revoked before their expiry, by their "jti" claim. Rows are
+# deleted once the token has expired; see revocation.py.
+revoked_token_table = sqlalchemy.Table(
+    "revoked_tokens",
+    metadata,
+    sqlalchemy.Column("jti", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("expires_at", sqlalchemy.Integer, nullable=False, index=True),
+)
+
+# Work queued by jobs.job_queue. While a job runs, run_at is when its claim
+# lapses, after which any worker may claim it again.
+job_table = sqlalchemy.Table(
+    "jobs",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("type", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("payload", sqlalchemy.String, nullable=False),
+    # "queued", "running", or "failed" once out of attempts. Done jobs are
+    # deleted.
+    sqlalchemy.Column(
+        "status", sqlalchemy.String, nullable=False, server_default="queued"
+    ),
+    sqlalchemy.Column(
+        "attempts", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
+    sqlalchemy.Column("run_at", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Column("last_error", sqlalchemy.String),
+    sqlalchemy.Index("ix_jobs_type_status_run_at", "type", "status", "run_at"),
 )
 
+# Generated images by prompt, so a prompt seen before costs no DeepAI call.
+# Keyed by a hash of the normalized prompt; see images.py.
+generated_image_table = sqlalchemy.Table(
+    "generated_images",
+    metadata,
+    sqlalchemy.Column("prompt_hash", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("prompt", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("output_url", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+)
+
+# Named counters bumped on writes, e.g. "posts" for anything shown in listings.
+version_table = sqlalchemy.Table(
+    "versions",
+    metadata,
+    sqlalchemy.Column("name", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("value", sqlalchemy.Integer, nullable=False),
+)
+
+# Full-text search over post and comment bodies. These are external content
+# FTS5 tables: the text is stored only in posts/comments, and the triggers
+# keep the index in step with every insert, delete and update of the body,
+# whichever code path makes it. The other columns (image_url, counts) are
+# read from the content table when searching, so updating them needs no
+# reindexing. The prefix option indexes 2 and 3 character prefixes so that
+# short prefix queries do not have to scan the whole term list.
+SEARCH_INDEXES = {"posts_fts": post_table, "comments_fts": comment_table}
+
+
+def _search_index_ddl(index: str, table: sqlalchemy.Table) -> list[str]:
+    delete_old = (
+        f"INSERT INTO {index}({index}, rowid, body) "
+        "VALUES ('delete', old.id, old.body);"
+    )
+    insert_new = f"INSERT INTO {index}(rowid, body) VALUES (new.id, new.body);"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5(body, "
+        f"content='{table.name}', content_rowid='id', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {index}_insert AFTER INSERT ON {table.name} "
+        f"BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {index}_delete AFTER DELETE ON {table.name} "
+        f"BEGIN {delete_old} END",
+        f"CREATE TRIGGER IF NOT EXISTS {index}_update "
+        f"AFTER UPDATE OF body ON {table.name} BEGIN {delete_old} {insert_new} END",
+    ]
+
+
+for index, table in SEARCH_INDEXES.items():
+    for statement in _search_index_ddl(index, table):
+        sqlalchemy.event.listen(metadata, "after_create", sqlalchemy.DDL(statement))
+    sqlalchemy.event.listen(
+        metadata, "before_drop", sqlalchemy.DDL(f"DROP TABLE IF EXISTS {index}")
+    )
+
 engine = sqlalchemy.create_engine(
     config.DATABASE_URL, connect_args={"check_same_thread": False}
 )
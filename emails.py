@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+SendBatch = Callable[[str, str, dict[str, dict]], Awaitable]
+
+
+class EmailDispatcher:
+    """Coalesces outgoing emails into batch requests.
+
+    Emails with the same subject and template sent within `window` seconds
+    of the first go out together, up to `batch_size` recipients, through
+    `send_batch(subject, template, {recipient: variables})`. `send` returns
+    once its batch was accepted and raises the batch's error otherwise. When
+    a batch of several is rejected with a 4xx status, its emails are sent
+    again one by one, so a bad address only fails its own send.
+
+    At most `max_pending` emails wait for delivery at a time; further senders
+    wait for room.
+    """
+
+    def __init__(
+        self, send_batch: SendBatch, batch_size: int, window: float, max_pending: int
+    ):
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.window = window
+        self.max_pending = max_pending
+        self._batches: dict[tuple[str, str], dict[str, tuple]] = {}
+        self._timers: dict[tuple[str, str], asyncio.Task] = {}
+        self._deliveries: set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.pending = 0
+        self.batches = 0
+        self.sent = 0
+        self.failed = 0
+        self.split_batches = 0
+        self._total_batch_ms = 0.0
+        self.max_batch_ms = 0.0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # One semaphore per event loop; tests run each in a loop of its own.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+        return self._semaphore
+
+    async def send(
+        self, to: str, subject: str, template: str, variables: dict
+    ) -> None:
+        async with self._get_semaphore():
+            self.pending += 1
+            try:
+                key = (subject, template)
+                if to in self._batches.get(key, {}):
+                    # One message per recipient and batch.
+                    self._start_delivery(key)
+
+                future = asyncio.get_running_loop().create_future()
+                batch = self._batches.setdefault(key, {})
+                batch[to] = (variables, future)
+                if len(batch) >= self.batch_size:
+                    self._start_delivery(key)
+                elif len(batch) == 1:
+                    self._timers[key] = asyncio.create_task(self._deliver_later(key))
+                await future
+            finally:
+                self.pending -= 1
+
+    async def _deliver_later(self, key: tuple[str, str]) -> None:
+        await asyncio.sleep(self.window)
+        self._timers.pop(key, None)
+        if key in self._batches:
+            self._start_delivery(key)
+
+    def _start_delivery(self, key: tuple[str, str]) -> None:
+        batch = self._batches.pop(key)
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        task = asyncio.create_task(self._deliver(key, batch))
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, key: tuple[str, str], batch: dict[str, tuple]) -> None:
+        subject, template = key
+        start = time.perf_counter()
+        try:
+            recipients = {to: variables for to, (variables, _) in batch.items()}
+            await self.send_batch(subject, template, recipients)
+        except Exception as e:
+            status_code = getattr(e, "status_code", None)
+            if len(batch) > 1 and status_code is not None and 400 <= status_code < 500:
+                logger.warning(f"Batch of {len(batch)} emails rejected, sending singly")
+                self.split_batches += 1
+                await asyncio.gather(
+                    *(self._deliver(key, {to: item}) for to, item in batch.items())
+                )
+                return
+            logger.error(f"Could not send {len(batch)} emails: {e}")
+            self.failed += len(batch)
+            for _, future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            self.sent += len(batch)
+            for _, future in batch.values():
+                if not future.done():
+                    future.set_result(None)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.batches += 1
+            self._total_batch_ms += elapsed_ms
+            self.max_batch_ms = max(self.max_batch_ms, elapsed_ms)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "batches": self.batches,
+            "sent": self.sent,
+            "failed": self.failed,
+            "split_batches": self.split_batches,
+            "avg_batch_size": (self.sent + self.failed) / self.batches
+            if self.batches
+            else 0,
+            "avg_batch_ms": self._total_batch_ms / self.batches if self.batches else 0,
+            "max_batch_ms": self.max_batch_ms,
+        }
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_KINDS = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+
+
+class BoundedExecutor:
+    """Runs blocking calls in a thread or process pool, `max_workers` at a time.
+
+    Callers beyond the limit wait on a semaphore rather than piling up in the
+    pool's own queue, which keeps the wait measurable: `stats` reports how
+    long calls queued and how long they ran. The pool is created on first use.
+    A process pool needs picklable, module-level functions.
+    """
+
+    def __init__(self, name: str, kind: str, max_workers: int):
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.waiting = 0
+        self.running = 0
+        self.calls = 0
+        self._total_queue_ms = 0.0
+        self.max_queue_ms = 0.0
+        self._total_run_ms = 0.0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # One semaphore per event loop; tests run each in a loop of its own.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        return self._semaphore
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            logger.debug(
+                f"Starting {self.kind} pool {self.name} with {self.max_workers} workers"
+            )
+            self._executor = EXECUTOR_KINDS[self.kind](max_workers=self.max_workers)
+        return self._executor
+
+    async def run(self, fn: Callable, *args) -> Any:
+        semaphore = self._get_semaphore()
+        queued = time.perf_counter()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        started = time.perf_counter()
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), fn, *args
+            )
+        finally:
+            self.running -= 1
+            semaphore.release()
+            self._record(
+                (started - queued) * 1000, (time.perf_counter() - started) * 1000
+            )
+
+    def _record(self, queue_ms: float, run_ms: float) -> None:
+        self.calls += 1
+        self._total_queue_ms += queue_ms
+        self.max_queue_ms = max(self.max_queue_ms, queue_ms)
+        self._total_run_ms += run_ms
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "waiting": self.waiting,
+            "running": self.running,
+            "calls": self.calls,
+            "avg_queue_ms": self._total_queue_ms / self.calls if self.calls else 0,
+            "max_queue_ms": self.max_queue_ms,
+            "avg_run_ms": self._total_run_ms / self.calls if self.calls else 0,
+        }
@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import logging
+import re
+import time
+import unicodedata
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy.dialects import sqlite
+from storeapi.config import config
+from storeapi.database import database, generated_image_table
+from storeapi.metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Fold prompts that ask for the same image into one: Unicode
+    compatibility forms, case, runs of whitespace and trailing punctuation
+    do not matter."""
+    prompt = unicodedata.normalize("NFKC", prompt).casefold()
+    return re.sub(r"\s+", " ", prompt).strip().rstrip(".!").strip()
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(normalize_prompt(prompt).encode()).hexdigest()
+
+
+class ImageCache:
+    """Generated image URLs by prompt, in the generated_images table.
+
+    `get_or_generate` returns the stored image for a prompt generated less
+    than `ttl` seconds ago, and otherwise calls `generate` and stores its
+    result. Concurrent calls for the same prompt in one process share a
+    single `generate` call; if it fails, they all get its error and nothing
+    is stored.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def get(self, prompt: str) -> Optional[dict]:
+        query = generated_image_table.select().where(
+            generated_image_table.c.prompt_hash == prompt_hash(prompt),
+            generated_image_table.c.created_at > time.time() - self.ttl,
+        )
+        row = await database.fetch_one(query)
+        return {"output_url": row.output_url} if row else None
+
+    async def set(self, prompt: str, output_url: str) -> None:
+        values = {"output_url": output_url, "created_at": time.time()}
+        query = (
+            sqlite.insert(generated_image_table)
+            .values(
+                prompt_hash=prompt_hash(prompt),
+                prompt=normalize_prompt(prompt),
+                **values,
+            )
+            .on_conflict_do_update(index_elements=["prompt_hash"], set_=values)
+        )
+        await database.execute(query)
+
+    async def _generate(
+        self, prompt: str, generate: Callable[[], Awaitable[dict]]
+    ) -> dict:
+        try:
+            response = await generate()
+        except Exception:
+            self.errors += 1
+            raise
+        if response.get("output_url"):
+            await self.set(prompt, response["output_url"])
+        return response
+
+    async def get_or_generate(
+        self, prompt: str, generate: Callable[[], Awaitable[dict]]
+    ) -> dict:
+        key = prompt_hash(prompt)
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            cached = await self.get(prompt)
+            if cached is not None:
+                self.hits += 1
+                return cached
+            # Another caller may have started generating while this one read.
+            task = self._in_flight.get(key)
+            if task is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                logger.debug(f"No cached image for prompt {key[:8]}, generating")
+                task = asyncio.create_task(self._generate(prompt, generate))
+                self._in_flight[key] = task
+                task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Shielded, so one caller giving up does not cancel the others' image.
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "in_flight": len(self._in_flight),
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0,
+        }
+
+
+image_cache = ImageCache(ttl=config.IMAGE_CACHE_TTL_SECONDS)
+register_metrics("image_cache", image_cache.stats)
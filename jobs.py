@@ -0,0 +1,391 @@
+"""Durable background jobs, stored in the jobs table.
+
+The app runs the workers in its lifespan unless JOB_WORKERS_ENABLED is off.
+To run them in a process of their own instead, with ENV_STATE set as for
+the app:
+
+    python -m jobs
+"""
+import asyncio
+import json
+import logging
+import random
+import signal
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+import sqlalchemy
+from storeapi.config import config
+from storeapi.database import database, job_table
+from storeapi.metrics import register_metrics
+from storeapi.tasks import (
+    add_generated_image_to_post,
+    close_http_client,
+    open_http_client,
+    send_image_generation_failed_email,
+    send_user_registration_email,
+)
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+FAILED = "failed"
+
+
+class JobType:
+    """A registered handler, its limits and its counters."""
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[..., Awaitable[Any]],
+        concurrency: int,
+        visibility_timeout: float,
+        on_failure: Optional[Callable[..., Awaitable[Any]]] = None,
+    ):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.visibility_timeout = visibility_timeout
+        self.on_failure = on_failure
+        self.running: set[asyncio.Task] = set()
+        self.wakeup: Optional[asyncio.Event] = None
+        self.depth = 0
+        self.enqueued = 0
+        self.succeeded = 0
+        self.retried = 0
+        self.failed = 0
+        self.started = 0
+        self._total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.runs = 0
+        self._total_run_ms = 0.0
+        self.max_run_ms = 0.0
+
+    def record_wait(self, wait_ms: float) -> None:
+        self.started += 1
+        self._total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def record_run(self, run_ms: float) -> None:
+        self.runs += 1
+        self._total_run_ms += run_ms
+        self.max_run_ms = max(self.max_run_ms, run_ms)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "depth": self.depth,
+            "running": len(self.running),
+            "enqueued": self.enqueued,
+            "succeeded": self.succeeded,
+            "retried": self.retried,
+            "failed": self.failed,
+            "avg_wait_ms": self._total_wait_ms / self.started if self.started else 0,
+            "max_wait_ms": self.max_wait_ms,
+            "avg_run_ms": self._total_run_ms / self.runs if self.runs else 0,
+            "max_run_ms": self.max_run_ms,
+        }
+
+
+class JobQueue:
+    """Queue of background work that survives restarts.
+
+    `enqueue` stores a job in the jobs table. Workers started by `start` keep
+    claiming due jobs of each registered type, at most its `concurrency` at a
+    time, and call the type's handler with the job's payload. A claim is a
+    single UPDATE, so any number of processes can share the table.
+
+    A claim lasts for the type's visibility timeout. A job still running by
+    then is cancelled, and one whose worker died is claimed again by any
+    worker. Jobs that raise are retried after an exponential backoff until
+    `max_attempts` runs have failed; they are then kept with status "failed",
+    and the type's `on_failure`, if any, is called with the job's payload.
+    Done jobs are deleted.
+    """
+
+    def __init__(
+        self,
+        poll_interval: float,
+        max_attempts: int,
+        retry_base: float,
+        retry_max: float,
+        shutdown_grace: float,
+    ):
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.shutdown_grace = shutdown_grace
+        self._types: dict[str, JobType] = {}
+        self._dispatchers: list[asyncio.Task] = []
+        self._stopping = False
+
+    def register(
+        self,
+        name: str,
+        handler: Callable[..., Awaitable[Any]],
+        concurrency: int,
+        visibility_timeout: float,
+        on_failure: Optional[Callable[..., Awaitable[Any]]] = None,
+    ) -> None:
+        self._types[name] = JobType(
+            name, handler, concurrency, visibility_timeout, on_failure
+        )
+
+    async def enqueue(self, type: str, **payload) -> int:
+        """Store a job that calls the handler of `type` with `payload`, which
+        must be JSON serializable, and wake this process's worker for it.
+        Returns the job id."""
+        job_id = await self.store(type, **payload)
+        self.wake(type)
+        return job_id
+
+    async def store(self, type: str, **payload) -> int:
+        """`enqueue` without waking the worker, for use inside a transaction.
+        Call `wake` after the commit; until then the job is not visible and
+        an early worker would miss it and only find it on its next poll."""
+        job_type = self._types[type]
+        now = time.time()
+        query = job_table.insert().values(
+            type=type,
+            payload=json.dumps(payload),
+            status=QUEUED,
+            run_at=now,
+            created_at=now,
+        )
+        job_id = await database.execute(query)
+        job_type.enqueued += 1
+        return job_id
+
+    def wake(self, type: str) -> None:
+        wakeup = self._types[type].wakeup
+        if wakeup is not None:
+            wakeup.set()
+
+    async def _claim(self, job_type: JobType, limit: int) -> list:
+        now = time.time()
+        due = (
+            sqlalchemy.select(job_table.c.id)
+            .where(
+                job_table.c.type == job_type.name,
+                job_table.c.status.in_((QUEUED, RUNNING)),
+                job_table.c.run_at <= now,
+            )
+            .order_by(job_table.c.run_at)
+            .limit(limit)
+        )
+        query = (
+            job_table.update()
+            .where(job_table.c.id.in_(due.scalar_subquery()))
+            .values(
+                status=RUNNING,
+                run_at=now + job_type.visibility_timeout,
+                attempts=job_table.c.attempts + 1,
+            )
+            .returning(
+                job_table.c.id,
+                job_table.c.payload,
+                job_table.c.attempts,
+                job_table.c.created_at,
+            )
+        )
+        return await database.fetch_all(query)
+
+    async def _count_queued(self, job_type: JobType) -> int:
+        query = sqlalchemy.select(sqlalchemy.func.count()).where(
+            job_table.c.type == job_type.name, job_table.c.status == QUEUED
+        )
+        return await database.fetch_val(query)
+
+    async def _execute(self, job_type: JobType, job) -> None:
+        started = time.time()
+        if job.attempts == 1:
+            job_type.record_wait((started - job.created_at) * 1000)
+        try:
+            await asyncio.wait_for(
+                job_type.handler(**json.loads(job.payload)),
+                job_type.visibility_timeout,
+            )
+        except asyncio.CancelledError:
+            # Stopped before it finished: hand the job to the next worker.
+            await database.execute(
+                job_table.update()
+                .where(job_table.c.id == job.id)
+                .values(
+                    status=QUEUED, run_at=time.time(), attempts=job_table.c.attempts - 1
+                )
+            )
+            raise
+        except Exception as e:
+            await self._retry_or_fail(job_type, job, f"{type(e).__name__}: {e}")
+        else:
+            await database.execute(job_table.delete().where(job_table.c.id == job.id))
+            job_type.succeeded += 1
+        finally:
+            job_type.record_run((time.time() - started) * 1000)
+
+    async def _retry_or_fail(self, job_type: JobType, job, error: str) -> None:
+        if job.attempts >= self.max_attempts:
+            logger.error(f"{job_type.name} job {job.id} failed for good: {error}")
+            values = {"status": FAILED, "last_error": error}
+            job_type.failed += 1
+        else:
+            delay = min(self.retry_max, self.retry_base * 2 ** (job.attempts - 1))
+            # Jitter, so jobs that failed together are not retried together.
+            delay *= random.uniform(0.5, 1)
+            logger.warning(
+                f"{job_type.name} job {job.id} failed, retrying in {delay:.1f}s: "
+                f"{error}"
+            )
+            values = {
+                "status": QUEUED,
+                "run_at": time.time() + delay,
+                "last_error": error,
+            }
+            job_type.retried += 1
+        await database.execute(
+            job_table.update().where(job_table.c.id == job.id).values(values)
+        )
+        if values["status"] == FAILED and job_type.on_failure is not None:
+            try:
+                await job_type.on_failure(**json.loads(job.payload))
+            except Exception:
+                logger.exception(
+                    f"Failure handler of {job_type.name} job {job.id} failed"
+                )
+
+    def _start_job(self, job_type: JobType, job) -> None:
+        task = asyncio.create_task(self._execute(job_type, job))
+        job_type.running.add(task)
+
+        def finished(task: asyncio.Task) -> None:
+            job_type.running.discard(task)
+            job_type.wakeup.set()
+
+        task.add_done_callback(finished)
+
+    async def _dispatch(self, job_type: JobType) -> None:
+        job_type.wakeup = asyncio.Event()
+        while not self._stopping:
+            job_type.wakeup.clear()
+            free = job_type.concurrency - len(job_type.running)
+            try:
+                if free > 0:
+                    for job in await self._claim(job_type, free):
+                        self._start_job(job_type, job)
+                job_type.depth = await self._count_queued(job_type)
+            except Exception:
+                logger.exception(f"Could not claim {job_type.name} jobs")
+            # Woken early by a new job or a finished one.
+            try:
+                await asyncio.wait_for(job_type.wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self) -> None:
+        logger.info("Starting job workers")
+        self._stopping = False
+        self._dispatchers = [
+            asyncio.create_task(self._dispatch(job_type))
+            for job_type in self._types.values()
+        ]
+
+    async def stop(self) -> None:
+        """Stop claiming jobs and give running ones `shutdown_grace` seconds
+        to finish. Jobs cancelled after that are queued again."""
+        self._stopping = True
+        for job_type in self._types.values():
+            if job_type.wakeup is not None:
+                job_type.wakeup.set()
+        await asyncio.gather(*self._dispatchers)
+        self._dispatchers = []
+
+        running = [
+            task for job_type in self._types.values() for task in job_type.running
+        ]
+        if running:
+            _, pending = await asyncio.wait(running, timeout=self.shutdown_grace)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def run_due(self, type: Optional[str] = None) -> int:
+        """Run every job that is due now, or only those of `type`, and wait
+        for them, without workers. For tests and one-off runs. Returns the
+        number of jobs run."""
+        count = 0
+        job_types = [self._types[type]] if type else self._types.values()
+        for job_type in job_types:
+            while jobs := await self._claim(job_type, job_type.concurrency):
+                await asyncio.gather(*(self._execute(job_type, job) for job in jobs))
+                count += len(jobs)
+        return count
+
+    def stats(self) -> dict:
+        return {name: job_type.stats() for name, job_type in self._types.items()}
+
+
+async def _generate_and_add_to_post(
+    email: str, post_id: int, post_url: str, prompt: str
+) -> None:
+    # APIResponseError propagates, so the job is retried; the user hears of
+    # it only once the last attempt has failed.
+    await add_generated_image_to_post(email, post_id, post_url, database, prompt)
+
+
+async def _image_generation_failed(email: str, **payload) -> None:
+    await send_image_generation_failed_email(email)
+
+
+job_queue = JobQueue(
+    poll_interval=config.JOB_POLL_SECONDS,
+    max_attempts=config.JOB_MAX_ATTEMPTS,
+    retry_base=config.JOB_RETRY_BASE_SECONDS,
+    retry_max=config.JOB_RETRY_MAX_SECONDS,
+    shutdown_grace=config.JOB_SHUTDOWN_GRACE_SECONDS,
+)
+job_queue.register(
+    "generate_and_add_to_post",
+    _generate_and_add_to_post,
+    concurrency=config.IMAGE_JOB_CONCURRENCY,
+    visibility_timeout=config.IMAGE_JOB_VISIBILITY_TIMEOUT_SECONDS,
+    on_failure=_image_generation_failed,
+)
+job_queue.register(
+    "send_user_registration_email",
+    send_user_registration_email,
+    concurrency=config.EMAIL_JOB_CONCURRENCY,
+    visibility_timeout=config.EMAIL_JOB_VISIBILITY_TIMEOUT_SECONDS,
+)
+register_metrics("jobs", job_queue.stats)
+
+
+async def run_worker() -> None:
+    """Work the queue until SIGINT or SIGTERM."""
+    await database.connect()
+    await open_http_client()
+    await job_queue.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    logger.info("Stopping job workers")
+    await job_queue.stop()
+    await close_http_client()
+    await database.disconnect()
+
+
+def main() -> None:
+    from storeapi.logging_conf import configure_logging
+
+    configure_logging()
+    asyncio.run(run_worker())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import hashlib
+import io
 import logging
 from functools import lru_cache
 
@@ -33,3 +35,44 @@ def b2_upload_file(local_file: str, file_name: str):
         f"Uploaded {local_file} to B2 successfully and got download URL {download_url}"
     )
     return download_url
+
+
+def b2_upload_bytes(data: bytes, file_name: str) -> str:
+    api = b2_api()
+    logger.debug(f"Uploading {len(data)} bytes to B2 as {file_name}")
+    uploaded_file = b2_get_bucket(api).upload_bytes(data, file_name)
+    return api.get_download_url_for_fileid(uploaded_file.id_)
+
+
+# Large files are uploaded in parts: start the file, upload its parts in any
+# order and at the same time, then finish it with the parts' SHA1s. Every part
+# but the last must be at least 5 MB.
+
+
+def b2_start_large_file(file_name: str) -> str:
+    api = b2_api()
+    response = api.session.start_large_file(
+        b2_get_bucket(api).id_, file_name, "b2/x-auto", {}
+    )
+    logger.debug(f"Started B2 large file {file_name} as {response['fileId']}")
+    return response["fileId"]
+
+
+def b2_upload_part(file_id: str, part_number: int, data: bytes) -> str:
+    """Upload part `part_number`, counting from 1, and return its SHA1."""
+    sha1 = hashlib.sha1(data).hexdigest()
+    b2_api().session.upload_part(
+        file_id, part_number, len(data), sha1, io.BytesIO(data)
+    )
+    return sha1
+
+
+def b2_finish_large_file(file_id: str, part_sha1s: list[str]) -> str:
+    api = b2_api()
+    api.session.finish_large_file(file_id, part_sha1s)
+    logger.debug(f"Finished B2 large file {file_id} of {len(part_sha1s)} parts")
+    return api.get_download_url_for_fileid(file_id)
+
+
+def b2_cancel_large_file(file_id: str) -> None:
+    b2_api().session.cancel_large_file(file_id)
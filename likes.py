@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Iterable, Optional
+
+import sqlalchemy
+from sqlalchemy.dialects import sqlite
+from storeapi.cache import invalidate_posts
+from storeapi.config import config
+from storeapi.database import database, like_table, post_table
+from storeapi.metrics import register_metrics
+from storeapi.versions import bump_post_versions
+
+logger = logging.getLogger(__name__)
+
+
+async def store_likes(pairs: Iterable[tuple[int, int]]) -> dict[tuple[int, int], int]:
+    """Insert (post_id, user_id) likes that do not exist yet.
+
+    Counts and versions of the liked posts are updated in the same
+    transaction, and the cache is invalidated afterwards. Returns the new like
+    id for each pair that was inserted; pairs that were already liked are
+    left out.
+    """
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        return {}
+
+    query = (
+        sqlite.insert(like_table)
+        .values([{"post_id": post, "user_id": user} for post, user in pairs])
+        .on_conflict_do_nothing(index_elements=["post_id", "user_id"])
+        .returning(like_table.c.id, like_table.c.post_id, like_table.c.user_id)
+    )
+
+    logger.debug(query)
+
+    async with database.transaction():
+        rows = await database.fetch_all(query)
+        counts = Counter(row.post_id for row in rows)
+        if counts:
+            await database.execute(
+                post_table.update()
+                .where(post_table.c.id.in_(counts))
+                .values(
+                    like_count=post_table.c.like_count
+                    + sqlalchemy.case(counts, value=post_table.c.id)
+                )
+            )
+            await bump_post_versions(counts)
+    if counts:
+        await invalidate_posts(counts)
+
+    return {(row.post_id, row.user_id): row.id for row in rows}
+
+
+class LikeBuffer:
+    """Write-behind buffer that accepts likes in memory and stores them in bulk.
+
+    Likes are deduplicated per (post_id, user_id) while they wait. A flush is
+    triggered when `max_size` likes are pending or every `flush_interval`
+    seconds, and `stop` flushes whatever is left.
+    """
+
+    def __init__(self, max_size: int, flush_interval: float):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self._pending: dict[tuple[int, int], None] = {}
+        self._lock = asyncio.Lock()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.flushes = 0
+        self.flushed_likes = 0
+        self.dropped_likes = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    async def add(self, post_id: int, user_id: int) -> None:
+        self._pending[(post_id, user_id)] = None
+        if len(self._pending) >= self.max_size:
+            if self._task is None:
+                await self.flush()
+            else:
+                self._full.set()
+
+    def discard(self, post_id: int, user_id: int) -> None:
+        self._pending.pop((post_id, user_id), None)
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+
+            start = time.perf_counter()
+            try:
+                existing = await self._existing_post_ids(
+                    post_id for post_id, _ in pending
+                )
+                pairs = [pair for pair in pending if pair[0] in existing]
+                await store_likes(pairs)
+            except Exception:
+                logger.exception(f"Failed to flush {len(pending)} buffered likes")
+                self.failed_flushes += 1
+                # Keep the likes for the next attempt, behind any newer ones.
+                self._pending = {**pending, **self._pending}
+                return
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.flushes += 1
+            self.flushed_likes += len(pairs)
+            self.dropped_likes += len(pending) - len(pairs)
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+            logger.debug(f"Flushed {len(pairs)} buffered likes in {elapsed_ms:.1f}ms")
+
+    async def _existing_post_ids(self, post_ids: Iterable[int]) -> set[int]:
+        query = sqlalchemy.select(post_table.c.id).where(
+            post_table.c.id.in_(set(post_ids))
+        )
+        return {row.id for row in await database.fetch_all(query)}
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    async def start(self) -> None:
+        logger.info("Starting like write-behind buffer")
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Let the loop finish its current flush instead of cancelling it, so
+        # no swapped-out batch is lost, then flush what arrived meanwhile.
+        if self._task is not None:
+            self._stopping = True
+            self._full.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": config.LIKE_BUFFER_ENABLED,
+            "depth": self.depth,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "flushed_likes": self.flushed_likes,
+            "dropped_likes": self.dropped_likes,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+            "avg_flush_ms": self._total_flush_ms / self.flushes if self.flushes else 0,
+        }
+
+
+like_buffer = LikeBuffer(
+    max_size=config.LIKE_BUFFER_MAX_SIZE,
+    flush_interval=config.LIKE_BUFFER_FLUSH_SECONDS,
+)
+register_metrics("like_buffer", like_buffer.stats)
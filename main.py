@@ -7,11 +7,19 @@ from fastapi.exception_handlers import http_exception_handler
 from fastapi import HTTPException as HttpException
 
 from asgi_correlation_id import CorrelationIdMiddleware
+from storeapi.config import config
 from storeapi.database import database
+from storeapi.jobs import job_queue
+from storeapi.likes import like_buffer
 from storeapi.logging_conf import configure_logging
+from storeapi.routers.metrics import router as metrics_router
 from storeapi.routers.post import router as post_router
+from storeapi.routers.search import router as search_router
 from storeapi.routers.upload import router as upload_router
 from storeapi.routers.user import router as user_router
+from storeapi.security import password_hasher
+from storeapi.tasks import close_http_client, open_http_client
+from storeapi.uploads import b2_executor
 
 logger = logging.getLogger(__name__)
 
@@ -20,9 +28,20 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     configure_logging()
     await database.connect()
+    await open_http_client()
+    if config.LIKE_BUFFER_ENABLED:
+        await like_buffer.start()
+    if config.JOB_WORKERS_ENABLED:
+        await job_queue.start()
     logger.info("FASTAPI startup complete.")
     yield
+    await job_queue.stop()
+    # Flush buffered likes while the database is still connected.
+    await like_buffer.stop()
     await database.disconnect()
+    password_hasher.shutdown()
+    b2_executor.shutdown()
+    await close_http_client()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -50,6 +69,8 @@ print("Hi this is environ variable", os.environ.get('DATABASE_URL'))
 app.include_router(post_router, tags=["posts"])
 app.include_router(upload_router, tags=["upload"])
 app.include_router(user_router, tags=["users"])
+app.include_router(metrics_router, tags=["metrics"])
+app.include_router(search_router, tags=["search"])
 
 
 @app.exception_handler(HttpException)
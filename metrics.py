@@ -0,0 +1,16 @@
+import logging
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+_sources: dict[str, Callable[[], dict]] = {}
+
+
+def register_metrics(name: str, source: Callable[[], dict]) -> None:
+    """Publish the counters returned by `source()` under `name` in /metrics."""
+    logger.debug(f"Registering metrics source '{name}'")
+    _sources[name] = source
+
+
+def collect_metrics() -> dict:
+    return {name: source() for name, source in _sources.items()}
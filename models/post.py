@@ -2,6 +2,8 @@ from typing import Optional
 
 from pydantic import BaseModel, ConfigDict
 
+MAX_BATCH_SIZE = 1000
+
 
 class UserPostIn(BaseModel):
     body: str
@@ -19,6 +21,7 @@ class UserPostWithLikes(UserPost):
     model_config = ConfigDict(from_attributes=True)
 
     likes: int
+    comment_count: int
 
 
 class CommentIn(BaseModel):
@@ -45,3 +48,12 @@ class PostLikeIn(BaseModel):
 class PostLike(PostLikeIn):
     id: int
     user_id: int
+
+
+class BatchItemResult(BaseModel):
+    """Outcome of one item of a batch write, in the order items were sent."""
+
+    status_code: int
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
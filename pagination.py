@@ -0,0 +1,39 @@
+import base64
+import json
+import logging
+
+from fastapi import HTTPException, status
+
+logger = logging.getLogger(__name__)
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def create_invalid_cursor_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor"
+    )
+
+
+def encode_cursor(**values) -> str:
+    """Pack the keyset position of the last row on a page into an opaque string."""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, **required: type) -> dict:
+    """Unpack a cursor created by `encode_cursor`, checking that every key in
+    `required` is present with the given type. Malformed or foreign cursors
+    are rejected with a 400."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        logger.debug(f"Could not decode cursor {cursor!r}")
+        raise create_invalid_cursor_exception() from e
+
+    if not isinstance(values, dict) or any(
+        not isinstance(values.get(key), kind) for key, kind in required.items()
+    ):
+        raise create_invalid_cursor_exception()
+    return values
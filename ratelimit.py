@@ -0,0 +1,133 @@
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException, Request, status
+from storeapi.config import config
+from storeapi.metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitStore(ABC):
+    """Storage for token buckets.
+
+    A shared store (for example Redis running the refill and take as one
+    script) lets several workers enforce one limit; `take` must then be
+    atomic per key.
+    """
+
+    @abstractmethod
+    async def take(self, key: str, capacity: int, per_second: float) -> float:
+        """Take one token from the bucket `key`, which holds up to `capacity`
+        tokens and gains `per_second` tokens a second. Returns 0 if a token
+        was taken, otherwise the seconds until one is available."""
+
+    @abstractmethod
+    async def clear(self) -> None: ...
+
+    @abstractmethod
+    def stats(self) -> dict: ...
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """Token buckets in process memory.
+
+    At most `max_keys` buckets are kept; the least recently used is dropped
+    first, which only ever makes the limit more lenient for that key.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self.evictions = 0
+
+    async def take(self, key: str, capacity: int, per_second: float) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * per_second)
+
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / per_second
+
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+            self.evictions += 1
+        return wait
+
+    async def clear(self) -> None:
+        self._buckets.clear()
+
+    def stats(self) -> dict:
+        return {
+            "buckets": len(self._buckets),
+            "max_buckets": self.max_keys,
+            "evictions": self.evictions,
+        }
+
+
+def create_rate_limit_store() -> RateLimitStore:
+    stores = {"memory": MemoryRateLimitStore}
+    store = stores[config.RATE_LIMIT_BACKEND]
+    logger.debug(f"Using {store.__name__} for rate limits")
+    return store(max_keys=config.RATE_LIMIT_MAX_KEYS)
+
+
+rate_limit_store = create_rate_limit_store()
+_login_attempts = {"allowed": 0, "rejected": 0}
+
+
+def login_rate_limit_stats() -> dict:
+    return {**_login_attempts, **rate_limit_store.stats()}
+
+
+register_metrics("login_rate_limit", login_rate_limit_stats)
+
+
+def create_too_many_attempts_exception(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many login attempts, try again later",
+        headers={"Retry-After": str(max(1, round(retry_after)))},
+    )
+
+
+def client_ip(request: Request) -> Optional[str]:
+    return request.client.host if request.client else None
+
+
+async def check_login_rate(email: str, ip: Optional[str]) -> None:
+    """Count a login attempt against the buckets of the email and client IP.
+
+    Raises a 429 once either is exhausted. Called before the user is looked
+    up, so rejected attempts cost no database or hashing work.
+    """
+    waits = [
+        await rate_limit_store.take(
+            f"login:email:{email.strip().lower()}",
+            config.LOGIN_RATE_LIMIT_EMAIL_ATTEMPTS,
+            config.LOGIN_RATE_LIMIT_EMAIL_ATTEMPTS / config.LOGIN_RATE_LIMIT_PERIOD,
+        )
+    ]
+    if ip is not None:
+        waits.append(
+            await rate_limit_store.take(
+                f"login:ip:{ip}",
+                config.LOGIN_RATE_LIMIT_IP_ATTEMPTS,
+                config.LOGIN_RATE_LIMIT_IP_ATTEMPTS / config.LOGIN_RATE_LIMIT_PERIOD,
+            )
+        )
+
+    retry_after = max(waits)
+    if retry_after:
+        _login_attempts["rejected"] += 1
+        logger.warning("Login attempt rate limited", extra={"email": email})
+        raise create_too_many_attempts_exception(retry_after)
+    _login_attempts["allowed"] += 1
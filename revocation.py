@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from typing import Iterator
+
+import sqlalchemy
+from sqlalchemy.dialects import sqlite
+from storeapi.config import config
+from storeapi.database import database, revoked_token_table
+from storeapi.metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Set membership with no false negatives and about `error_rate` false
+    positives while it holds up to `capacity` items. Items cannot be removed;
+    build a new filter instead."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        bits = -capacity * math.log(error_rate) / math.log(2) ** 2
+        self.size = max(8, math.ceil(bits))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> Iterator[int]:
+        # Double hashing: k positions from the two halves of one digest.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class RevocationList:
+    """Revoked access tokens, by their "jti" claim.
+
+    The revoked_tokens table is the source of truth. Each process keeps a
+    Bloom filter of it, so checking a token that was not revoked, which is
+    nearly every request, needs no query; only a filter hit is confirmed in
+    the table. Every `refresh_seconds` the expired rows are deleted and the
+    filter is rebuilt from the rest, which keeps it small and picks up tokens
+    revoked by other processes. Only one request refreshes at a time; the
+    others keep using the current filter meanwhile.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, refresh_seconds: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_seconds = refresh_seconds
+        self._filter = BloomFilter(capacity, error_rate)
+        self._refresh_at = 0.0
+        self._loaded = False
+        self._refresh_lock = asyncio.Lock()
+        self.refreshes = 0
+        self.checks = 0
+        self.filter_hits = 0
+        self.false_positives = 0
+
+    async def refresh(self) -> None:
+        now = int(time.time())
+        expired = revoked_token_table.c.expires_at <= now
+        await database.execute(revoked_token_table.delete().where(expired))
+        rows = await database.fetch_all(sqlalchemy.select(revoked_token_table.c.jti))
+
+        bloom = BloomFilter(max(self.capacity, 2 * len(rows)), self.error_rate)
+        for row in rows:
+            bloom.add(row.jti)
+        self._filter = bloom
+        self._loaded = True
+        self._refresh_at = time.monotonic() + self.refresh_seconds
+        self.refreshes += 1
+        logger.debug(f"Loaded {len(rows)} revoked tokens into the Bloom filter")
+
+    async def revoke(self, jti: str, expires_at: int) -> None:
+        query = (
+            sqlite.insert(revoked_token_table)
+            .values(jti=jti, expires_at=expires_at)
+            .on_conflict_do_nothing(index_elements=["jti"])
+        )
+        await database.execute(query)
+        self._filter.add(jti)
+        if self._filter.count > self._filter.capacity:
+            # Past its capacity the filter's error rate climbs; rebuild it.
+            self._refresh_at = 0.0
+
+    async def _refresh_if_due(self) -> None:
+        if self._refresh_lock.locked() and self._loaded:
+            return
+        async with self._refresh_lock:
+            # Another request may have refreshed while this one waited.
+            if time.monotonic() >= self._refresh_at:
+                await self.refresh()
+
+    async def is_revoked(self, jti: str) -> bool:
+        if time.monotonic() >= self._refresh_at:
+            await self._refresh_if_due()
+
+        self.checks += 1
+        if jti not in self._filter:
+            return False
+
+        self.filter_hits += 1
+        query = sqlalchemy.select(revoked_token_table.c.jti).where(
+            revoked_token_table.c.jti == jti
+        )
+        if await database.fetch_val(query) is None:
+            self.false_positives += 1
+            return False
+        return True
+
+    async def clear(self) -> None:
+        """Forget the filter, so the next check reloads it from the table."""
+        self._filter = BloomFilter(self.capacity, self.error_rate)
+        self._loaded = False
+        self._refresh_at = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "revoked_tokens": self._filter.count,
+            "filter_bits": self._filter.size,
+            "filter_hashes": self._filter.hashes,
+            "checks": self.checks,
+            "filter_hits": self.filter_hits,
+            "false_positives": self.false_positives,
+            "refreshes": self.refreshes,
+        }
+
+
+revocation_list = RevocationList(
+    capacity=config.REVOCATION_FILTER_CAPACITY,
+    error_rate=config.REVOCATION_FILTER_ERROR_RATE,
+    refresh_seconds=config.REVOCATION_REFRESH_SECONDS,
+)
+register_metrics("token_revocations", revocation_list.stats)
@@ -0,0 +1,14 @@
+import logging
+
+from fastapi import APIRouter
+from storeapi.metrics import collect_metrics
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics():
+    logger.info("Collecting metrics")
+    return collect_metrics()
@@ -1,11 +1,38 @@
+import json
 import logging
+from collections import Counter, defaultdict
 from enum import Enum
-from typing import Annotated
+from typing import Annotated, AsyncIterator, Iterable, Optional
 
 import sqlalchemy
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
+from sqlalchemy.dialects import sqlite
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import JSONResponse, StreamingResponse
+from storeapi.cache import (
+    POSTS_NAMESPACE,
+    cache_key,
+    get_or_load,
+    invalidate,
+    invalidate_post,
+    invalidate_posts,
+    post_namespace,
+)
+from storeapi.conditional import conditional_response, make_etag
+from storeapi.config import config
 from storeapi.database import comment_table, database, like_table, post_table
+from storeapi.jobs import job_queue
+from storeapi.likes import like_buffer, store_likes
 from storeapi.models.post import (
+    MAX_BATCH_SIZE,
+    BatchItemResult,
     Comment,
     CommentIn,
     PostLike,
@@ -16,17 +43,23 @@ from storeapi.models.post import (
     UserPostWithLikes,
 )
 from storeapi.models.user import User
-from storeapi.security import get_current_user
-from storeapi.tasks import generate_and_add_to_post
+from storeapi.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from storeapi.security import get_current_user_from_claims
+from storeapi.versions import (
+    POSTS_VERSION,
+    bump_post_version,
+    bump_post_versions,
+    bump_version,
+    get_post_version,
+    get_version,
+)
 
 router = APIRouter()
 
 logger = logging.getLogger(__name__)
 
-select_post_and_likes = (
-    sqlalchemy.select(post_table, sqlalchemy.func.count(like_table.c.id).label("likes"))
-    .select_from(post_table.outerjoin(like_table))
-    .group_by(post_table.c.id)
+select_post_and_likes = sqlalchemy.select(
+    post_table, post_table.c.like_count.label("likes")
 )
 
 
@@ -40,11 +73,22 @@ async def find_post(post_id: int):
     return await database.fetch_one(query)
 
 
+async def find_existing_post_ids(post_ids: Iterable[int]) -> set[int]:
+    logger.info("Finding existing posts for batch")
+
+    query = sqlalchemy.select(post_table.c.id).where(
+        post_table.c.id.in_(set(post_ids))
+    )
+
+    logger.debug(query)
+
+    return {row.id for row in await database.fetch_all(query)}
+
+
 @router.post("/post", response_model=UserPost, status_code=201)
 async def create_post(
     post: UserPostIn,
-    current_user: Annotated[User, Depends(get_current_user)],
-    background_tasks: BackgroundTasks,
+    current_user: Annotated[User, Depends(get_current_user_from_claims)],
     request: Request,
     prompt: str = None,
 ):
@@ -55,16 +99,24 @@ async def create_post(
 
     logger.debug(query)
 
-    last_record_id = await database.execute(query)
+    async with database.transaction():
+        last_record_id = await database.execute(query)
+        await bump_version(POSTS_VERSION)
+        # Queued with the post, so the image is generated even if this
+        # process stops right after responding.
+        if prompt:
+            await job_queue.store(
+                "generate_and_add_to_post",
+                email=current_user.email,
+                post_id=last_record_id,
+                post_url=str(
+                    request.url_for("get_post_with_comments", post_id=last_record_id)
+                ),
+                prompt=prompt,
+            )
     if prompt:
-        background_tasks.add_task(
-            generate_and_add_to_post,
-            current_user.email,
-            last_record_id,
-            request.url_for("get_post_with_comments", post_id=last_record_id),
-            database,
-            prompt,
-        )
+        job_queue.wake("generate_and_add_to_post")
+    await invalidate(POSTS_NAMESPACE)
     return {**data, "id": last_record_id}
 
 
@@ -74,25 +126,187 @@ class PostSorting(str, Enum):
     most_likes = "most_likes"
 
 
-@router.get("/post", response_model=list[UserPostWithLikes])
-async def get_all_posts(sorting: PostSorting = PostSorting.new):
-    logger.info("Getting all posts")
+def select_posts_page(
+    sorting: PostSorting, limit: int, after: Optional[dict] = None
+) -> sqlalchemy.Select:
+    """Build a keyset query for one page of posts with their like counts.
+
+    `after` is the decoded cursor of the last post on the previous page. One
+    extra row is fetched so the caller can tell whether another page exists.
+    """
+    query = select_post_and_likes.limit(limit + 1)
 
     if sorting == PostSorting.new:
-        query = select_post_and_likes.order_by(post_table.c.id.desc())
+        query = query.order_by(post_table.c.id.desc())
+        if after:
+            query = query.where(post_table.c.id < after["id"])
     elif sorting == PostSorting.old:
-        query = select_post_and_likes.order_by(post_table.c.id.asc())
+        query = query.order_by(post_table.c.id.asc())
+        if after:
+            query = query.where(post_table.c.id > after["id"])
     elif sorting == PostSorting.most_likes:
-        query = select_post_and_likes.order_by(sqlalchemy.desc("likes"))
+        query = query.order_by(
+            post_table.c.like_count.desc(), post_table.c.id.desc()
+        )
+        if after:
+            # SQLite cannot seek the like_count index with an OR or row-value
+            # keyset condition, so the remaining ties and the posts with fewer
+            # likes are fetched as two index range scans and merged.
+            ties = query.where(
+                post_table.c.like_count == after["likes"],
+                post_table.c.id < after["id"],
+            ).subquery()
+            fewer = query.where(post_table.c.like_count < after["likes"]).subquery()
+            merged = sqlalchemy.union_all(
+                sqlalchemy.select(ties), sqlalchemy.select(fewer)
+            ).subquery()
+            query = (
+                sqlalchemy.select(merged)
+                .order_by(merged.c.likes.desc(), merged.c.id.desc())
+                .limit(limit + 1)
+            )
+
+    return query
 
-    logger.debug(query)
 
-    return await database.fetch_all(query)
+@router.get("/post", response_model=list[UserPostWithLikes])
+async def get_all_posts(
+    request: Request,
+    response: Response,
+    sorting: PostSorting = PostSorting.new,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: Optional[str] = None,
+):
+    logger.info("Getting all posts")
+
+    after = None
+    if cursor:
+        if sorting == PostSorting.most_likes:
+            after = decode_cursor(cursor, sorting=str, id=int, likes=int)
+        else:
+            after = decode_cursor(cursor, sorting=str, id=int)
+        if after["sorting"] != sorting.value:
+            raise HTTPException(
+                status_code=400, detail="Cursor does not match sorting"
+            )
+
+    posts_version = await get_version(POSTS_VERSION)
+    etag = make_etag(posts_version, sorting.value, limit, cursor)
+    if not_modified := conditional_response(request, response, "get_all_posts", etag):
+        return not_modified
+
+    async def load_page() -> dict:
+        query = select_posts_page(sorting, limit, after)
+
+        logger.debug(query)
+
+        posts = await database.fetch_all(query)
+        next_cursor = None
+        if len(posts) > limit:
+            posts = posts[:limit]
+            last = posts[-1]
+            next_cursor = encode_cursor(
+                sorting=sorting.value, id=last.id, likes=last.likes
+            )
+        return {
+            "posts": [UserPostWithLikes.model_validate(p).model_dump() for p in posts],
+            "next_cursor": next_cursor,
+        }
+
+    # The stored version is in the key as well, so a page cached before a
+    # write made by another process is not served under the new ETag.
+    key = await cache_key(POSTS_NAMESPACE, posts_version, sorting.value, limit, cursor)
+    page = await get_or_load(key, load_page)
+    if page["next_cursor"]:
+        response.headers[NEXT_CURSOR_HEADER] = page["next_cursor"]
+    return page["posts"]
+
+
+async def iter_posts_export(after: int, chunk_size: int) -> AsyncIterator[str]:
+    """Yield the posts after id `after` as NDJSON, with like counts and comments.
+
+    Posts are read in id order, `chunk_size` at a time, with one query for the
+    posts and one for their comments. Only the current chunk is held in memory
+    and no read stays open between chunks, so a long export neither grows with
+    the table nor blocks writers.
+    """
+    while True:
+        query = (
+            sqlalchemy.select(
+                post_table.c.id,
+                post_table.c.body,
+                post_table.c.user_id,
+                post_table.c.image_url,
+                post_table.c.like_count.label("likes"),
+            )
+            .where(post_table.c.id > after)
+            .order_by(post_table.c.id)
+            .limit(chunk_size)
+        )
+
+        logger.debug(query)
+
+        # Rows are unpacked from the underlying SQLAlchemy row: attribute
+        # access on a Record looks up the column type on every call, which
+        # dominates the time of a large export.
+        posts = [
+            {
+                "id": id,
+                "body": body,
+                "user_id": user_id,
+                "image_url": image_url,
+                "likes": likes,
+            }
+            for id, body, user_id, image_url, likes in (
+                row._mapping for row in await database.fetch_all(query)
+            )
+        ]
+        if not posts:
+            return
+
+        query = (
+            sqlalchemy.select(
+                comment_table.c.post_id,
+                comment_table.c.id,
+                comment_table.c.body,
+                comment_table.c.user_id,
+            )
+            .where(comment_table.c.post_id.in_([post["id"] for post in posts]))
+            .order_by(comment_table.c.post_id, comment_table.c.id)
+        )
+
+        logger.debug(query)
+
+        comments = defaultdict(list)
+        for row in await database.fetch_all(query):
+            post_id, id, body, user_id = row._mapping
+            comments[post_id].append({"id": id, "body": body, "user_id": user_id})
+
+        yield "".join(
+            json.dumps({**post, "comments": comments[post["id"]]}) + "\n"
+            for post in posts
+        )
+
+        if len(posts) < chunk_size:
+            return
+        after = posts[-1]["id"]
+
+
+# Registered before /post/{post_id} so "export" is not taken for a post id.
+@router.get("/post/export", response_class=StreamingResponse)
+async def export_posts(after: Annotated[int, Query(ge=0)] = 0):
+    logger.info("Exporting posts")
+
+    return StreamingResponse(
+        iter_posts_export(after, config.EXPORT_CHUNK_SIZE),
+        media_type="application/x-ndjson",
+    )
 
 
 @router.post("/comment", response_model=Comment, status_code=201)
 async def create_comment(
-    comment: CommentIn, current_user: Annotated[User, Depends(get_current_user)]
+    comment: CommentIn,
+    current_user: Annotated[User, Depends(get_current_user_from_claims)],
 ):
     logger.info("Creating comment")
 
@@ -102,56 +316,365 @@ async def create_comment(
 
     data = {**comment.model_dump(), "user_id": current_user.id}
     query = comment_table.insert().values(data)
+    count_query = (
+        post_table.update()
+        .where(post_table.c.id == comment.post_id)
+        .values(comment_count=post_table.c.comment_count + 1)
+    )
 
     logger.debug(query)
 
-    last_record_id = await database.execute(query)
+    async with database.transaction():
+        last_record_id = await database.execute(query)
+        await database.execute(count_query)
+        await bump_post_version(comment.post_id)
+    await invalidate_post(comment.post_id)
     return {**data, "id": last_record_id}
 
 
+def select_comments_page(
+    post_id: int, limit: int, after: Optional[dict] = None
+) -> sqlalchemy.Select:
+    """Build a keyset query for one page of comments on a post, oldest first.
+
+    Like `select_posts_page`, one extra row is fetched to detect a next page.
+    """
+    query = (
+        comment_table.select()
+        .where(comment_table.c.post_id == post_id)
+        .order_by(comment_table.c.id.asc())
+        .limit(limit + 1)
+    )
+    if after:
+        query = query.where(comment_table.c.id > after["id"])
+    return query
+
+
+def decode_comments_cursor(post_id: int, cursor: Optional[str]) -> Optional[dict]:
+    if not cursor:
+        return None
+    after = decode_cursor(cursor, post_id=int, id=int)
+    if after["post_id"] != post_id:
+        raise HTTPException(status_code=400, detail="Cursor does not match post")
+    return after
+
+
+def paginate_comments(post_id: int, comments: list, limit: int) -> dict:
+    next_cursor = None
+    if len(comments) > limit:
+        comments = comments[:limit]
+        next_cursor = encode_cursor(post_id=post_id, id=comments[-1]["id"])
+    return {
+        "comments": [Comment.model_validate(c).model_dump() for c in comments],
+        "next_cursor": next_cursor,
+    }
+
+
 @router.get("/post/{post_id}/comment", response_model=list[Comment])
-async def get_comments_on_post(post_id: int):
+async def get_comments_on_post(
+    post_id: int,
+    request: Request,
+    response: Response,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: Optional[str] = None,
+):
     logger.info("Getting comments on post")
 
-    query = comment_table.select().where(comment_table.c.post_id == post_id)
+    after = decode_comments_cursor(post_id, cursor)
 
-    logger.debug(query)
+    version = await get_post_version(post_id)
+    if version is not None:
+        etag = make_etag(post_id, version, "comments", limit, cursor)
+        if not_modified := conditional_response(
+            request, response, "get_comments_on_post", etag
+        ):
+            return not_modified
 
-    return await database.fetch_all(query)
+    async def load_page() -> dict:
+        query = select_comments_page(post_id, limit, after)
 
+        logger.debug(query)
 
-@router.get("/post/{post_id}", response_model=UserPostWithComments)
-async def get_post_with_comments(post_id: int):
-    logger.info("Getting post and its comments")
+        comments = await database.fetch_all(query)
+        return paginate_comments(post_id, comments, limit)
 
-    query = select_post_and_likes.where(post_table.c.id == post_id)
+    key = await cache_key(
+        post_namespace(post_id), version, "comments", limit, cursor
+    )
+    page = await get_or_load(key, load_page)
+    if page["next_cursor"]:
+        response.headers[NEXT_CURSOR_HEADER] = page["next_cursor"]
+    return page["comments"]
 
-    logger.debug(query)
 
-    post = await database.fetch_one(query)
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
+@router.get("/post/{post_id}", response_model=UserPostWithComments)
+async def get_post_with_comments(
+    post_id: int,
+    request: Request,
+    response: Response,
+    comment_limit: Annotated[int, Query(ge=1, le=100)] = 20,
+):
+    logger.info("Getting post and its comments")
 
-    return {
-        "post": post,
-        "comments": await get_comments_on_post(post_id),
-    }
+    version = await get_post_version(post_id)
+    if version is not None:
+        etag = make_etag(post_id, version, "detail", comment_limit)
+        if not_modified := conditional_response(
+            request, response, "get_post_with_comments", etag
+        ):
+            return not_modified
+
+    async def load_post() -> dict:
+        # Fetch the post and the first page of its comments in one round trip
+        # by outer joining the post row against the (bounded) comments page.
+        # The post columns repeat on every row; a post without comments yields
+        # one row with NULL comment columns.
+        post = select_post_and_likes.where(post_table.c.id == post_id).subquery()
+        comments = select_comments_page(post_id, comment_limit).subquery()
+        query = (
+            sqlalchemy.select(
+                post,
+                comments.c.id.label("comment_id"),
+                comments.c.body.label("comment_body"),
+                comments.c.user_id.label("comment_user_id"),
+            )
+            .select_from(post.outerjoin(comments, sqlalchemy.true()))
+            .order_by(comments.c.id)
+        )
+
+        logger.debug(query)
+
+        rows = await database.fetch_all(query)
+        if not rows:
+            raise HTTPException(status_code=404, detail="Post not found")
+
+        comments = [
+            {
+                "id": row.comment_id,
+                "body": row.comment_body,
+                "post_id": post_id,
+                "user_id": row.comment_user_id,
+            }
+            for row in rows
+            if row.comment_id is not None
+        ]
+        return {
+            "post": UserPostWithLikes.model_validate(rows[0]).model_dump(),
+            **paginate_comments(post_id, comments, comment_limit),
+        }
+
+    key = await cache_key(post_namespace(post_id), version, "detail", comment_limit)
+    detail = await get_or_load(key, load_post)
+    if detail["next_cursor"]:
+        response.headers[NEXT_CURSOR_HEADER] = detail["next_cursor"]
+    return detail
+
+
+def update_like_count(post_id: int, delta: int):
+    return (
+        post_table.update()
+        .where(post_table.c.id == post_id)
+        .values(like_count=post_table.c.like_count + delta)
+    )
 
 
 @router.post("/like", response_model=PostLike, status_code=201)
 async def like_post(
-    like: PostLikeIn, current_user: Annotated[User, Depends(get_current_user)]
+    like: PostLikeIn,
+    current_user: Annotated[User, Depends(get_current_user_from_claims)],
+    response: Response,
 ):
     logger.info("Liking post")
 
+    if config.LIKE_BUFFER_ENABLED:
+        # Write-behind mode: no lookups here, the buffer checks that the posts
+        # exist when it flushes.
+        await like_buffer.add(like.post_id, current_user.id)
+        return JSONResponse(
+            status_code=202,
+            content={"post_id": like.post_id, "user_id": current_user.id},
+        )
+
     post = await find_post(like.post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
 
     data = {**like.model_dump(), "user_id": current_user.id}
-    query = like_table.insert().values(data)
+    # Liking twice is a no-op: the unique (post_id, user_id) index turns the
+    # insert into nothing and the existing like is returned instead.
+    query = (
+        sqlite.insert(like_table)
+        .values(data)
+        .on_conflict_do_nothing(index_elements=["post_id", "user_id"])
+        .returning(like_table.c.id)
+    )
 
     logger.debug(query)
 
-    last_record_id = await database.execute(query)
+    async with database.transaction():
+        last_record_id = await database.fetch_val(query)
+        if last_record_id is not None:
+            await database.execute(update_like_count(like.post_id, 1))
+            await bump_post_version(like.post_id)
+
+    if last_record_id is not None:
+        await invalidate_post(like.post_id)
+    else:
+        response.status_code = 200
+        last_record_id = await database.fetch_val(
+            sqlalchemy.select(like_table.c.id).where(
+                like_table.c.post_id == like.post_id,
+                like_table.c.user_id == current_user.id,
+            )
+        )
     return {**data, "id": last_record_id}
+
+
+@router.delete("/post/{post_id}/like", status_code=204)
+async def unlike_post(
+    post_id: int,
+    current_user: Annotated[User, Depends(get_current_user_from_claims)],
+):
+    logger.info("Unliking post")
+
+    like_buffer.discard(post_id, current_user.id)
+
+    post = await find_post(post_id)
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not found")
+
+    query = (
+        like_table.delete()
+        .where(
+            like_table.c.post_id == post_id, like_table.c.user_id == current_user.id
+        )
+        .returning(like_table.c.id)
+    )
+
+    logger.debug(query)
+
+    async with database.transaction():
+        deleted_id = await database.fetch_val(query)
+        if deleted_id is not None:
+            await database.execute(update_like_count(post_id, -1))
+            await bump_post_version(post_id)
+
+    if deleted_id is not None:
+        await invalidate_post(post_id)
+
+
+# Batch writes validate every referenced post with one IN query and insert all
+# valid items with one multi-row statement inside a single transaction. The
+# response has one BatchItemResult per item, in request order.
+
+POST_NOT_FOUND = {"status_code": 404, "detail": "Post not found"}
+
+
+@router.post("/post/batch", response_model=list[BatchItemResult])
+async def create_posts_batch(
+    posts: Annotated[
+        list[UserPostIn], Body(min_length=1, max_length=MAX_BATCH_SIZE)
+    ],
+    current_user: Annotated[User, Depends(get_current_user_from_claims)],
+):
+    logger.info(f"Creating batch of {len(posts)} posts")
+
+    rows = [{**post.model_dump(), "user_id": current_user.id} for post in posts]
+    query = post_table.insert().values(rows).returning(post_table.c.id)
+
+    logger.debug(query)
+
+    async with database.transaction():
+        inserted = await database.fetch_all(query)
+        await bump_version(POSTS_VERSION)
+    await invalidate(POSTS_NAMESPACE)
+
+    # RETURNING order is unspecified, but the ids are assigned in VALUES order.
+    ids = sorted(row.id for row in inserted)
+    return [{"status_code": 201, "id": record_id} for record_id in ids]
+
+
+@router.post("/comment/batch", response_model=list[BatchItemResult])
+async def create_comments_batch(
+    comments: Annotated[
+        list[CommentIn], Body(min_length=1, max_length=MAX_BATCH_SIZE)
+    ],
+    current_user: Annotated[User, Depends(get_current_user_from_claims)],
+):
+    logger.info(f"Creating batch of {len(comments)} comments")
+
+    existing = await find_existing_post_ids(c.post_id for c in comments)
+    valid = [comment for comment in comments if comment.post_id in existing]
+    if not valid:
+        return [POST_NOT_FOUND for _ in comments]
+
+    rows = [{**comment.model_dump(), "user_id": current_user.id} for comment in valid]
+    query = comment_table.insert().values(rows).returning(comment_table.c.id)
+    counts = Counter(comment.post_id for comment in valid)
+    count_query = (
+        post_table.update()
+        .where(post_table.c.id.in_(counts))
+        .values(
+            comment_count=post_table.c.comment_count
+            + sqlalchemy.case(counts, value=post_table.c.id)
+        )
+    )
+
+    logger.debug(query)
+
+    async with database.transaction():
+        inserted = await database.fetch_all(query)
+        await database.execute(count_query)
+        await bump_post_versions(counts)
+    await invalidate_posts(counts)
+
+    ids = iter(sorted(row.id for row in inserted))
+    return [
+        {"status_code": 201, "id": next(ids)}
+        if comment.post_id in existing
+        else POST_NOT_FOUND
+        for comment in comments
+    ]
+
+
+@router.post("/like/batch", response_model=list[BatchItemResult])
+async def like_posts_batch(
+    likes: Annotated[
+        list[PostLikeIn], Body(min_length=1, max_length=MAX_BATCH_SIZE)
+    ],
+    current_user: Annotated[User, Depends(get_current_user_from_claims)],
+):
+    logger.info(f"Liking batch of {len(likes)} posts")
+
+    existing = await find_existing_post_ids(like.post_id for like in likes)
+    post_ids = list(dict.fromkeys(like.post_id for like in likes))
+    post_ids = [post_id for post_id in post_ids if post_id in existing]
+    if not post_ids:
+        return [POST_NOT_FOUND for _ in likes]
+
+    # As with like_post, posts the user already liked are skipped by the
+    # unique index and reported with their existing like.
+    stored = await store_likes((post_id, current_user.id) for post_id in post_ids)
+    inserted = {post_id: like_id for (post_id, _), like_id in stored.items()}
+
+    like_ids = dict(inserted)
+    already_liked = [post_id for post_id in post_ids if post_id not in inserted]
+    if already_liked:
+        query = sqlalchemy.select(like_table.c.id, like_table.c.post_id).where(
+            like_table.c.user_id == current_user.id,
+            like_table.c.post_id.in_(already_liked),
+        )
+        rows = await database.fetch_all(query)
+        like_ids.update({row.post_id: row.id for row in rows})
+
+    results = []
+    created = set(inserted)
+    for like in likes:
+        if like.post_id not in existing:
+            results.append(POST_NOT_FOUND)
+        elif like.post_id in created:
+            created.discard(like.post_id)
+            results.append({"status_code": 201, "id": like_ids[like.post_id]})
+        else:
+            results.append({"status_code": 200, "id": like_ids[like.post_id]})
+    return results
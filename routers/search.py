@@ -0,0 +1,125 @@
+import logging
+import re
+from typing import Annotated, Optional
+
+import sqlalchemy
+from fastapi import APIRouter, HTTPException, Query, Response
+from storeapi.database import comment_table, database, post_table
+from storeapi.models.post import Comment, UserPostWithLikes
+from storeapi.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+
+router = APIRouter()
+
+logger = logging.getLogger(__name__)
+
+# A word, optionally followed by * to match it as a prefix.
+SEARCH_TERM = re.compile(r"(\w+)(\*?)")
+
+
+def build_match_query(q: str) -> str:
+    """Turn user input into an FTS5 query that requires every word.
+
+    Each word is quoted so that FTS5 operators and punctuation in the input
+    are never parsed as query syntax; a trailing * makes it a prefix query.
+    """
+    terms = [f'"{word}"{star}' for word, star in SEARCH_TERM.findall(q)]
+    if not terms:
+        raise HTTPException(status_code=400, detail="Search query has no words")
+    return " ".join(terms)
+
+
+def decode_search_cursor(q: str, cursor: Optional[str]) -> Optional[dict]:
+    if not cursor:
+        return None
+    after = decode_cursor(cursor, q=str, rank=float, id=int)
+    if after["q"] != q:
+        raise HTTPException(status_code=400, detail="Cursor does not match query")
+    return after
+
+
+def select_matches(index: str, q: str, after: Optional[dict]):
+    """Ids and BM25 ranks of the rows of `index` matching `q`, after the
+    (rank, id) keyset position of the previous page. Lower ranks are better.
+    """
+    fts = sqlalchemy.table(
+        index,
+        sqlalchemy.column(index),
+        sqlalchemy.column("rowid"),
+        sqlalchemy.column("rank"),
+    )
+    query = sqlalchemy.select(fts.c.rowid.label("id"), fts.c.rank).where(
+        fts.c[index].match(build_match_query(q))
+    )
+    if after:
+        query = query.where(
+            sqlalchemy.or_(
+                fts.c.rank > after["rank"],
+                sqlalchemy.and_(fts.c.rank == after["rank"], fts.c.rowid > after["id"]),
+            )
+        )
+    return query.subquery()
+
+
+def select_search_page(
+    index: str, columns: list, q: str, limit: int, after: Optional[dict]
+):
+    """One page of search results, best match first, with one extra row to
+    tell whether there is a next page."""
+    matches = select_matches(index, q, after)
+    table = columns[0].table
+    return (
+        sqlalchemy.select(*columns, matches.c.rank)
+        .join_from(matches, table, table.c.id == matches.c.id)
+        .order_by(matches.c.rank, matches.c.id)
+        .limit(limit + 1)
+    )
+
+
+async def search_page(
+    index: str,
+    columns: list,
+    q: str,
+    limit: int,
+    cursor: Optional[str],
+    response: Response,
+) -> list:
+    after = decode_search_cursor(q, cursor)
+    query = select_search_page(index, columns, q, limit, after)
+
+    logger.debug(query)
+
+    rows = await database.fetch_all(query)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            q=q, rank=last.rank, id=last.id
+        )
+    return rows
+
+
+@router.get("/search", response_model=list[UserPostWithLikes])
+async def search_posts(
+    response: Response,
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: Optional[str] = None,
+):
+    logger.info("Searching posts")
+
+    columns = [*post_table.c, post_table.c.like_count.label("likes")]
+    return await search_page("posts_fts", columns, q, limit, cursor, response)
+
+
+@router.get("/search/comments", response_model=list[Comment])
+async def search_comments(
+    response: Response,
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: Optional[str] = None,
+):
+    logger.info("Searching comments")
+
+    return await search_page(
+        "comments_fts", list(comment_table.c), q, limit, cursor, response
+    )
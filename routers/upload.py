@@ -1,32 +1,119 @@
 import logging
-import tempfile
+from typing import AsyncIterator
 
-import aiofiles
-from fastapi import APIRouter, HTTPException, UploadFile, status
-from storeapi.libs.b2 import b2_upload_file
+from fastapi import APIRouter, HTTPException, Request, status
+from storeapi.uploads import create_upload
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart before 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-CHUNK_SIZE = 1024 * 1024
+UPLOAD_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+
+async def iter_form_file(
+    request: Request, field_name: str
+) -> AsyncIterator[tuple[str, bytes]]:
+    """Yield the filename and data of the file in form field `field_name` of
+    a multipart request, piece by piece as the body arrives, starting with an
+    empty piece. Unlike UploadFile, nothing is spooled to memory or disk
+    first."""
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    if b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart form")
+
+    part = {}
+    filename = None
+    pieces = []
+
+    def on_part_begin():
+        part.clear()
+        part["headers"] = {}
+        part["header_name"] = b""
+        part["header_value"] = b""
+
+    def on_header_field(data: bytes, start: int, end: int):
+        part["header_name"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        part["header_value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["header_name"].lower()] = part["header_value"]
+        part["header_name"] = b""
+        part["header_value"] = b""
+
+    def on_headers_finished():
+        nonlocal filename
+        disposition = part["headers"].get(b"content-disposition", b"")
+        _, options = parse_options_header(disposition)
+        is_file = options.get(b"name") == field_name.encode() and b"filename" in options
+        # Only the first file in the field.
+        if is_file and filename is None:
+            filename = options[b"filename"].decode()
+            part["is_file"] = True
+            pieces.append(b"")
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if part.get("is_file"):
+            pieces.append(data[start:end])
+
+    parser = MultipartParser(
+        params[b"boundary"],
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+        },
+    )
+    async for chunk in request.stream():
+        parser.write(chunk)
+        for piece in pieces:
+            yield filename, piece
+        pieces.clear()
+    if filename is None:
+        raise HTTPException(status_code=400, detail=f"No file in '{field_name}'")
 
 
-@router.post("/upload", status_code=201)
-async def upload_file(file: UploadFile):
+@router.post("/upload", status_code=201, openapi_extra=UPLOAD_FORM_SCHEMA)
+async def upload_file(request: Request):
+    upload = None
     try:
-        with tempfile.NamedTemporaryFile() as temp_file:
-            filename = temp_file.name
-            logger.info(f"Saving uploaded file temporarily to {filename}")
-            async with aiofiles.open(filename, "wb") as f:
-                while chunk := await file.read(CHUNK_SIZE):
-                    await f.write(chunk)
-
-            file_url = b2_upload_file(local_file=filename, file_name=file.filename)
+        async for filename, data in iter_form_file(request, "file"):
+            if upload is None:
+                upload = create_upload(filename)
+            await upload.write(data)
+        file_url = await upload.finish()
+    except HTTPException:
+        raise
     except Exception:
+        logger.exception("Could not upload file to B2")
+        if upload is not None:
+            await upload.abort()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="There was an error uploading the file",
         )
 
-    return {"detail": f"Successfully uploaded {file.filename}", "file_url": file_url}
+    return {"detail": f"Successfully uploaded {upload.file_name}", "file_url": file_url}
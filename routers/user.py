@@ -1,62 +1,109 @@
 import logging
 
-from fastapi import APIRouter, HTTPException, Depends, Request, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, Request
 import logging
 from typing import Annotated
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.dialects import sqlite
 
 from database import user_table, database
-from models.user import UserIn
+from models.user import User, UserIn
+from storeapi.jobs import job_queue
+from storeapi.ratelimit import check_login_rate, client_ip
 from storeapi.security import (
 	authenticate_user,
 	create_access_token,
 	create_confirmation_token,
-	get_password_hash,
-	get_user,
+	decode_token,
+	get_current_user_from_claims,
 	get_subject_for_token_type,
+	hash_password,
+	invalidate_user,
+	oauth2_scheme,
+	revoke_token,
+	revoke_user_tokens,
 )
-from tasks import send_user_registration_email
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.post("/register", status_code=201)
-async def register(user: UserIn, background_tasks: BackgroundTasks, request: Request):
-	if await get_user(user.email):
-		raise HTTPException(status_code=400, detail="Email already exists")
-
-	hashed_password = get_password_hash(user.password)
-	query = user_table.insert().values(email=user.email, password=hashed_password, confirmed=False)
-	last_record_id = await database.execute(query)
-
-	# send confirmation email
+async def register(user: UserIn, request: Request):
+	hashed_password = await hash_password(user.password)
+	# One statement: the unique email constraint turns a second registration,
+	# even a concurrent one, into no row rather than an IntegrityError.
+	query = (
+		sqlite.insert(user_table)
+		.values(email=user.email, password=hashed_password, confirmed=False)
+		.on_conflict_do_nothing(index_elements=["email"])
+		.returning(user_table.c.id)
+	)
 	token = create_confirmation_token(user.email)
 	confirm_url = str(request.base_url) + f"confirm/{token}"
-	background_tasks.add_task(send_user_registration_email, user.email, confirmation_url=confirm_url)
-	
+	# The confirmation email job is stored with the user, so neither is
+	# kept without the other.
+	async with database.transaction():
+		last_record_id = await database.fetch_val(query)
+		if last_record_id is None:
+			raise HTTPException(status_code=400, detail="Email already exists")
+		await job_queue.store(
+			"send_user_registration_email",
+			email=user.email,
+			confirmation_url=confirm_url,
+		)
+	job_queue.wake("send_user_registration_email")
+	# Drop a cached "unknown user" entry for this email.
+	await invalidate_user(user.email)
+
 	logger.debug(f"User registered with ID: {last_record_id}")
 	return {"detail": "User created. Please confirm your email."}
 
 
 @router.post("/token")
-async def login(user: UserIn):
+async def login(user: UserIn, request: Request):
+	await check_login_rate(user.email, client_ip(request))
 	user = await authenticate_user(user.email, user.password)
-	access_token = create_access_token(user.email)
+	access_token = create_access_token(user.email, user.id, user.token_version)
 	return {"access_token": access_token, "token_type": "bearer"}
 
 
 @router.post("/token-form")
-async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
+async def login_for_access_token(
+	form_data: Annotated[OAuth2PasswordRequestForm, Depends()], request: Request
+):
+	await check_login_rate(form_data.username, client_ip(request))
 	user = await authenticate_user(form_data.username, form_data.password)
-	access_token = create_access_token(form_data.username)
+	access_token = create_access_token(user.email, user.id, user.token_version)
 	return {"access_token": access_token, "token_type": "bearer"}
 
 
+@router.post("/logout")
+async def logout(
+	current_user: Annotated[User, Depends(get_current_user_from_claims)],
+	token: Annotated[str, Depends(oauth2_scheme)],
+):
+	if not await revoke_token(decode_token(token, "access")):
+		raise HTTPException(
+			status_code=400,
+			detail="Token cannot be revoked on its own, use /token/revoke-all",
+		)
+	return {"detail": "Logged out"}
+
+
+@router.post("/token/revoke-all")
+async def revoke_all_tokens(
+	current_user: Annotated[User, Depends(get_current_user_from_claims)],
+):
+	await revoke_user_tokens(current_user.id, current_user.email)
+	return {"detail": "All access tokens revoked"}
+
+
 @router.post("/confirm")
 async def confirm_email(token: str):
 	email = get_subject_for_token_type(token, "confirmation")
 	query = user_table.update().where(user_table.c.email == email).values(confirmed=True)
 	await database.execute(query)
+	await invalidate_user(email)
 	return {"detail": "User confirmed"}
 
 
@@ -65,4 +112,5 @@ async def confirm_email_path(token: str):
 	email = get_subject_for_token_type(token, "confirmation")
 	query = user_table.update().where(user_table.c.email == email).values(confirmed=True)
 	await database.execute(query)
+	await invalidate_user(email)
 	return {"detail": "User confirmed"}
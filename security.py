@@ -1,19 +1,104 @@
 import datetime
+import hashlib
 import logging
-from typing import Annotated, Literal
+import time
+import uuid
+from typing import Annotated, Literal, Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import ExpiredSignatureError, JWTError, jwt
 from passlib.context import CryptContext
+import sqlalchemy
+from storeapi.cache import MemoryCache
+from storeapi.config import config
 from storeapi.database import database, user_table
+from storeapi.executors import BoundedExecutor
+from storeapi.metrics import register_metrics
+from storeapi.models.user import User
+from storeapi.revocation import revocation_list
 
 logger = logging.getLogger(__name__)
 
 SECRET_KEY = "9b73f2a1bdd7ae163444473d29a6885ffa22ab26117068f72a5a56a74d12d1fc"
 ALGORITHM = "HS256"
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"])
+
+
+def create_password_context() -> CryptContext:
+	"""The first of PASSWORD_HASH_SCHEMES hashes new passwords, the others are
+	only accepted. PASSWORD_HASH_ROUNDS pins the rounds of a scheme. Hashes
+	in another scheme or with other rounds are upgraded on the next login."""
+	options = {}
+	for scheme, rounds in config.PASSWORD_HASH_ROUNDS.items():
+		for setting in ("default_rounds", "min_rounds", "max_rounds"):
+			options[f"{scheme}__{setting}"] = rounds
+	return CryptContext(
+		schemes=config.PASSWORD_HASH_SCHEMES, deprecated="auto", **options
+	)
+
+
+pwd_context = create_password_context()
+
+# Hashing blocks for tens of milliseconds, so handlers hash through this pool
+# instead of on the event loop. pbkdf2 releases the GIL, so threads scale.
+password_hasher = BoundedExecutor(
+	"password_hasher",
+	kind=config.PASSWORD_HASH_EXECUTOR,
+	max_workers=config.PASSWORD_HASH_WORKERS,
+)
+register_metrics("password_hasher", password_hasher.stats)
+
+# Users loaded by get_current_user, keyed by email. Unknown emails are cached
+# as well, for a shorter time, so requests carrying a token for a user that
+# does not exist do not reach the database every time. Anything that changes
+# a user must call invalidate_user; other processes see the change once the
+# entry expires.
+user_cache = MemoryCache(
+	max_entries=config.USER_CACHE_MAX_ENTRIES, ttl=config.USER_CACHE_TTL_SECONDS
+)
+_UNKNOWN_USER = object()
+_user_lookups = {"hits": 0, "negative_hits": 0, "misses": 0}
+
+
+def user_cache_stats() -> dict:
+	total = _user_lookups["hits"] + _user_lookups["misses"]
+	return {
+		**_user_lookups,
+		"hit_rate": _user_lookups["hits"] / total if total else 0.0,
+		**user_cache.stats(),
+	}
+
+
+register_metrics("user_cache", user_cache_stats)
+
+# Current token version per user id, for get_current_user_from_claims. A
+# revoked token stays usable in other processes until their entry expires.
+token_version_cache = MemoryCache(
+	max_entries=config.USER_CACHE_MAX_ENTRIES,
+	ttl=config.TOKEN_VERSION_CACHE_TTL_SECONDS,
+)
+register_metrics("token_version_cache", token_version_cache.stats)
+
+# Claims of tokens that passed verification, keyed by a digest of the token,
+# so a token reused for its whole lifetime is only verified once per process.
+# Entries expire at the token's own "exp".
+verified_token_cache = MemoryCache(
+	max_entries=config.VERIFIED_TOKEN_CACHE_MAX_ENTRIES, ttl=0
+)
+_token_lookups = {"hits": 0, "misses": 0}
+
+
+def verified_token_cache_stats() -> dict:
+	total = _token_lookups["hits"] + _token_lookups["misses"]
+	return {
+		**_token_lookups,
+		"hit_rate": _token_lookups["hits"] / total if total else 0.0,
+		**verified_token_cache.stats(),
+	}
+
+
+register_metrics("verified_token_cache", verified_token_cache_stats)
 
 
 def create_credentials_exception(detail: str) -> HTTPException:
@@ -32,12 +117,20 @@ def confirm_token_expire_minutes() -> int:
 	return 1440
 
 
-def create_access_token(email: str):
+def create_access_token(
+	email: str, user_id: Optional[int] = None, token_version: int = 0
+):
+	"""Tokens created with a `user_id` carry it as the "uid" claim together
+	with the user's token version as "ver", which lets
+	get_current_user_from_claims skip loading the user. Every token gets a
+	random "jti" claim, by which it can be revoked on its own."""
 	logger.debug("Creating access token", extra={"email": email})
 	expire = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
 		minutes=access_token_expire_minutes()
 	)
-	jwt_data = {"sub": email, "exp": expire, "type": "access"}
+	jwt_data = {"sub": email, "exp": expire, "type": "access", "jti": uuid.uuid4().hex}
+	if user_id is not None:
+		jwt_data.update(uid=user_id, ver=token_version)
 	encoded_jwt = jwt.encode(jwt_data, key=SECRET_KEY, algorithm=ALGORITHM)
 	return encoded_jwt
 
@@ -52,9 +145,19 @@ def create_confirmation_token(email: str):
 	return encoded_jwt
 
 
-def get_subject_for_token_type(
-	token: str, type: Literal["access", "confirmation"]
-) -> str:
+def verify_token(token: str) -> dict:
+	"""Check the signature and expiry of `token` and return its claims.
+
+	The claims are memoized in verified_token_cache until the token expires.
+	Tokens that fail verification are not cached.
+	"""
+	key = hashlib.sha256(token.encode()).hexdigest()
+	payload = verified_token_cache.get_nowait(key)
+	if payload is not None:
+		_token_lookups["hits"] += 1
+		return payload
+
+	_token_lookups["misses"] += 1
 	try:
 		payload = jwt.decode(token, key=SECRET_KEY, algorithms=[ALGORITHM])
 	except ExpiredSignatureError as e:
@@ -62,8 +165,17 @@ def get_subject_for_token_type(
 	except JWTError as e:
 		raise create_credentials_exception("Invalid token") from e
 
-	email = payload.get("sub")
-	if email is None:
+	expires_in = payload.get("exp", 0) - time.time()
+	if expires_in > 0:
+		verified_token_cache.set_nowait(key, payload, ttl=expires_in)
+	return payload
+
+
+def decode_token(token: str, type: Literal["access", "confirmation"]) -> dict:
+	"""Verify `token` and return its claims, checking its type and subject."""
+	payload = verify_token(token)
+
+	if payload.get("sub") is None:
 		raise create_credentials_exception("Token is missing 'sub' field")
 
 	token_type = payload.get("type")
@@ -72,7 +184,13 @@ def get_subject_for_token_type(
 			f"Token has incorrect type, expected '{type}'"
 		)
 
-	return email
+	return payload
+
+
+def get_subject_for_token_type(
+	token: str, type: Literal["access", "confirmation"]
+) -> str:
+	return decode_token(token, type)["sub"]
 
 
 def get_password_hash(password: str) -> str:
@@ -83,6 +201,23 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 	return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(
+	plain_password: str, hashed_password: str
+) -> tuple[bool, Optional[str]]:
+	"""Verify the password and, if its hash is outdated, return a new one."""
+	return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+async def hash_password(password: str) -> str:
+	"""`get_password_hash` in the password hashing pool."""
+	return await password_hasher.run(get_password_hash, password)
+
+
+async def check_password(plain_password: str, hashed_password: str) -> bool:
+	"""`verify_password` in the password hashing pool."""
+	return await password_hasher.run(verify_password, plain_password, hashed_password)
+
+
 async def get_user(email: str):
 	logger.debug("Fetching user from the database", extra={"email": email})
 	query = user_table.select().where(user_table.c.email == email)
@@ -91,21 +226,143 @@ async def get_user(email: str):
 		return result
 
 
+async def get_cached_user(email: str):
+	"""`get_user` through the user cache."""
+	user = await user_cache.get(email)
+	if user is not None:
+		_user_lookups["hits"] += 1
+		if user is _UNKNOWN_USER:
+			_user_lookups["negative_hits"] += 1
+			return None
+		return user
+
+	_user_lookups["misses"] += 1
+	user = await get_user(email)
+	if user is None:
+		await user_cache.set(
+			email, _UNKNOWN_USER, ttl=config.USER_CACHE_NEGATIVE_TTL_SECONDS
+		)
+	else:
+		await user_cache.set(email, user)
+	return user
+
+
+async def invalidate_user(email: str) -> None:
+	logger.debug("Invalidating cached user", extra={"email": email})
+	await user_cache.delete(email)
+
+
+async def update_password_hash(user, new_hash: str) -> None:
+	logger.debug("Upgrading password hash", extra={"email": user.email})
+	# Only replace the hash that was verified, in case the password changed.
+	query = (
+		user_table.update()
+		.where(user_table.c.id == user.id, user_table.c.password == user.password)
+		.values(password=new_hash)
+	)
+	await database.execute(query)
+	await invalidate_user(user.email)
+
+
 async def authenticate_user(email: str, password: str):
 	logger.debug("Authenticating user", extra={"email": email})
 	user = await get_user(email)
 	if not user:
 		raise create_credentials_exception("Could not validate credentials")
-	if not verify_password(password, user.password):
+	valid, new_hash = await password_hasher.run(
+		verify_and_update_password, password, user.password
+	)
+	if not valid:
 		raise create_credentials_exception("Could not validate credentials")
+	if new_hash:
+		await update_password_hash(user, new_hash)
 	if not user.confirmed:
 		raise create_credentials_exception("User has not confirmed email")
 	return user
 
 
+def create_revoked_token_exception() -> HTTPException:
+	return create_credentials_exception("Token has been revoked")
+
+
+async def check_token_not_revoked(claims: dict) -> None:
+	"""Raise if the token with these claims was revoked by revoke_token.
+
+	Almost always answered by the revocation list's Bloom filter alone.
+	Tokens without a "jti" claim can only be revoked by revoke_user_tokens.
+	"""
+	jti = claims.get("jti")
+	if jti is not None and await revocation_list.is_revoked(jti):
+		raise create_revoked_token_exception()
+
+
+async def revoke_token(claims: dict) -> bool:
+	"""Revoke the token with these claims until it expires. Returns False for
+	tokens without a "jti" claim, which cannot be revoked on their own."""
+	jti = claims.get("jti")
+	if jti is None:
+		return False
+	logger.debug("Revoking access token", extra={"email": claims.get("sub")})
+	await revocation_list.revoke(jti, int(claims["exp"]))
+	return True
+
+
 async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
-	email = get_subject_for_token_type(token, "access")
-	user = await get_user(email=email)
+	claims = decode_token(token, "access")
+	await check_token_not_revoked(claims)
+	user = await get_cached_user(claims["sub"])
 	if user is None:
 		raise create_credentials_exception("Could not find user for this token")
+	if "ver" in claims and claims["ver"] != user.token_version:
+		raise create_revoked_token_exception()
 	return user
+
+
+async def get_token_version(user_id: int) -> Optional[int]:
+	"""The user's current token version, or None if there is no such user."""
+	version = await token_version_cache.get(str(user_id))
+	if version is None:
+		query = sqlalchemy.select(user_table.c.token_version).where(
+			user_table.c.id == user_id
+		)
+		version = await database.fetch_val(query)
+		if version is not None:
+			await token_version_cache.set(str(user_id), version)
+	return version
+
+
+async def get_current_user_from_claims(
+	token: Annotated[str, Depends(oauth2_scheme)],
+) -> User:
+	"""Like get_current_user, but builds the user from the token's claims.
+
+	Only the user's token version is looked up, and that is usually cached.
+	Tokens issued without a "uid" claim fall back to get_current_user.
+	"""
+	claims = decode_token(token, "access")
+	user_id = claims.get("uid")
+	if user_id is None:
+		return await get_current_user(token)
+	if not isinstance(user_id, int):
+		raise create_credentials_exception("Invalid token")
+	await check_token_not_revoked(claims)
+
+	version = await get_token_version(user_id)
+	if version is None:
+		raise create_credentials_exception("Could not find user for this token")
+	if claims.get("ver") != version:
+		raise create_revoked_token_exception()
+	return User(id=user_id, email=claims["sub"])
+
+
+async def revoke_user_tokens(user_id: int, email: str) -> None:
+	"""Revoke every access token issued to the user so far."""
+	logger.debug("Revoking user tokens", extra={"email": email})
+	query = (
+		user_table.update()
+		.where(user_table.c.id == user_id)
+		.values(token_version=user_table.c.token_version + 1)
+	)
+	await database.execute(query)
+	await token_version_cache.delete(str(user_id))
+	await invalidate_user(email)
@@ -0,0 +1,2 @@
+# Re-export breakers under storeapi namespace
+from breakers import *  # noqa: F401,F403
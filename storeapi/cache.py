@@ -0,0 +1,2 @@
+# Re-export the read-through cache under storeapi namespace
+from cache import *  # noqa: F401,F403
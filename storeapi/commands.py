@@ -0,0 +1,2 @@
+# Re-export maintenance commands under storeapi namespace
+from commands import *  # noqa: F401,F403
@@ -0,0 +1,2 @@
+# Re-export conditional request helpers under storeapi namespace
+from conditional import *  # noqa: F401,F403
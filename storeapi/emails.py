@@ -0,0 +1,2 @@
+# Re-export the email dispatcher under storeapi namespace
+from emails import *  # noqa: F401,F403
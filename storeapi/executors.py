@@ -0,0 +1,2 @@
+# Re-export the bounded executors under storeapi namespace
+from executors import *  # noqa: F401,F403
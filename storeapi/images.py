@@ -0,0 +1,2 @@
+# Re-export images under storeapi namespace
+from images import *  # noqa: F401,F403
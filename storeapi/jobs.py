@@ -0,0 +1,2 @@
+# Re-export the job queue under storeapi namespace
+from jobs import *  # noqa: F401,F403
@@ -0,0 +1,2 @@
+# Re-export like storage and the write-behind buffer under storeapi namespace
+from likes import *  # noqa: F401,F403
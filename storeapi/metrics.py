@@ -0,0 +1,2 @@
+# Re-export metrics registry under storeapi namespace
+from metrics import *  # noqa: F401,F403
@@ -0,0 +1,2 @@
+# Re-export pagination helpers under storeapi namespace
+from pagination import *  # noqa: F401,F403
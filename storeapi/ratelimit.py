@@ -0,0 +1,2 @@
+# Re-export the rate limiter under storeapi namespace
+from ratelimit import *  # noqa: F401,F403
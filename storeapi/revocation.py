@@ -0,0 +1,2 @@
+# Re-export revocation under storeapi namespace
+from revocation import *  # noqa: F401,F403
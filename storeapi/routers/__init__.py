@@ -2,5 +2,7 @@
 from routers.post import *  # noqa: F401,F403
 from routers.user import *  # noqa: F401,F403
 from routers.upload import *  # noqa: F401,F403
+from routers.metrics import *  # noqa: F401,F403
+from routers.search import *  # noqa: F401,F403
 
 
@@ -0,0 +1 @@
+from routers.metrics import *  # noqa: F401,F403
@@ -0,0 +1 @@
+from routers.search import *  # noqa: F401,F403
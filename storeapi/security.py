@@ -1,4 +1,6 @@
 import datetime
+import uuid
+from typing import Optional
 from jose import jwt
 from security import *  # noqa: F401,F403
 from security import SECRET_KEY, ALGORITHM
@@ -15,11 +17,15 @@ def confirm_token_expire_minutes() -> int:  # type: ignore[override]
 	return _c()
 
 
-def create_access_token(email: str):  # type: ignore[override]
+def create_access_token(  # type: ignore[override]
+	email: str, user_id: Optional[int] = None, token_version: int = 0
+):
 	expire = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
 		minutes=access_token_expire_minutes()
 	)
-	jwt_data = {"sub": email, "exp": expire, "type": "access"}
+	jwt_data = {"sub": email, "exp": expire, "type": "access", "jti": uuid.uuid4().hex}
+	if user_id is not None:
+		jwt_data.update(uid=user_id, ver=token_version)
 	return jwt.encode(jwt_data, key=SECRET_KEY, algorithm=ALGORITHM)
 
 
@@ -1,12 +1,27 @@
 # Re-export tasks under storeapi namespace
+from typing import Optional
+
 import tasks as _orig
 from tasks import (
 	APIResponseError,
 	_generate_cute_creature_api,
+	close_http_client,
+	create_http_client,
+	deepai_breaker,
+	email_dispatcher,
+	mailgun_breaker,
+	open_http_client,
+	send_batch_email,
+	send_batched_email,
+	send_image_generation_failed_email,
 	send_simple_email,
+	send_user_registration_email,
+	use_http_client,
 )
 from databases import Database
+from storeapi.cache import invalidate_post
 from storeapi.database import post_table, database as _db
+from storeapi.versions import bump_post_version
 
 # Expose httpx for tests that patch 'storeapi.tasks.httpx.AsyncClient'
 httpx = _orig.httpx
@@ -14,45 +29,69 @@ httpx = _orig.httpx
 __all__ = [
 	"APIResponseError",
 	"_generate_cute_creature_api",
+	"add_generated_image_to_post",
+	"close_http_client",
+	"create_http_client",
+	"deepai_breaker",
+	"email_dispatcher",
 	"generate_and_add_to_post",
+	"mailgun_breaker",
+	"open_http_client",
+	"send_batch_email",
+	"send_batched_email",
+	"send_image_generation_failed_email",
 	"send_simple_email",
+	"send_user_registration_email",
+	"use_http_client",
 	"httpx",
 ]
 
 
-async def generate_and_add_to_post(
+async def add_generated_image_to_post(
 	email: str,
 	post_id: int,
 	post_url: str,
 	database: Database,
 	prompt: str = "A blue british shorthair cat is sitting on a couch",
+	client: Optional[httpx.AsyncClient] = None,
 ):
-	try:
-		response = await _generate_cute_creature_api(prompt)
-	except APIResponseError:
-		return await send_simple_email(
-			email,
-			"Error generating image",
-			(
-				f"Hi {email}! Unfortunately there was an error generating an image"
-				"for your post."
-			),
-		)
+	response = await _generate_cute_creature_api(prompt, client)
 
 	query = (
 		post_table.update()
 		.where(post_table.c.id == post_id)
 		.values(image_url=response["output_url"])
 	)
-	await database.execute(query)
-	await send_simple_email(
+	async with database.transaction():
+		await database.execute(query)
+		await bump_post_version(post_id)
+	await invalidate_post(post_id)
+	await send_batched_email(
 		email,
 		"Image generation completed",
 		(
-			f"Hi {email}! Your image has been generated and added to your post."
-			f" Please click on the following link to view it: {post_url}"
+			"Hi %recipient.email%! Your image has been generated and added to your"
+			" post. Please click on the following link to view it:"
+			" %recipient.post_url%"
 		),
+		post_url=post_url,
 	)
 	return response
 
 
+async def generate_and_add_to_post(
+	email: str,
+	post_id: int,
+	post_url: str,
+	database: Database,
+	prompt: str = "A blue british shorthair cat is sitting on a couch",
+	client: Optional[httpx.AsyncClient] = None,
+):
+	try:
+		return await add_generated_image_to_post(
+			email, post_id, post_url, database, prompt, client
+		)
+	except APIResponseError:
+		return await send_image_generation_failed_email(email)
+
+
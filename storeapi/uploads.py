@@ -0,0 +1,2 @@
+# Re-export uploads under storeapi namespace
+from uploads import *  # noqa: F401,F403
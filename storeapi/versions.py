@@ -0,0 +1,2 @@
+# Re-export version counters under storeapi namespace
+from versions import *  # noqa: F401,F403
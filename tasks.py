@@ -1,30 +1,125 @@
+import json
 import logging
+from contextlib import asynccontextmanager
 from json import JSONDecodeError
+from typing import AsyncIterator, Optional
 
 import httpx
 from databases import Database
+from storeapi.breakers import CircuitBreaker, CircuitOpenError
+from storeapi.cache import invalidate_post
 from storeapi.config import config
 from storeapi.database import post_table
+from storeapi.emails import EmailDispatcher
+from storeapi.images import image_cache
+from storeapi.metrics import register_metrics
+from storeapi.versions import bump_post_version
 
 logger = logging.getLogger(__name__)
 
 
 class APIResponseError(Exception):
-    pass
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
 
 
-async def send_simple_email(to: str, subject: str, body: str):
-    logger.debug(f"Sending email to '{to[:3]}' with subject '{subject[:20]}'")
-    async with httpx.AsyncClient() as client:
+def _is_outage(err: BaseException) -> bool:
+    # A 4xx response other than 429 means our request was bad; the API is up.
+    status_code = getattr(err, "status_code", None)
+    return status_code is None or status_code >= 500 or status_code == 429
+
+
+# Each API gets its own breaker, so one that is down or slow fails fast and
+# holds at most its concurrency cap of our coroutines.
+deepai_breaker = CircuitBreaker(
+    "deepai",
+    max_concurrency=config.DEEPAI_MAX_CONCURRENCY,
+    deadline=config.DEEPAI_DEADLINE_SECONDS,
+    failure_threshold=config.CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=config.CIRCUIT_RESET_SECONDS,
+    is_failure=_is_outage,
+)
+mailgun_breaker = CircuitBreaker(
+    "mailgun",
+    max_concurrency=config.MAILGUN_MAX_CONCURRENCY,
+    deadline=config.MAILGUN_DEADLINE_SECONDS,
+    failure_threshold=config.CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=config.CIRCUIT_RESET_SECONDS,
+    is_failure=_is_outage,
+)
+register_metrics("deepai_breaker", deepai_breaker.stats)
+register_metrics("mailgun_breaker", mailgun_breaker.stats)
+
+
+async def _call_guarded(breaker: CircuitBreaker, fn, *args):
+    """`breaker.call`, raising APIResponseError when it fails fast or the
+    call runs out of time, as for any other failed call."""
+    try:
+        return await breaker.call(fn, *args)
+    except CircuitOpenError as err:
+        raise APIResponseError(str(err)) from err
+    except TimeoutError as err:
+        raise APIResponseError(
+            f"{breaker.name} call took longer than {breaker.deadline:g}s"
+        ) from err
+
+
+# Shared by all outbound calls while the app runs, so they reuse pooled
+# keep-alive connections instead of connecting for every call. Opened and
+# closed by the app's lifespan.
+http_client: Optional[httpx.AsyncClient] = None
+
+
+def create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(
+            config.HTTP_TIMEOUT_SECONDS, connect=config.HTTP_CONNECT_TIMEOUT_SECONDS
+        ),
+    )
+
+
+async def open_http_client() -> None:
+    global http_client
+    if http_client is None:
+        http_client = create_http_client()
+
+
+async def close_http_client() -> None:
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+
+@asynccontextmanager
+async def use_http_client(
+    client: Optional[httpx.AsyncClient] = None,
+) -> AsyncIterator[httpx.AsyncClient]:
+    """`client` if given, else the shared client. Outside the app, when
+    there is no shared client, a client is created for this one call."""
+    client = client or http_client
+    if client is not None:
+        yield client
+    else:
+        async with create_http_client() as client:
+            yield client
+
+
+async def _post_to_mailgun(data: dict, client: Optional[httpx.AsyncClient] = None):
+    async with use_http_client(client) as client:
         try:
             response = await client.post(
-                f"https://api.mailgun.net/v3/{config.MAILGUN_DOMAIN}/messages",
+                f"{config.MAILGUN_API_URL}/{config.MAILGUN_DOMAIN}/messages",
                 auth=("api", config.MAILGUN_API_KEY),
                 data={
                     "from": f"Jose Salvatierra <mailgun@{config.MAILGUN_DOMAIN}>",
-                    "to": [to],
-                    "subject": subject,
-                    "text": body,
+                    **data,
                 },
             )
             response.raise_for_status()
@@ -34,28 +129,88 @@ async def send_simple_email(to: str, subject: str, body: str):
             return response
         except httpx.HTTPStatusError as err:
             raise APIResponseError(
-                f"API request failed with status code {err.response.status_code}"
+                f"API request failed with status code {err.response.status_code}",
+                err.response.status_code,
             ) from err
 
 
+async def send_simple_email(
+    to: str, subject: str, body: str, client: Optional[httpx.AsyncClient] = None
+):
+    logger.debug(f"Sending email to '{to[:3]}' with subject '{subject[:20]}'")
+    data = {"to": [to], "subject": subject, "text": body}
+    return await _call_guarded(mailgun_breaker, _post_to_mailgun, data, client)
+
+
+async def send_batch_email(
+    subject: str,
+    template: str,
+    recipients: dict[str, dict],
+    client: Optional[httpx.AsyncClient] = None,
+):
+    """Send `template` to every recipient in one Mailgun request.
+
+    Mailgun sends each recipient a message of their own, with
+    `%recipient.<name>%` in the template replaced by their variables.
+    """
+    logger.debug(f"Sending {len(recipients)} emails with subject '{subject[:20]}'")
+    data = {
+        "to": list(recipients),
+        "subject": subject,
+        "text": template,
+        "recipient-variables": json.dumps(recipients),
+    }
+    return await _call_guarded(mailgun_breaker, _post_to_mailgun, data, client)
+
+
+# Emails sent within a short window of each other go out in one batch request.
+email_dispatcher = EmailDispatcher(
+    send_batch_email,
+    batch_size=config.EMAIL_BATCH_SIZE,
+    window=config.EMAIL_BATCH_WINDOW_SECONDS,
+    max_pending=config.EMAIL_MAX_PENDING,
+)
+register_metrics("email_dispatcher", email_dispatcher.stats)
+
+
+async def send_batched_email(to: str, subject: str, template: str, **variables):
+    """Send an email through email_dispatcher. The template can refer to
+    `%recipient.email%` and to each of `variables` as `%recipient.<name>%`."""
+    await email_dispatcher.send(to, subject, template, {"email": to, **variables})
+
+
 async def send_user_registration_email(email: str, confirmation_url: str):
-    return await send_simple_email(
+    return await send_batched_email(
         email,
         "Successfully signed up",
         (
-            f"Hi {email}! You have successfully signed up to the Stores REST API."
-            " Please confirm your email by clicking on the"
-            f" following link: {confirmation_url}"
+            "Hi %recipient.email%! You have successfully signed up to the Stores"
+            " REST API. Please confirm your email by clicking on the"
+            " following link: %recipient.confirmation_url%"
         ),
+        confirmation_url=confirmation_url,
+    )
+
+
+async def _generate_cute_creature_api(
+    prompt: str, client: Optional[httpx.AsyncClient] = None
+):
+    """Generate an image for `prompt`, or reuse the one generated for the
+    same prompt before; see images.ImageCache."""
+    return await image_cache.get_or_generate(
+        prompt,
+        lambda: _call_guarded(deepai_breaker, _call_cute_creature_api, prompt, client),
     )
 
 
-async def _generate_cute_creature_api(prompt: str):
+async def _call_cute_creature_api(
+    prompt: str, client: Optional[httpx.AsyncClient] = None
+):
     logger.debug("Generating cute creature")
-    async with httpx.AsyncClient() as client:
+    async with use_http_client(client) as client:
         try:
             response = await client.post(
-                "https://api.deepai.org/api/cute-creature-generator",
+                f"{config.DEEPAI_API_URL}/cute-creature-generator",
                 data={"text": prompt},
                 headers={"api-key": config.DEEPAI_API_KEY},
                 timeout=60,
@@ -65,30 +220,35 @@ async def _generate_cute_creature_api(prompt: str):
             return response.json()
         except httpx.HTTPStatusError as err:
             raise APIResponseError(
-                f"API request failed with status code {err.response.status_code}"
+                f"API request failed with status code {err.response.status_code}",
+                err.response.status_code,
             ) from err
         except (JSONDecodeError, TypeError) as err:
             raise APIResponseError("API response parsing failed") from err
 
 
-async def generate_and_add_to_post(
+async def send_image_generation_failed_email(email: str):
+    return await send_batched_email(
+        email,
+        "Error generating image",
+        (
+            "Hi %recipient.email%! Unfortunately there was an error generating"
+            " an image for your post."
+        ),
+    )
+
+
+async def add_generated_image_to_post(
     email: str,
     post_id: int,
     post_url: str,
     database: Database,
     prompt: str = "A blue british shorthair cat is sitting on a couch",
+    client: Optional[httpx.AsyncClient] = None,
 ):
-    try:
-        response = await _generate_cute_creature_api(prompt)
-    except APIResponseError:
-        return await send_simple_email(
-            email,
-            "Error generating image",
-            (
-                f"Hi {email}! Unfortunately there was an error generating an image"
-                "for your post."
-            ),
-        )
+    """Like generate_and_add_to_post, but raises APIResponseError instead of
+    emailing about it, so that a job can retry."""
+    response = await _generate_cute_creature_api(prompt, client)
 
     logger.debug("Connecting to database to update post")
 
@@ -100,16 +260,37 @@ async def generate_and_add_to_post(
 
     logger.debug(query)
 
-    await database.execute(query)
+    async with database.transaction():
+        await database.execute(query)
+        await bump_post_version(post_id)
+    await invalidate_post(post_id)
 
     logger.debug("Database connection in background task closed")
 
-    await send_simple_email(
+    await send_batched_email(
         email,
         "Image generation completed",
         (
-            f"Hi {email}! Your image has been generated and added to your post."
-            f" Please click on the following link to view it: {post_url}"
+            "Hi %recipient.email%! Your image has been generated and added to your"
+            " post. Please click on the following link to view it:"
+            " %recipient.post_url%"
         ),
+        post_url=post_url,
     )
     return response
+
+
+async def generate_and_add_to_post(
+    email: str,
+    post_id: int,
+    post_url: str,
+    database: Database,
+    prompt: str = "A blue british shorthair cat is sitting on a couch",
+    client: Optional[httpx.AsyncClient] = None,
+):
+    try:
+        return await add_generated_image_to_post(
+            email, post_id, post_url, database, prompt, client
+        )
+    except APIResponseError:
+        return await send_image_generation_failed_email(email)
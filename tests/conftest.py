@@ -1,3 +1,5 @@
+import asyncio
+import contextlib
 import os
 from typing import AsyncGenerator, Generator
 from unittest.mock import AsyncMock, Mock
@@ -7,8 +9,17 @@ from fastapi.testclient import TestClient
 from httpx import AsyncClient, Request, Response
 
 os.environ["ENV_STATE"] = "test"
+from storeapi.cache import cache_backend  # noqa: E402
 from storeapi.database import database, user_table  # noqa: E402
 from storeapi.main import app  # noqa: E402
+from storeapi.ratelimit import rate_limit_store  # noqa: E402
+from storeapi.revocation import revocation_list  # noqa: E402
+from storeapi.security import (  # noqa: E402
+    token_version_cache,
+    user_cache,
+    verified_token_cache,
+)
+from storeapi.tasks import deepai_breaker, mailgun_breaker  # noqa: E402
 
 
 @pytest.fixture(scope="session")
@@ -28,6 +39,51 @@ async def db() -> AsyncGenerator:
     await database.disconnect()
 
 
+@pytest.fixture(autouse=True)
+def serialize_transactions(mocker):
+    # With force_rollback every task shares one connection, so transactions
+    # of concurrent requests would interleave their savepoints on it. Let one
+    # task at a time be in a transaction, as SQLite does across connections.
+    lock = asyncio.Lock()
+    owner = None
+    depth = 0
+    transaction = database.transaction
+
+    @contextlib.asynccontextmanager
+    async def serialized_transaction(*args, **kwargs):
+        nonlocal owner, depth
+        if owner is not asyncio.current_task():
+            await lock.acquire()
+            owner = asyncio.current_task()
+        depth += 1
+        try:
+            async with transaction(*args, **kwargs):
+                yield
+        finally:
+            depth -= 1
+            if depth == 0:
+                owner = None
+                lock.release()
+
+    mocker.patch.object(database, "transaction", serialized_transaction)
+
+
+@pytest.fixture(autouse=True)
+async def clear_cache() -> AsyncGenerator:
+    # The database is rolled back after every test, so cached reads and
+    # login rate limits and revoked tokens must go too, and failures seen by
+    # the circuit breakers must not fail fast in later tests.
+    yield
+    await cache_backend.clear()
+    await user_cache.clear()
+    await token_version_cache.clear()
+    await verified_token_cache.clear()
+    await rate_limit_store.clear()
+    await revocation_list.clear()
+    deepai_breaker.reset()
+    mailgun_breaker.reset()
+
+
 @pytest.fixture()
 async def async_client(client) -> AsyncGenerator:
     async with AsyncClient(app=app, base_url=client.base_url) as ac:
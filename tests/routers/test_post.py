@@ -1,7 +1,14 @@
+import json
+
 import pytest
 from httpx import AsyncClient
 
 from storeapi import security
+from storeapi.database import database, job_table, post_table
+from storeapi.jobs import FAILED, QUEUED, job_queue
+from storeapi.likes import like_buffer
+from storeapi.tasks import APIResponseError
+from storeapi.versions import bump_post_version
 
 
 async def create_post(
@@ -111,6 +118,69 @@ async def test_like_post(
     assert response.status_code == 201
 
 
+@pytest.mark.anyio
+async def test_like_post_updates_like_count(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    await like_post(created_post["id"], async_client, logged_in_token)
+
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()["post"]["likes"] == 1
+
+
+@pytest.mark.anyio
+async def test_like_post_twice(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    first = await like_post(created_post["id"], async_client, logged_in_token)
+    response = await async_client.post(
+        "/like",
+        json={"post_id": created_post["id"]},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == first
+
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()["post"]["likes"] == 1
+
+
+@pytest.mark.anyio
+async def test_unlike_post(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    await like_post(created_post["id"], async_client, logged_in_token)
+
+    for _ in range(2):
+        response = await async_client.delete(
+            f"/post/{created_post['id']}/like",
+            headers={"Authorization": f"Bearer {logged_in_token}"},
+        )
+        assert response.status_code == 204
+
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()["post"]["likes"] == 0
+
+
+@pytest.mark.anyio
+async def test_unlike_missing_post(async_client: AsyncClient, logged_in_token: str):
+    response = await async_client.delete(
+        "/post/2/like", headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_like_missing_post(async_client: AsyncClient, logged_in_token: str):
+    response = await async_client.post(
+        "/like",
+        json={"post_id": 2},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 404
+
+
 @pytest.mark.anyio
 async def test_create_post_with_prompt(
     async_client: AsyncClient, logged_in_token: str, mock_generate_cute_creature_api
@@ -126,7 +196,45 @@ async def test_create_post_with_prompt(
         "body": "Test Post",
         "image_url": None,
     }.items() <= response.json().items()
-    mock_generate_cute_creature_api.assert_called()
+    mock_generate_cute_creature_api.assert_not_called()
+
+    assert await job_queue.run_due("generate_and_add_to_post") == 1
+    mock_generate_cute_creature_api.assert_called_once_with("A cat", None)
+    response = await async_client.get("/post/1")
+    assert response.json()["post"]["image_url"] == "http://example.net"
+
+
+@pytest.mark.anyio
+async def test_failed_image_generation_is_retried(
+    async_client: AsyncClient, logged_in_token: str, mocker
+):
+    mocker.patch.object(job_queue, "max_attempts", 2)
+    generate = mocker.patch(
+        "storeapi.tasks._generate_cute_creature_api",
+        side_effect=APIResponseError("API request failed with status code 503"),
+    )
+    failed_email = mocker.patch("jobs.send_image_generation_failed_email")
+    await async_client.post(
+        "/post?prompt=A cat",
+        json={"body": "Test Post"},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    image_job = job_table.select().where(
+        job_table.c.type == "generate_and_add_to_post"
+    )
+
+    assert await job_queue.run_due("generate_and_add_to_post") == 1
+    job = await database.fetch_one(image_job)
+    assert job.status == QUEUED
+    failed_email.assert_not_called()
+
+    await database.execute(job_table.update().values(run_at=0))
+    assert await job_queue.run_due("generate_and_add_to_post") == 1
+    job = await database.fetch_one(image_job)
+    assert job.status == FAILED
+    assert generate.call_count == 2
+    failed_email.assert_called_once_with("test@example.net")
 
 
 @pytest.mark.anyio
@@ -177,12 +285,97 @@ async def test_get_all_posts_sort_likes(
     assert post_ids == expected_order
 
 
+@pytest.mark.anyio
+async def test_get_all_posts_cache_invalidated_by_writes(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    response = await async_client.get("/post")
+    assert response.json()[0]["likes"] == 0
+
+    await like_post(created_post["id"], async_client, logged_in_token)
+    response = await async_client.get("/post")
+    assert response.json()[0]["likes"] == 1
+
+    await create_post("Test Post 2", async_client, logged_in_token)
+    response = await async_client.get("/post")
+    assert [post["id"] for post in response.json()] == [2, 1]
+
+
+@pytest.mark.anyio
+async def test_get_post_with_comments_cache_invalidated_by_comment(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()["comments"] == []
+
+    comment = await create_comment(
+        "Test Comment", created_post["id"], async_client, logged_in_token
+    )
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()["comments"] == [comment]
+    response = await async_client.get(f"/post/{created_post['id']}/comment")
+    assert response.json() == [comment]
+
+
 @pytest.mark.anyio
 async def test_get_all_posts_wrong_sorting(async_client: AsyncClient):
     response = await async_client.get("/post", params={"sorting": "wrong"})
     assert response.status_code == 422
 
 
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "sorting, expected_pages",
+    [
+        ("new", [[3, 2], [1]]),
+        ("old", [[1, 2], [3]]),
+        ("most_likes", [[2, 3], [1]]),
+    ],
+)
+async def test_get_all_posts_pagination(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    sorting: str,
+    expected_pages: list[list[int]],
+):
+    for i in range(3):
+        await create_post(f"Test Post {i}", async_client, logged_in_token)
+    await like_post(2, async_client, logged_in_token)
+
+    pages = []
+    params = {"sorting": sorting, "limit": 2}
+    while True:
+        response = await async_client.get("/post", params=params)
+        assert response.status_code == 200
+        pages.append([post["id"] for post in response.json()])
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert pages == expected_pages
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_invalid_cursor(async_client: AsyncClient):
+    response = await async_client.get("/post", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_cursor_wrong_sorting(
+    async_client: AsyncClient, logged_in_token: str
+):
+    for i in range(2):
+        await create_post(f"Test Post {i}", async_client, logged_in_token)
+    response = await async_client.get("/post", params={"limit": 1})
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = await async_client.get(
+        "/post", params={"sorting": "old", "cursor": cursor}
+    )
+    assert response.status_code == 400
+
+
 @pytest.mark.anyio
 async def test_create_comment(
     async_client: AsyncClient,
@@ -216,6 +409,47 @@ async def test_get_comments_on_post(
     assert response.json() == [created_comment]
 
 
+@pytest.mark.anyio
+async def test_get_comments_on_post_pagination(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    comments = [
+        await create_comment(
+            f"Comment {i}", created_post["id"], async_client, logged_in_token
+        )
+        for i in range(3)
+    ]
+
+    response = await async_client.get(
+        f"/post/{created_post['id']}/comment", params={"limit": 2}
+    )
+    assert response.json() == comments[:2]
+
+    response = await async_client.get(
+        f"/post/{created_post['id']}/comment",
+        params={"limit": 2, "cursor": response.headers["X-Next-Cursor"]},
+    )
+    assert response.json() == comments[2:]
+
+
+@pytest.mark.anyio
+async def test_get_comments_on_post_cursor_wrong_post(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    for i in range(2):
+        await create_comment(
+            f"Comment {i}", created_post["id"], async_client, logged_in_token
+        )
+    response = await async_client.get(
+        f"/post/{created_post['id']}/comment", params={"limit": 1}
+    )
+
+    response = await async_client.get(
+        "/post/2/comment", params={"cursor": response.headers["X-Next-Cursor"]}
+    )
+    assert response.status_code == 400
+
+
 @pytest.mark.anyio
 async def test_get_comments_on_post_empty(
     async_client: AsyncClient, created_post: dict
@@ -237,9 +471,47 @@ async def test_get_post_with_comments(
         "post": {
             **created_post,
             "likes": 0,
+            "comment_count": 1,
         },
         "comments": [created_comment],
     }
+    assert "X-Next-Cursor" not in response.headers
+
+
+@pytest.mark.anyio
+async def test_get_post_with_comments_no_comments(
+    async_client: AsyncClient, created_post: dict
+):
+    response = await async_client.get(f"/post/{created_post['id']}")
+
+    assert response.status_code == 200
+    assert response.json()["post"]["comment_count"] == 0
+    assert response.json()["comments"] == []
+
+
+@pytest.mark.anyio
+async def test_get_post_with_comments_paginated(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    comments = [
+        await create_comment(
+            f"Comment {i}", created_post["id"], async_client, logged_in_token
+        )
+        for i in range(3)
+    ]
+
+    response = await async_client.get(
+        f"/post/{created_post['id']}", params={"comment_limit": 2}
+    )
+    assert response.json()["post"]["comment_count"] == 3
+    assert response.json()["comments"] == comments[:2]
+
+    response = await async_client.get(
+        f"/post/{created_post['id']}/comment",
+        params={"cursor": response.headers["X-Next-Cursor"]},
+    )
+    assert response.json() == comments[2:]
+    assert "X-Next-Cursor" not in response.headers
 
 
 @pytest.mark.anyio
@@ -248,3 +520,276 @@ async def test_get_missing_post_with_comments(
 ):
     response = await async_client.get("/post/2")
     assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_export_posts(
+    async_client: AsyncClient,
+    created_post: dict,
+    created_comment: dict,
+    logged_in_token: str,
+):
+    await like_post(created_post["id"], async_client, logged_in_token)
+    other_post = await create_post("Other Post", async_client, logged_in_token)
+
+    response = await async_client.get("/post/export")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == [
+        {
+            "id": created_post["id"],
+            "body": "Test Post",
+            "user_id": created_post["user_id"],
+            "image_url": None,
+            "likes": 1,
+            "comments": [
+                {
+                    "id": created_comment["id"],
+                    "body": "Test Comment",
+                    "user_id": created_comment["user_id"],
+                }
+            ],
+        },
+        {
+            "id": other_post["id"],
+            "body": "Other Post",
+            "user_id": other_post["user_id"],
+            "image_url": None,
+            "likes": 0,
+            "comments": [],
+        },
+    ]
+
+
+@pytest.mark.anyio
+async def test_export_posts_in_chunks(
+    async_client: AsyncClient, logged_in_token: str, mocker
+):
+    mocker.patch("storeapi.config.config.EXPORT_CHUNK_SIZE", 2)
+    posts = [
+        await create_post(f"Post {i}", async_client, logged_in_token) for i in range(5)
+    ]
+    for post in posts:
+        await create_comment("Comment", post["id"], async_client, logged_in_token)
+
+    response = await async_client.get("/post/export")
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["id"] for line in lines] == [post["id"] for post in posts]
+    assert all(len(line["comments"]) == 1 for line in lines)
+
+
+@pytest.mark.anyio
+async def test_export_posts_after(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    other_post = await create_post("Other Post", async_client, logged_in_token)
+
+    response = await async_client.get(
+        "/post/export", params={"after": created_post["id"]}
+    )
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["id"] for line in lines] == [other_post["id"]]
+
+
+@pytest.mark.anyio
+async def test_export_posts_empty(async_client: AsyncClient):
+    response = await async_client.get("/post/export")
+
+    assert response.status_code == 200
+    assert response.text == ""
+
+
+@pytest.mark.anyio
+async def test_get_metrics_reports_cache(async_client: AsyncClient):
+    await async_client.get("/post")
+    await async_client.get("/post")
+
+    response = await async_client.get("/metrics")
+    assert response.status_code == 200
+    assert {"hits", "misses", "evictions"} <= response.json()["cache"].keys()
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_not_modified(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    response = await async_client.get("/post")
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "no-cache"
+
+    response = await async_client.get("/post", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    await like_post(created_post["id"], async_client, logged_in_token)
+    response = await async_client.get("/post", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+@pytest.mark.anyio
+async def test_get_post_with_comments_not_modified(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    response = await async_client.get(f"/post/{created_post['id']}")
+    etag = response.headers["ETag"]
+
+    response = await async_client.get(
+        f"/post/{created_post['id']}", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+    await create_comment(
+        "Test Comment", created_post["id"], async_client, logged_in_token
+    )
+    response = await async_client.get(
+        f"/post/{created_post['id']}", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_write_by_another_process_is_not_served_from_cache(
+    async_client: AsyncClient, created_post: dict
+):
+    post_id = created_post["id"]
+    response = await async_client.get(f"/post/{post_id}")
+    etag = response.headers["ETag"]
+    listing = await async_client.get("/post")
+
+    # As `python -m jobs` would: the rows change, this process's cache is
+    # never told.
+    async with database.transaction():
+        await database.execute(
+            post_table.update()
+            .where(post_table.c.id == post_id)
+            .values(body="Edited elsewhere")
+        )
+        await bump_post_version(post_id)
+
+    response = await async_client.get(
+        f"/post/{post_id}", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()["post"]["body"] == "Edited elsewhere"
+
+    response = await async_client.get(
+        "/post", headers={"If-None-Match": listing.headers["ETag"]}
+    )
+    assert response.status_code == 200
+    assert response.json()[0]["body"] == "Edited elsewhere"
+
+
+@pytest.mark.anyio
+async def test_get_post_cache_control_configured(
+    async_client: AsyncClient, created_post: dict, mocker
+):
+    mocker.patch.dict(
+        "storeapi.config.config.CACHE_CONTROL",
+        {"get_post_with_comments": "public, max-age=30"},
+    )
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.headers["Cache-Control"] == "public, max-age=30"
+
+
+@pytest.mark.anyio
+async def test_create_posts_batch(async_client: AsyncClient, logged_in_token: str):
+    response = await async_client.post(
+        "/post/batch",
+        json=[{"body": "Post 1"}, {"body": "Post 2"}],
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"status_code": 201, "id": 1, "detail": None},
+        {"status_code": 201, "id": 2, "detail": None},
+    ]
+    response = await async_client.get("/post", params={"sorting": "old"})
+    assert [post["body"] for post in response.json()] == ["Post 1", "Post 2"]
+
+
+@pytest.mark.anyio
+async def test_create_posts_batch_empty(
+    async_client: AsyncClient, logged_in_token: str
+):
+    response = await async_client.post(
+        "/post/batch", json=[], headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_create_comments_batch(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    response = await async_client.post(
+        "/comment/batch",
+        json=[
+            {"body": "Comment 1", "post_id": created_post["id"]},
+            {"body": "Comment 2", "post_id": 99},
+            {"body": "Comment 3", "post_id": created_post["id"]},
+        ],
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 200
+    assert [(r["status_code"], r["id"]) for r in response.json()] == [
+        (201, 1),
+        (404, None),
+        (201, 2),
+    ]
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()["post"]["comment_count"] == 2
+    assert [c["body"] for c in response.json()["comments"]] == [
+        "Comment 1",
+        "Comment 3",
+    ]
+
+
+@pytest.mark.anyio
+async def test_like_posts_batch(
+    async_client: AsyncClient, logged_in_token: str
+):
+    for i in range(2):
+        await create_post(f"Test Post {i}", async_client, logged_in_token)
+    liked = await like_post(1, async_client, logged_in_token)
+
+    response = await async_client.post(
+        "/like/batch",
+        json=[{"post_id": 1}, {"post_id": 2}, {"post_id": 2}, {"post_id": 99}],
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 200
+    results = [(r["status_code"], r["id"]) for r in response.json()]
+    assert results[0] == (200, liked["id"])
+    assert results[1][0] == 201
+    assert results[2] == (200, results[1][1])
+    assert results[3] == (404, None)
+
+    response = await async_client.get("/post", params={"sorting": "old"})
+    assert [post["likes"] for post in response.json()] == [1, 1]
+
+
+@pytest.mark.anyio
+async def test_like_post_write_behind(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str, mocker
+):
+    mocker.patch("storeapi.config.config.LIKE_BUFFER_ENABLED", True)
+
+    response = await async_client.post(
+        "/like",
+        json={"post_id": created_post["id"]},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 202
+
+    await like_buffer.flush()
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()["post"]["likes"] == 1
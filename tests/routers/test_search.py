@@ -0,0 +1,143 @@
+import pytest
+from httpx import AsyncClient
+
+from storeapi.database import database, post_table
+from storeapi.jobs import job_queue
+from tests.routers.test_post import create_comment, create_post
+
+
+@pytest.fixture()
+async def created_posts(async_client: AsyncClient, logged_in_token: str) -> list:
+    bodies = [
+        "A cat sat on the mat",
+        "Dogs and cats, cats and dogs",
+        "Nothing to see here",
+        "Catalogue of creatures",
+    ]
+    return [
+        await create_post(body, async_client, logged_in_token) for body in bodies
+    ]
+
+
+@pytest.mark.anyio
+async def test_search_posts(async_client: AsyncClient, created_posts: list):
+    response = await async_client.get("/search", params={"q": "cats"})
+
+    assert response.status_code == 200
+    assert [post["id"] for post in response.json()] == [created_posts[1]["id"]]
+    assert response.json()[0]["likes"] == 0
+
+
+@pytest.mark.anyio
+async def test_search_posts_requires_every_word(
+    async_client: AsyncClient, created_posts: list
+):
+    response = await async_client.get("/search", params={"q": "cat mat"})
+    assert [post["id"] for post in response.json()] == [created_posts[0]["id"]]
+
+    response = await async_client.get("/search", params={"q": "cat dogs"})
+    assert response.json() == []
+
+
+@pytest.mark.anyio
+async def test_search_posts_prefix(async_client: AsyncClient, created_posts: list):
+    response = await async_client.get("/search", params={"q": "cat*"})
+
+    ids = [post["id"] for post in response.json()]
+    # The post mentioning cats three times ranks first.
+    assert ids[0] == created_posts[1]["id"]
+    assert sorted(ids) == [created_posts[i]["id"] for i in (0, 1, 3)]
+
+
+@pytest.mark.anyio
+async def test_search_posts_ignores_query_syntax(
+    async_client: AsyncClient, created_posts: list
+):
+    response = await async_client.get("/search", params={"q": 'cat" OR (NEAR'})
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+@pytest.mark.anyio
+async def test_search_posts_no_words(async_client: AsyncClient):
+    response = await async_client.get("/search", params={"q": "?!"})
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_search_posts_pagination(
+    async_client: AsyncClient, created_posts: list
+):
+    seen = []
+    params = {"q": "cat*", "limit": 1}
+    while True:
+        response = await async_client.get("/search", params=params)
+        seen.extend(post["id"] for post in response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    response = await async_client.get("/search", params={"q": "cat*"})
+    assert seen == [post["id"] for post in response.json()]
+
+
+@pytest.mark.anyio
+async def test_search_posts_cursor_wrong_query(
+    async_client: AsyncClient, created_posts: list
+):
+    response = await async_client.get("/search", params={"q": "cat*", "limit": 1})
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = await async_client.get("/search", params={"q": "dogs", "cursor": cursor})
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_search_posts_after_update(
+    async_client: AsyncClient, created_posts: list
+):
+    post_id = created_posts[2]["id"]
+    await database.execute(
+        post_table.update()
+        .where(post_table.c.id == post_id)
+        .values(body="Giraffes", image_url="http://example.net/giraffe.png")
+    )
+
+    response = await async_client.get("/search", params={"q": "giraffes"})
+    assert [post["image_url"] for post in response.json()] == [
+        "http://example.net/giraffe.png"
+    ]
+
+    response = await async_client.get("/search", params={"q": "nothing"})
+    assert response.json() == []
+
+
+@pytest.mark.anyio
+async def test_search_posts_shows_generated_image(
+    async_client: AsyncClient, logged_in_token: str, mock_generate_cute_creature_api
+):
+    await async_client.post(
+        "/post?prompt=A cat",
+        json={"body": "Searchable Post"},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    await job_queue.run_due("generate_and_add_to_post")
+
+    response = await async_client.get("/search", params={"q": "searchable"})
+    assert response.json()[0]["image_url"] == "http://example.net"
+
+
+@pytest.mark.anyio
+async def test_search_comments(
+    async_client: AsyncClient, created_posts: list, logged_in_token: str
+):
+    post_id = created_posts[0]["id"]
+    comment = await create_comment(
+        "What a lovely cat", post_id, async_client, logged_in_token
+    )
+    await create_comment("Lovely weather", post_id, async_client, logged_in_token)
+
+    response = await async_client.get("/search/comments", params={"q": "cat"})
+
+    assert response.status_code == 200
+    assert response.json() == [comment]
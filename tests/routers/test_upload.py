@@ -1,77 +1,109 @@
-import contextlib
-import os
-import pathlib
+import hashlib
 import tempfile
 
 import pytest
+import starlette.formparsers
 from httpx import AsyncClient
 
+IMAGE = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
 
-# Add a sample image to the fake filesystem
-@pytest.fixture()
-def sample_image(fs) -> pathlib.Path:
-    path = (pathlib.Path(__file__).parent / "assets" / "myfile.png").resolve()
-    fs.create_file(path)
-    return path
 
-
-# Mock the b2_upload_file function so that it returns a fake URL
-@pytest.fixture(autouse=True)
-def mock_b2_upload_file(mocker):
-    return mocker.patch(
-        "storeapi.routers.upload.b2_upload_file", return_value="https://fakeurl.com"
-    )
-
-
-# Mock the aiofiles.open function so that it
-# returns a fake file object from the fake filesystem
+# Mock the B2 calls so that nothing is uploaded
 @pytest.fixture(autouse=True)
-def aiofiles_mock_open(mocker, fs):
-    mock_open = mocker.patch("aiofiles.open")
-
-    @contextlib.asynccontextmanager
-    async def async_file_open(fname: str, mode: str = "r"):
-        out_fs_mock = mocker.AsyncMock(name=f"async_file_open:{fname!r}/{mode!r}")
-        with open(fname, mode) as fin:
-            out_fs_mock.read.side_effect = fin.read
-            out_fs_mock.write.side_effect = fin.write
-            yield out_fs_mock
-
-    mock_open.side_effect = async_file_open
-    return mock_open
+def mock_b2(mocker):
+    return {
+        "upload_bytes": mocker.patch(
+            "uploads.b2_upload_bytes", return_value="https://fakeurl.com"
+        ),
+        "start_large_file": mocker.patch(
+            "uploads.b2_start_large_file", return_value="large-file-id"
+        ),
+        "upload_part": mocker.patch(
+            "uploads.b2_upload_part",
+            side_effect=lambda file_id, number, data: hashlib.sha1(data).hexdigest(),
+        ),
+        "finish_large_file": mocker.patch(
+            "uploads.b2_finish_large_file", return_value="https://fakeurl.com/large"
+        ),
+        "cancel_large_file": mocker.patch("uploads.b2_cancel_large_file"),
+    }
 
 
 async def call_upload_endpoint(
-    async_client: AsyncClient, token: str, sample_image: pathlib.Path
+    async_client: AsyncClient, token: str, content: bytes = IMAGE
 ):
     return await async_client.post(
         "/upload",
-        files={"file": open(sample_image, "rb")},
+        files={"file": ("myfile.png", content, "image/png")},
         headers={"Authorization": f"Bearer {token}"},
     )
 
 
 @pytest.mark.anyio
-async def test_upload_image(
-    async_client: AsyncClient, logged_in_token: str, sample_image: pathlib.Path
-):
-    response = await call_upload_endpoint(async_client, logged_in_token, sample_image)
+async def test_upload_image(async_client: AsyncClient, logged_in_token: str, mock_b2):
+    response = await call_upload_endpoint(async_client, logged_in_token)
     assert response.status_code == 201
     assert response.json()["file_url"] == "https://fakeurl.com"
+    mock_b2["upload_bytes"].assert_called_once_with(IMAGE, "myfile.png")
+    mock_b2["start_large_file"].assert_not_called()
 
 
 @pytest.mark.anyio
-async def test_temp_file_removed_after_upload(
-    async_client: AsyncClient, logged_in_token: str, sample_image: pathlib.Path, mocker
+async def test_upload_large_file_in_parts(
+    async_client: AsyncClient, logged_in_token: str, mock_b2, mocker
 ):
-    # Spy on the NamedTemporaryFile function
-    named_temp_file_spy = mocker.spy(tempfile, "NamedTemporaryFile")
+    mocker.patch("storeapi.config.config.B2_PART_SIZE", 400)
+
+    response = await call_upload_endpoint(async_client, logged_in_token)
 
-    response = await call_upload_endpoint(async_client, logged_in_token, sample_image)
     assert response.status_code == 201
+    assert response.json()["file_url"] == "https://fakeurl.com/large"
+    mock_b2["start_large_file"].assert_called_once_with("myfile.png")
+    parts = sorted(
+        (call.args[1], call.args[2]) for call in mock_b2["upload_part"].call_args_list
+    )
+    assert [number for number, _ in parts] == [1, 2, 3]
+    assert b"".join(data for _, data in parts) == IMAGE
+    mock_b2["finish_large_file"].assert_called_once_with(
+        "large-file-id", [hashlib.sha1(data).hexdigest() for _, data in parts]
+    )
+    mock_b2["upload_bytes"].assert_not_called()
 
-    # Get the filename of the temporary file created by the upload endpoint
-    created_temp_file = named_temp_file_spy.spy_return
 
-    # Check if the temp_file is removed after the file is uploaded
-    assert not os.path.exists(created_temp_file.name)
+@pytest.mark.anyio
+async def test_failed_part_cancels_upload(
+    async_client: AsyncClient, logged_in_token: str, mock_b2, mocker
+):
+    mocker.patch("storeapi.config.config.B2_PART_SIZE", 400)
+    mock_b2["upload_part"].side_effect = RuntimeError("B2 is down")
+
+    response = await call_upload_endpoint(async_client, logged_in_token)
+
+    assert response.status_code == 500
+    mock_b2["cancel_large_file"].assert_called_once_with("large-file-id")
+    mock_b2["finish_large_file"].assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_upload_without_file(async_client: AsyncClient, logged_in_token: str):
+    response = await async_client.post(
+        "/upload",
+        data={"other": "value"},
+        files={"other_file": ("myfile.png", IMAGE, "image/png")},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_upload_writes_no_temp_file(
+    async_client: AsyncClient, logged_in_token: str, mocker
+):
+    named_temp_file_spy = mocker.spy(tempfile, "NamedTemporaryFile")
+    spooled_temp_file_spy = mocker.spy(starlette.formparsers, "SpooledTemporaryFile")
+
+    response = await call_upload_endpoint(async_client, logged_in_token)
+    assert response.status_code == 201
+
+    named_temp_file_spy.assert_not_called()
+    spooled_temp_file_spy.assert_not_called()
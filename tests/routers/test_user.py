@@ -1,7 +1,11 @@
+import asyncio
+
 import pytest
-from fastapi import BackgroundTasks
 from httpx import AsyncClient
 
+from storeapi import security
+from storeapi.jobs import job_queue
+
 
 async def register_user(async_client: AsyncClient, email: str, password: str):
     return await async_client.post(
@@ -27,18 +31,61 @@ async def test_register_user_already_exists(
     assert "already exists" in response.json()["detail"]
 
 
+@pytest.mark.anyio
+async def test_register_user_without_email_job_is_rolled_back(
+    async_client: AsyncClient, mocker
+):
+    mocker.patch.object(job_queue, "store", side_effect=RuntimeError("disk full"))
+
+    with pytest.raises(RuntimeError):
+        await register_user(async_client, "test@example.net", "1234")
+
+    assert await security.get_user("test@example.net") is None
+
+
+@pytest.mark.anyio
+async def test_register_user_concurrently(async_client: AsyncClient):
+    responses = await asyncio.gather(
+        *(register_user(async_client, "test@example.net", "1234") for _ in range(5))
+    )
+
+    statuses = sorted(response.status_code for response in responses)
+    assert statuses == [201, 400, 400, 400, 400]
+
+
 @pytest.mark.anyio
 async def test_confirm_user(async_client: AsyncClient, mocker):
-    spy = mocker.spy(BackgroundTasks, "add_task")
+    spy = mocker.spy(job_queue, "store")
     await register_user(async_client, "test@example.net", "1234")
 
-    confirmation_url = str(spy.call_args[1]["confirmation_url"])
+    confirmation_url = str(spy.call_args.kwargs["confirmation_url"])
     response = await async_client.get(confirmation_url)
 
     assert response.status_code == 200
     assert "User confirmed" in response.json()["detail"]
 
 
+@pytest.mark.anyio
+async def test_confirm_user_refreshes_cached_user(async_client: AsyncClient, mocker):
+    spy = mocker.spy(job_queue, "store")
+    await register_user(async_client, "test@example.net", "1234")
+    assert not (await security.get_cached_user("test@example.net")).confirmed
+
+    confirmation_url = str(spy.call_args.kwargs["confirmation_url"])
+    await async_client.get(confirmation_url)
+
+    assert (await security.get_cached_user("test@example.net")).confirmed
+
+
+@pytest.mark.anyio
+async def test_register_user_clears_unknown_user(async_client: AsyncClient):
+    assert await security.get_cached_user("test@example.net") is None
+
+    await register_user(async_client, "test@example.net", "1234")
+
+    assert await security.get_cached_user("test@example.net") is not None
+
+
 @pytest.mark.anyio
 async def test_confirm_user_invalid_token(async_client: AsyncClient):
     response = await async_client.get("/confirm/invalid_token")
@@ -48,10 +95,10 @@ async def test_confirm_user_invalid_token(async_client: AsyncClient):
 @pytest.mark.anyio
 async def test_confirm_user_expired_token(async_client: AsyncClient, mocker):
     mocker.patch("storeapi.security.confirm_token_expire_minutes", return_value=-1)
-    spy = mocker.spy(BackgroundTasks, "add_task")
+    spy = mocker.spy(job_queue, "store")
     await register_user(async_client, "test@example.net", "1234")
 
-    confirmation_url = str(spy.call_args[1]["confirmation_url"])
+    confirmation_url = str(spy.call_args.kwargs["confirmation_url"])
     response = await async_client.get(confirmation_url)
 
     assert response.status_code == 401
@@ -87,3 +134,72 @@ async def test_login_user(async_client: AsyncClient, confirmed_user: dict):
         json={"email": confirmed_user["email"], "password": confirmed_user["password"]},
     )
     assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_revoke_all_tokens(
+    async_client: AsyncClient, confirmed_user: dict, logged_in_token: str
+):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    response = await async_client.post("/token/revoke-all", headers=headers)
+    assert response.status_code == 200
+
+    response = await async_client.post(
+        "/post", json={"body": "Test Post"}, headers=headers
+    )
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token has been revoked"
+
+    response = await async_client.post("/token", json=confirmed_user)
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = await async_client.post(
+        "/post", json={"body": "Test Post"}, headers=headers
+    )
+    assert response.status_code == 201
+
+
+@pytest.mark.anyio
+async def test_logout(
+    async_client: AsyncClient, confirmed_user: dict, logged_in_token: str
+):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    response = await async_client.post("/logout", headers=headers)
+    assert response.status_code == 200
+
+    response = await async_client.post(
+        "/post", json={"body": "Test Post"}, headers=headers
+    )
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token has been revoked"
+
+    response = await async_client.post("/token", json=confirmed_user)
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = await async_client.post(
+        "/post", json={"body": "Test Post"}, headers=headers
+    )
+    assert response.status_code == 201
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("form", [False, True])
+async def test_login_rate_limited(
+    async_client: AsyncClient, confirmed_user: dict, mocker, form: bool
+):
+    mocker.patch("storeapi.config.config.LOGIN_RATE_LIMIT_EMAIL_ATTEMPTS", 2)
+
+    async def login(password: str):
+        if form:
+            data = {"username": confirmed_user["email"], "password": password}
+            return await async_client.post("/token-form", data=data)
+        data = {"email": confirmed_user["email"], "password": password}
+        return await async_client.post("/token", json=data)
+
+    for _ in range(2):
+        assert (await login("wrong password")).status_code == 401
+    hashes = security.password_hasher.stats()["calls"]
+
+    response = await login(confirmed_user["password"])
+
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    assert security.password_hasher.stats()["calls"] == hashes
@@ -0,0 +1,177 @@
+import asyncio
+
+import httpx
+import pytest
+from storeapi.breakers import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from storeapi.tasks import APIResponseError, mailgun_breaker, send_simple_email
+
+
+def create_breaker(**options) -> CircuitBreaker:
+    settings = {
+        "max_concurrency": 2,
+        "deadline": 1,
+        "failure_threshold": 2,
+        "reset_timeout": 0.05,
+        **options,
+    }
+    return CircuitBreaker("test", **settings)
+
+
+async def succeed() -> str:
+    return "ok"
+
+
+async def fail() -> None:
+    raise ValueError("down")
+
+
+@pytest.mark.anyio
+async def test_opens_after_failures_in_a_row():
+    breaker = create_breaker()
+    calls = []
+
+    async def fail_counted():
+        calls.append(1)
+        await fail()
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            await breaker.call(fail_counted)
+
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(fail_counted)
+    assert len(calls) == 2
+    stats = breaker.stats()
+    assert stats["failures"] == 2
+    assert stats["rejected"] == 1
+    assert stats["opened"] == 1
+
+
+@pytest.mark.anyio
+async def test_success_resets_failure_count():
+    breaker = create_breaker()
+
+    with pytest.raises(ValueError):
+        await breaker.call(fail)
+    assert await breaker.call(succeed) == "ok"
+    with pytest.raises(ValueError):
+        await breaker.call(fail)
+
+    assert breaker.state == CLOSED
+
+
+@pytest.mark.anyio
+async def test_half_open_probe_closes_circuit():
+    breaker = create_breaker()
+    release = asyncio.Event()
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            await breaker.call(fail)
+    await asyncio.sleep(0.05)
+
+    async def probe():
+        await release.wait()
+        return "ok"
+
+    probe_call = asyncio.create_task(breaker.call(probe))
+    await asyncio.sleep(0)
+    assert breaker.state == HALF_OPEN
+    # Only the probe goes through while half open.
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(succeed)
+
+    release.set()
+    assert await probe_call == "ok"
+    assert breaker.state == CLOSED
+    assert await breaker.call(succeed) == "ok"
+
+
+@pytest.mark.anyio
+async def test_failed_probe_opens_circuit_again():
+    breaker = create_breaker(failure_threshold=5)
+    for _ in range(5):
+        with pytest.raises(ValueError):
+            await breaker.call(fail)
+    await asyncio.sleep(0.05)
+
+    with pytest.raises(ValueError):
+        await breaker.call(fail)
+
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(succeed)
+
+
+@pytest.mark.anyio
+async def test_deadline_cancels_slow_call():
+    breaker = create_breaker(deadline=0.01)
+
+    with pytest.raises(TimeoutError):
+        await breaker.call(asyncio.sleep, 1)
+
+    assert breaker.stats()["timeouts"] == 1
+    assert breaker.stats()["failures"] == 1
+
+
+@pytest.mark.anyio
+async def test_concurrency_cap():
+    breaker = create_breaker()
+    release = asyncio.Event()
+
+    async def slow():
+        await release.wait()
+        return "ok"
+
+    calls = [asyncio.create_task(breaker.call(slow)) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert breaker.stats()["running"] == 2
+    assert breaker.stats()["waiting"] == 1
+
+    release.set()
+    assert await asyncio.gather(*calls) == ["ok"] * 3
+    assert breaker.stats()["calls"] == 3
+
+
+@pytest.mark.anyio
+async def test_non_failures_keep_circuit_closed():
+    breaker = create_breaker(is_failure=lambda e: not isinstance(e, KeyError))
+
+    async def bad_request():
+        raise KeyError("bad")
+
+    for _ in range(3):
+        with pytest.raises(KeyError):
+            await breaker.call(bad_request)
+
+    assert breaker.state == CLOSED
+
+
+@pytest.mark.anyio
+async def test_mailgun_outage_fails_fast(mock_httpx_client, mocker):
+    mocker.patch.object(mailgun_breaker, "failure_threshold", 2)
+    mock_httpx_client.post.return_value = httpx.Response(
+        status_code=503, content="", request=httpx.Request("POST", "//")
+    )
+
+    for _ in range(2):
+        with pytest.raises(APIResponseError, match="status code 503"):
+            await send_simple_email("test@example.net", "Test Subject", "Test Body")
+    with pytest.raises(APIResponseError, match="circuit is open"):
+        await send_simple_email("test@example.net", "Test Subject", "Test Body")
+
+    assert mock_httpx_client.post.call_count == 2
+    assert mailgun_breaker.stats()["state"] == OPEN
+
+
+@pytest.mark.anyio
+async def test_mailgun_bad_request_is_not_an_outage(mock_httpx_client, mocker):
+    mocker.patch.object(mailgun_breaker, "failure_threshold", 1)
+    mock_httpx_client.post.return_value = httpx.Response(
+        status_code=400, content="", request=httpx.Request("POST", "//")
+    )
+
+    with pytest.raises(APIResponseError, match="status code 400"):
+        await send_simple_email("test@example.net", "Test Subject", "Test Body")
+
+    assert mailgun_breaker.stats()["state"] == CLOSED
@@ -0,0 +1,64 @@
+import pytest
+from storeapi import cache
+from storeapi.cache import MemoryCache
+
+
+@pytest.mark.anyio
+async def test_memory_cache_get_set():
+    backend = MemoryCache(max_entries=10, ttl=60)
+    await backend.set("key", "value")
+    assert await backend.get("key") == "value"
+    assert await backend.get("missing") is None
+
+
+def test_memory_cache_nowait():
+    backend = MemoryCache(max_entries=10, ttl=60)
+    backend.set_nowait("key", "value")
+    assert backend.get_nowait("key") == "value"
+    backend.set_nowait("key", "value", ttl=-1)
+    assert backend.get_nowait("key") is None
+
+
+@pytest.mark.anyio
+async def test_memory_cache_evicts_least_recently_used():
+    backend = MemoryCache(max_entries=2, ttl=60)
+    await backend.set("a", 1)
+    await backend.set("b", 2)
+    await backend.get("a")
+    await backend.set("c", 3)
+
+    assert await backend.get("b") is None
+    assert await backend.get("a") == 1
+    assert backend.stats()["evictions"] == 1
+
+
+@pytest.mark.anyio
+async def test_memory_cache_expires_entries():
+    backend = MemoryCache(max_entries=10, ttl=60)
+    await backend.set("key", "value", ttl=-1)
+
+    assert await backend.get("key") is None
+    assert backend.stats()["expirations"] == 1
+
+
+@pytest.mark.anyio
+async def test_get_or_load_counts_hits_and_misses(mocker):
+    before = cache.cache_stats()
+    load = mocker.AsyncMock(return_value={"loaded": True})
+
+    assert await cache.get_or_load("key", load) == {"loaded": True}
+    assert await cache.get_or_load("key", load) == {"loaded": True}
+
+    load.assert_awaited_once()
+    after = cache.cache_stats()
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 1
+
+
+@pytest.mark.anyio
+async def test_invalidate_changes_keys():
+    key = await cache.cache_key("namespace", "part")
+    assert await cache.cache_key("namespace", "part") == key
+
+    await cache.invalidate("namespace")
+    assert await cache.cache_key("namespace", "part") != key
@@ -0,0 +1,199 @@
+import json
+
+import pytest
+import sqlalchemy
+from storeapi.commands import (
+    calibrate_password_hashing,
+    import_users,
+    read_users,
+    rebuild_search_index,
+    repair_comment_counts,
+    repair_like_counts,
+    revoke_access_token,
+    revoke_all_user_tokens,
+    upgrade_schema,
+)
+from storeapi.database import (
+    comment_table,
+    database,
+    job_table,
+    like_table,
+    post_table,
+    user_table,
+)
+from storeapi.jobs import job_queue
+from storeapi.security import (
+    HTTPException,
+    create_access_token,
+    get_current_user,
+    verify_password,
+)
+
+
+@pytest.fixture()
+async def post_with_drifted_likes(registered_user: dict) -> int:
+    other_user_id = await database.execute(
+        user_table.insert().values(email="other@example.net", password="1234")
+    )
+    post_id = await database.execute(
+        post_table.insert().values(body="Test Post", user_id=registered_user["id"])
+    )
+    for user_id in (registered_user["id"], other_user_id):
+        await database.execute(
+            like_table.insert().values(post_id=post_id, user_id=user_id)
+        )
+    return post_id
+
+
+def test_upgrade_schema_up_to_date():
+    assert upgrade_schema() == []
+
+
+@pytest.mark.anyio
+async def test_repair_like_counts(post_with_drifted_likes: int):
+    assert await repair_like_counts() == 1
+
+    query = post_table.select().where(post_table.c.id == post_with_drifted_likes)
+    post = await database.fetch_one(query)
+    assert post.like_count == 2
+
+
+@pytest.mark.anyio
+async def test_repair_like_counts_no_drift(post_with_drifted_likes: int):
+    await repair_like_counts()
+    assert await repair_like_counts() == 0
+
+
+@pytest.mark.anyio
+async def test_repair_comment_counts(registered_user: dict):
+    post_id = await database.execute(
+        post_table.insert().values(body="Test Post", user_id=registered_user["id"])
+    )
+    await database.execute(
+        comment_table.insert().values(
+            body="Test Comment", post_id=post_id, user_id=registered_user["id"]
+        )
+    )
+
+    assert await repair_comment_counts() == 1
+
+    query = post_table.select().where(post_table.c.id == post_id)
+    post = await database.fetch_one(query)
+    assert post.comment_count == 1
+
+
+@pytest.mark.anyio
+async def test_rebuild_search_index(registered_user: dict):
+    post_id = await database.execute(
+        post_table.insert().values(body="Findable Post", user_id=registered_user["id"])
+    )
+    await database.execute(
+        comment_table.insert().values(
+            body="Test Comment", post_id=post_id, user_id=registered_user["id"]
+        )
+    )
+    await database.execute(
+        sqlalchemy.text("INSERT INTO posts_fts(posts_fts) VALUES ('delete-all')")
+    )
+    query = sqlalchemy.text(
+        "SELECT rowid FROM posts_fts WHERE posts_fts MATCH 'findable'"
+    )
+    assert await database.fetch_all(query) == []
+
+    assert await rebuild_search_index() == 2
+
+    assert [row.rowid for row in await database.fetch_all(query)] == [post_id]
+
+
+def test_calibrate_password_hashing():
+    [result] = calibrate_password_hashing(["pbkdf2_sha256"], target_ms=5)
+
+    assert result["scheme"] == "pbkdf2_sha256"
+    assert result["rounds"] >= 1
+    assert result["ms"] > 0
+
+
+def test_calibrate_password_hashing_unknown_scheme():
+    [result] = calibrate_password_hashing(["no_such_scheme"], target_ms=5)
+    assert "error" in result
+
+
+@pytest.mark.anyio
+async def test_revoke_access_token(registered_user: dict):
+    token = create_access_token(registered_user["email"], registered_user["id"])
+
+    assert (await revoke_access_token(token)).startswith("revoked token")
+
+    with pytest.raises(HTTPException):
+        await get_current_user(token)
+
+
+@pytest.mark.anyio
+async def test_revoke_access_token_invalid():
+    assert await revoke_access_token("invalid") == "not revoked: Invalid token"
+
+
+@pytest.mark.anyio
+async def test_revoke_all_user_tokens(registered_user: dict):
+    token = create_access_token(registered_user["email"], registered_user["id"])
+
+    assert await revoke_all_user_tokens(registered_user["email"]) == (
+        "revoked all tokens of test@example.net"
+    )
+
+    with pytest.raises(HTTPException):
+        await get_current_user(token)
+
+
+def test_read_users_jsonl(tmp_path):
+    path = tmp_path / "users.jsonl"
+    users = [{"email": f"user{i}@example.net", "password": "1234"} for i in range(2)]
+    path.write_text("\n".join(json.dumps(user) for user in users) + "\n\n")
+
+    assert list(read_users(str(path))) == users
+
+
+@pytest.mark.anyio
+async def test_import_users(tmp_path, registered_user: dict, mock_httpx_client):
+    path = tmp_path / "users.csv"
+    path.write_text(
+        "email,password\n"
+        "new1@example.net,secret1\n"
+        f"{registered_user['email']},other\n"
+        "new2@example.net,secret2\n"
+        "new1@example.net,again\n"
+        "missing-password@example.net\n"
+    )
+    progress = []
+    # Send registered_user's registration email first.
+    await job_queue.run_due()
+    mock_httpx_client.post.reset_mock()
+
+    counts = await import_users(
+        str(path),
+        batch_size=3,
+        workers=2,
+        confirmation_base_url="http://test/",
+        progress=lambda counts: progress.append(counts["read"]),
+    )
+
+    assert progress == [3, 5]
+    assert counts["read"] == 5
+    assert counts["imported"] == 2
+    assert counts["existing"] == 2
+    assert counts["invalid"] == 1
+    assert counts["emails_queued"] == 2
+    assert await database.fetch_all(job_table.select()) == []
+    # Both emails went out in one batch request.
+    mock_httpx_client.post.assert_called_once()
+    assert mock_httpx_client.post.call_args.kwargs["data"]["to"] == [
+        "new1@example.net",
+        "new2@example.net",
+    ]
+    imported = {"new1@example.net": "secret1", "new2@example.net": "secret2"}
+    for email, password in imported.items():
+        user = await database.fetch_one(
+            user_table.select().where(user_table.c.email == email)
+        )
+        assert not user.confirmed
+        assert verify_password(password, user.password)
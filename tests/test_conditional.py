@@ -0,0 +1,22 @@
+from starlette.requests import Request
+from storeapi.conditional import etag_matches, make_etag
+
+
+def make_request(if_none_match: str) -> Request:
+    return Request(
+        {"type": "http", "headers": [(b"if-none-match", if_none_match.encode())]}
+    )
+
+
+def test_make_etag_is_strong_and_stable():
+    etag = make_etag(1, "new", 20)
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == make_etag(1, "new", 20)
+    assert etag != make_etag(2, "new", 20)
+
+
+def test_etag_matches_list_and_weak():
+    etag = make_etag(1)
+    assert etag_matches(make_request(f'"other", W/{etag}'), etag)
+    assert etag_matches(make_request("*"), etag)
+    assert not etag_matches(make_request('"other"'), etag)
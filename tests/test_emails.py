@@ -0,0 +1,166 @@
+import asyncio
+
+import pytest
+from storeapi.emails import EmailDispatcher
+from storeapi.tasks import APIResponseError
+
+
+class FakeMailgun:
+    def __init__(self, reject: set[str] = frozenset(), status_code: int = 400):
+        self.batches = []
+        self.reject = reject
+        self.status_code = status_code
+
+    async def send_batch(self, subject: str, template: str, recipients: dict):
+        self.batches.append((subject, template, dict(recipients)))
+        if self.reject & set(recipients):
+            raise APIResponseError("rejected", self.status_code)
+
+
+def create_dispatcher(mailgun: FakeMailgun, **options) -> EmailDispatcher:
+    settings = {"batch_size": 100, "window": 0.01, "max_pending": 100, **options}
+    return EmailDispatcher(mailgun.send_batch, **settings)
+
+
+@pytest.mark.anyio
+async def test_coalesces_emails():
+    mailgun = FakeMailgun()
+    dispatcher = create_dispatcher(mailgun)
+
+    await asyncio.gather(
+        *(
+            dispatcher.send(f"user{i}@example.net", "Hi", "Hi %recipient.n%", {"n": i})
+            for i in range(3)
+        )
+    )
+
+    assert mailgun.batches == [
+        (
+            "Hi",
+            "Hi %recipient.n%",
+            {f"user{i}@example.net": {"n": i} for i in range(3)},
+        )
+    ]
+    stats = dispatcher.stats()
+    assert stats["sent"] == 3
+    assert stats["avg_batch_size"] == 3
+    assert stats["pending"] == 0
+
+
+@pytest.mark.anyio
+async def test_batches_by_subject_and_template():
+    mailgun = FakeMailgun()
+    dispatcher = create_dispatcher(mailgun)
+
+    await asyncio.gather(
+        dispatcher.send("a@example.net", "Hi", "one", {}),
+        dispatcher.send("b@example.net", "Hi", "two", {}),
+        dispatcher.send("c@example.net", "Bye", "one", {}),
+        dispatcher.send("d@example.net", "Hi", "one", {}),
+    )
+
+    assert sorted((s, t, sorted(r)) for s, t, r in mailgun.batches) == [
+        ("Bye", "one", ["c@example.net"]),
+        ("Hi", "one", ["a@example.net", "d@example.net"]),
+        ("Hi", "two", ["b@example.net"]),
+    ]
+
+
+@pytest.mark.anyio
+async def test_full_batch_is_sent_without_waiting():
+    mailgun = FakeMailgun()
+    dispatcher = create_dispatcher(mailgun, batch_size=2, window=10)
+
+    await asyncio.wait_for(
+        asyncio.gather(
+            dispatcher.send("a@example.net", "Hi", "Hi", {}),
+            dispatcher.send("b@example.net", "Hi", "Hi", {}),
+        ),
+        1,
+    )
+
+    assert len(mailgun.batches) == 1
+
+
+@pytest.mark.anyio
+async def test_repeated_recipient_goes_in_next_batch():
+    mailgun = FakeMailgun()
+    dispatcher = create_dispatcher(mailgun)
+
+    await asyncio.gather(
+        dispatcher.send("a@example.net", "Hi", "Hi %recipient.n%", {"n": 1}),
+        dispatcher.send("a@example.net", "Hi", "Hi %recipient.n%", {"n": 2}),
+    )
+
+    assert [batch[2] for batch in mailgun.batches] == [
+        {"a@example.net": {"n": 1}},
+        {"a@example.net": {"n": 2}},
+    ]
+
+
+@pytest.mark.anyio
+async def test_rejected_batch_is_sent_singly():
+    mailgun = FakeMailgun(reject={"bad@example.net"})
+    dispatcher = create_dispatcher(mailgun)
+
+    results = await asyncio.gather(
+        dispatcher.send("a@example.net", "Hi", "Hi", {}),
+        dispatcher.send("bad@example.net", "Hi", "Hi", {}),
+        dispatcher.send("b@example.net", "Hi", "Hi", {}),
+        return_exceptions=True,
+    )
+
+    assert results[0] is None
+    assert isinstance(results[1], APIResponseError)
+    assert results[2] is None
+    # The batch, then one request per recipient.
+    assert len(mailgun.batches) == 4
+    stats = dispatcher.stats()
+    assert stats["split_batches"] == 1
+    assert stats["sent"] == 2
+    assert stats["failed"] == 1
+
+
+@pytest.mark.anyio
+async def test_server_error_fails_whole_batch():
+    mailgun = FakeMailgun(reject={"a@example.net"}, status_code=500)
+    dispatcher = create_dispatcher(mailgun)
+
+    results = await asyncio.gather(
+        dispatcher.send("a@example.net", "Hi", "Hi", {}),
+        dispatcher.send("b@example.net", "Hi", "Hi", {}),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(result, APIResponseError) for result in results)
+    assert len(mailgun.batches) == 1
+    assert dispatcher.stats()["failed"] == 2
+
+
+@pytest.mark.anyio
+async def test_senders_wait_for_room():
+    release = asyncio.Event()
+    sizes = []
+
+    async def send_batch(subject: str, template: str, recipients: dict):
+        sizes.append(len(recipients))
+        await release.wait()
+
+    dispatcher = EmailDispatcher(send_batch, batch_size=2, window=0.05, max_pending=2)
+    sends = [
+        asyncio.create_task(dispatcher.send(f"user{i}@example.net", "Hi", "Hi", {}))
+        for i in range(3)
+    ]
+    await asyncio.sleep(0.01)
+
+    # The first two filled a batch; the third waits for one of them.
+    assert sizes == [2]
+    assert dispatcher.stats()["pending"] == 2
+
+    release.set()
+    await asyncio.sleep(0.01)
+    assert dispatcher.stats()["pending"] == 1
+    assert not sends[2].done()
+
+    await asyncio.gather(*sends)
+    assert sizes == [2, 1]
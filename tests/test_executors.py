@@ -0,0 +1,50 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from storeapi.executors import BoundedExecutor
+
+
+@pytest.mark.anyio
+async def test_bounded_executor_runs_in_pool():
+    executor = BoundedExecutor("test", kind="thread", max_workers=2)
+
+    assert await executor.run(threading.get_ident) != threading.get_ident()
+    assert executor.stats()["calls"] == 1
+    executor.shutdown()
+
+
+@pytest.mark.anyio
+async def test_bounded_executor_limits_concurrency():
+    executor = BoundedExecutor("test", kind="thread", max_workers=2)
+    running = 0
+    max_running = 0
+    lock = threading.Lock()
+
+    def work():
+        nonlocal running, max_running
+        with lock:
+            running += 1
+            max_running = max(max_running, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+
+    await asyncio.gather(*(executor.run(work) for _ in range(6)))
+
+    assert max_running == 2
+    stats = executor.stats()
+    assert stats["calls"] == 6
+    assert stats["waiting"] == stats["running"] == 0
+    # Two rounds of two calls had to wait for a free worker.
+    assert stats["max_queue_ms"] >= 30
+    executor.shutdown()
+
+
+@pytest.mark.anyio
+async def test_bounded_executor_process_pool():
+    executor = BoundedExecutor("test", kind="process", max_workers=1)
+
+    assert await executor.run(pow, 2, 10) == 1024
+    executor.shutdown()
@@ -0,0 +1,102 @@
+import asyncio
+
+import httpx
+import pytest
+from storeapi.database import database, generated_image_table
+from storeapi.images import ImageCache, normalize_prompt
+from storeapi.tasks import _generate_cute_creature_api
+
+
+class FakeGenerator:
+    def __init__(self, delay: float = 0, error: Exception = None):
+        self.calls = 0
+        self.delay = delay
+        self.error = error
+
+    async def __call__(self) -> dict:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return {"id": self.calls, "output_url": f"https://example.com/{self.calls}.jpg"}
+
+
+def test_normalize_prompt():
+    assert normalize_prompt("  A blue\tBritish  shorthair cat. ") == (
+        "a blue british shorthair cat"
+    )
+    assert normalize_prompt("ＣＡＴ!") == "cat"
+
+
+@pytest.mark.anyio
+async def test_reuses_image_for_same_prompt():
+    cache = ImageCache(ttl=60)
+    generate = FakeGenerator()
+
+    first = await cache.get_or_generate("A cat", generate)
+    second = await cache.get_or_generate("a  CAT.", generate)
+
+    assert generate.calls == 1
+    assert second == {"output_url": first["output_url"]}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+@pytest.mark.anyio
+async def test_expired_image_is_generated_again():
+    cache = ImageCache(ttl=60)
+    generate = FakeGenerator()
+    await cache.get_or_generate("A cat", generate)
+    await database.execute(generated_image_table.update().values(created_at=0))
+
+    response = await cache.get_or_generate("A cat", generate)
+
+    assert generate.calls == 2
+    assert response["output_url"] == "https://example.com/2.jpg"
+    assert await cache.get("A cat") == {"output_url": "https://example.com/2.jpg"}
+
+
+@pytest.mark.anyio
+async def test_concurrent_prompts_share_one_call():
+    cache = ImageCache(ttl=60)
+    generate = FakeGenerator(delay=0.01)
+
+    responses = await asyncio.gather(
+        *(cache.get_or_generate("A cat", generate) for _ in range(5))
+    )
+
+    assert generate.calls == 1
+    assert all(response == responses[0] for response in responses)
+    assert cache.stats()["coalesced"] == 4
+    assert cache.stats()["in_flight"] == 0
+
+
+@pytest.mark.anyio
+async def test_failed_generation_is_not_cached():
+    cache = ImageCache(ttl=60)
+    generate = FakeGenerator(delay=0.01, error=ValueError("boom"))
+
+    results = await asyncio.gather(
+        *(cache.get_or_generate("A cat", generate) for _ in range(2)),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert generate.calls == 1
+    assert await cache.get("A cat") is None
+    assert cache.stats()["errors"] == 1
+
+
+@pytest.mark.anyio
+async def test_generate_cute_creature_api_uses_cache(mock_httpx_client):
+    json_data = {"output_url": "https://example.com/image.jpg"}
+    mock_httpx_client.post.return_value = httpx.Response(
+        status_code=200, json=json_data, request=httpx.Request("POST", "//")
+    )
+
+    await _generate_cute_creature_api("A cat")
+    result = await _generate_cute_creature_api("A cat")
+
+    assert result == json_data
+    mock_httpx_client.post.assert_called_once()
@@ -0,0 +1,218 @@
+import asyncio
+import time
+
+import pytest
+from storeapi.database import database, job_table
+from storeapi.jobs import FAILED, QUEUED, RUNNING, JobQueue
+
+
+def create_queue(**options) -> JobQueue:
+    settings = {
+        "poll_interval": 0.01,
+        "max_attempts": 3,
+        "retry_base": 0,
+        "retry_max": 0,
+        "shutdown_grace": 0.01,
+        **options,
+    }
+    return JobQueue(**settings)
+
+
+async def get_job(job_id: int):
+    query = job_table.select().where(job_table.c.id == job_id)
+    return await database.fetch_one(query)
+
+
+async def wait_until(condition, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.anyio
+async def test_run_due():
+    calls = []
+    queue = create_queue()
+
+    async def handler(value: int):
+        calls.append(value)
+
+    queue.register("test", handler, concurrency=2, visibility_timeout=10)
+    job_id = await queue.enqueue("test", value=1)
+    await queue.enqueue("test", value=2)
+
+    assert await queue.run_due() == 2
+
+    assert sorted(calls) == [1, 2]
+    assert await get_job(job_id) is None
+    stats = queue.stats()["test"]
+    assert stats["enqueued"] == 2
+    assert stats["succeeded"] == 2
+
+
+@pytest.mark.anyio
+async def test_retries_until_failed():
+    queue = create_queue()
+
+    async def handler():
+        raise ValueError("boom")
+
+    queue.register("test", handler, concurrency=1, visibility_timeout=10)
+    job_id = await queue.enqueue("test")
+
+    assert await queue.run_due() == 3
+
+    job = await get_job(job_id)
+    assert job.status == FAILED
+    assert job.attempts == 3
+    assert job.last_error == "ValueError: boom"
+    stats = queue.stats()["test"]
+    assert stats["retried"] == 2
+    assert stats["failed"] == 1
+    # Failed jobs are kept, but never claimed again.
+    assert await queue.run_due() == 0
+
+
+@pytest.mark.anyio
+async def test_on_failure_called_once_failed_for_good():
+    failures = []
+    queue = create_queue()
+
+    async def handler(value: int):
+        raise ValueError("boom")
+
+    async def on_failure(value: int):
+        failures.append(value)
+
+    queue.register(
+        "test", handler, concurrency=1, visibility_timeout=10, on_failure=on_failure
+    )
+    await queue.enqueue("test", value=1)
+
+    assert await queue.run_due() == 3
+    assert failures == [1]
+
+
+@pytest.mark.anyio
+async def test_retry_backoff():
+    queue = create_queue(retry_base=10, retry_max=15)
+
+    async def handler():
+        raise ValueError("boom")
+
+    queue.register("test", handler, concurrency=1, visibility_timeout=10)
+    job_id = await queue.enqueue("test")
+
+    before = time.time()
+    assert await queue.run_due() == 1
+
+    job = await get_job(job_id)
+    assert job.status == QUEUED
+    assert before + 5 <= job.run_at <= time.time() + 10
+
+    await database.execute(
+        job_table.update().where(job_table.c.id == job_id).values(run_at=before)
+    )
+    assert await queue.run_due() == 1
+    job = await get_job(job_id)
+    # Doubled, then capped at retry_max.
+    assert before + 7.5 <= job.run_at <= time.time() + 15
+
+
+@pytest.mark.anyio
+async def test_lapsed_claim_is_claimed_again():
+    calls = []
+    queue = create_queue()
+
+    async def handler():
+        calls.append(1)
+
+    queue.register("test", handler, concurrency=1, visibility_timeout=10)
+    job_id = await queue.enqueue("test")
+    # As if claimed by a worker that died before finishing.
+    await database.execute(
+        job_table.update()
+        .where(job_table.c.id == job_id)
+        .values(status=RUNNING, attempts=1, run_at=time.time() + 60)
+    )
+    assert await queue.run_due() == 0
+
+    await database.execute(
+        job_table.update()
+        .where(job_table.c.id == job_id)
+        .values(run_at=time.time() - 1)
+    )
+    assert await queue.run_due() == 1
+    assert calls == [1]
+
+
+@pytest.mark.anyio
+async def test_job_over_visibility_timeout_is_retried():
+    queue = create_queue(max_attempts=1)
+
+    async def handler():
+        await asyncio.sleep(10)
+
+    queue.register("test", handler, concurrency=1, visibility_timeout=0.01)
+    job_id = await queue.enqueue("test")
+
+    assert await queue.run_due() == 1
+
+    job = await get_job(job_id)
+    assert job.status == FAILED
+    assert job.last_error.startswith("TimeoutError")
+
+
+@pytest.mark.anyio
+async def test_workers_respect_concurrency():
+    running = 0
+    most_running = 0
+    release = asyncio.Event()
+    queue = create_queue()
+
+    async def handler():
+        nonlocal running, most_running
+        running += 1
+        most_running = max(most_running, running)
+        await release.wait()
+        running -= 1
+
+    queue.register("test", handler, concurrency=2, visibility_timeout=10)
+    await queue.start()
+    for _ in range(5):
+        await queue.enqueue("test")
+
+    await wait_until(lambda: running == 2)
+    await wait_until(lambda: queue.stats()["test"]["depth"] == 3)
+    stats = queue.stats()["test"]
+    assert stats["running"] == 2
+    assert stats["avg_wait_ms"] > 0
+
+    release.set()
+    await wait_until(lambda: queue.stats()["test"]["succeeded"] == 5)
+    await queue.stop()
+
+    assert most_running == 2
+
+
+@pytest.mark.anyio
+async def test_stop_requeues_running_jobs():
+    started = asyncio.Event()
+    queue = create_queue()
+
+    async def handler():
+        started.set()
+        await asyncio.sleep(10)
+
+    queue.register("test", handler, concurrency=1, visibility_timeout=60)
+    await queue.start()
+    job_id = await queue.enqueue("test")
+    await asyncio.wait_for(started.wait(), 2)
+
+    await queue.stop()
+
+    job = await get_job(job_id)
+    assert job.status == QUEUED
+    assert job.attempts == 0
+    assert job.run_at <= time.time()
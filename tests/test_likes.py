@@ -0,0 +1,82 @@
+import pytest
+from storeapi.database import database, like_table, post_table
+from storeapi.likes import LikeBuffer, store_likes
+
+
+@pytest.fixture()
+async def post_id(registered_user: dict) -> int:
+    return await database.execute(
+        post_table.insert().values(body="Test Post", user_id=registered_user["id"])
+    )
+
+
+async def get_like_count(post_id: int) -> int:
+    query = post_table.select().where(post_table.c.id == post_id)
+    return (await database.fetch_one(query)).like_count
+
+
+@pytest.mark.anyio
+async def test_store_likes_skips_existing(post_id: int, registered_user: dict):
+    pair = (post_id, registered_user["id"])
+
+    first = await store_likes([pair, pair])
+    second = await store_likes([pair])
+
+    assert list(first) == [pair]
+    assert second == {}
+    assert await get_like_count(post_id) == 1
+
+
+@pytest.mark.anyio
+async def test_like_buffer_flush(post_id: int, registered_user: dict):
+    buffer = LikeBuffer(max_size=10, flush_interval=60)
+    await buffer.add(post_id, registered_user["id"])
+    await buffer.add(post_id, registered_user["id"])
+    await buffer.add(99, registered_user["id"])
+    assert buffer.depth == 2
+
+    await buffer.flush()
+
+    assert buffer.depth == 0
+    assert await get_like_count(post_id) == 1
+    stats = buffer.stats()
+    assert stats["flushes"] == 1
+    assert stats["flushed_likes"] == 1
+    assert stats["dropped_likes"] == 1
+
+
+@pytest.mark.anyio
+async def test_like_buffer_flushes_when_full(post_id: int, registered_user: dict):
+    buffer = LikeBuffer(max_size=1, flush_interval=60)
+    await buffer.add(post_id, registered_user["id"])
+
+    assert buffer.depth == 0
+    assert await get_like_count(post_id) == 1
+
+
+@pytest.mark.anyio
+async def test_like_buffer_stop_flushes(post_id: int, registered_user: dict):
+    buffer = LikeBuffer(max_size=10, flush_interval=60)
+    await buffer.start()
+    await buffer.add(post_id, registered_user["id"])
+
+    await buffer.stop()
+
+    assert buffer.depth == 0
+    assert await get_like_count(post_id) == 1
+
+
+@pytest.mark.anyio
+async def test_like_buffer_keeps_likes_when_flush_fails(
+    post_id: int, registered_user: dict, mocker
+):
+    mocker.patch("likes.store_likes", side_effect=RuntimeError("database is locked"))
+    buffer = LikeBuffer(max_size=10, flush_interval=60)
+    await buffer.add(post_id, registered_user["id"])
+
+    await buffer.flush()
+
+    assert buffer.depth == 1
+    assert buffer.stats()["failed_flushes"] == 1
+    query = like_table.select().where(like_table.c.post_id == post_id)
+    assert await database.fetch_all(query) == []
@@ -0,0 +1,58 @@
+import pytest
+from fastapi import HTTPException
+from storeapi.ratelimit import MemoryRateLimitStore, check_login_rate
+
+
+@pytest.mark.anyio
+async def test_memory_store_takes_until_empty():
+    store = MemoryRateLimitStore(max_keys=10)
+
+    assert [await store.take("key", 2, 1.0) for _ in range(2)] == [0, 0]
+    assert await store.take("key", 2, 1.0) == pytest.approx(1.0, abs=0.01)
+    assert await store.take("other", 2, 1.0) == 0
+
+
+@pytest.mark.anyio
+async def test_memory_store_refills(mocker):
+    now = mocker.patch("ratelimit.time.monotonic", return_value=100.0)
+    store = MemoryRateLimitStore(max_keys=10)
+    await store.take("key", 1, 0.5)
+    assert await store.take("key", 1, 0.5) == pytest.approx(2.0)
+
+    now.return_value = 102.0
+    assert await store.take("key", 1, 0.5) == 0
+
+
+@pytest.mark.anyio
+async def test_memory_store_evicts_least_recently_used():
+    store = MemoryRateLimitStore(max_keys=2)
+    for key in ("a", "b", "c"):
+        await store.take(key, 1, 1.0)
+
+    assert store.stats()["buckets"] == 2
+    assert store.stats()["evictions"] == 1
+    # The evicted bucket starts full again.
+    assert await store.take("a", 1, 1.0) == 0
+
+
+@pytest.mark.anyio
+async def test_check_login_rate_limits_email(mocker):
+    mocker.patch("storeapi.config.config.LOGIN_RATE_LIMIT_EMAIL_ATTEMPTS", 2)
+    for ip in ("10.0.0.1", "10.0.0.2"):
+        await check_login_rate("test@example.net", ip)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await check_login_rate("Test@Example.net", "10.0.0.3")
+    assert exc_info.value.status_code == 429
+    assert int(exc_info.value.headers["Retry-After"]) >= 1
+
+
+@pytest.mark.anyio
+async def test_check_login_rate_limits_ip(mocker):
+    mocker.patch("storeapi.config.config.LOGIN_RATE_LIMIT_IP_ATTEMPTS", 2)
+    for email in ("a@example.net", "b@example.net"):
+        await check_login_rate(email, "10.0.0.1")
+
+    with pytest.raises(HTTPException) as exc_info:
+        await check_login_rate("c@example.net", "10.0.0.1")
+    assert exc_info.value.status_code == 429
@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+import pytest
+import sqlalchemy
+from storeapi.database import database, revoked_token_table
+from storeapi.revocation import BloomFilter, RevocationList
+
+
+@pytest.fixture()
+def revocations() -> RevocationList:
+    return RevocationList(capacity=100, error_rate=0.01, refresh_seconds=60)
+
+
+def test_bloom_filter_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    items = [f"token-{i}" for i in range(1000)]
+    for item in items:
+        bloom.add(item)
+
+    assert all(item in bloom for item in items)
+    false_positives = sum(f"other-{i}" in bloom for i in range(10_000))
+    assert false_positives < 300
+
+
+@pytest.mark.anyio
+async def test_revoke(revocations: RevocationList):
+    assert not await revocations.is_revoked("abc")
+
+    await revocations.revoke("abc", int(time.time()) + 60)
+
+    assert await revocations.is_revoked("abc")
+    assert not await revocations.is_revoked("def")
+    stats = revocations.stats()
+    assert stats["revoked_tokens"] == 1
+    assert stats["checks"] == 3
+
+
+@pytest.mark.anyio
+async def test_false_positive_checked_in_database(revocations: RevocationList):
+    await revocations.refresh()
+    # Not in the table, as if revoked, expired and purged by another process.
+    revocations._filter.add("abc")
+
+    assert not await revocations.is_revoked("abc")
+    assert revocations.stats()["false_positives"] == 1
+
+
+@pytest.mark.anyio
+async def test_refresh_loads_other_revocations(revocations: RevocationList):
+    assert not await revocations.is_revoked("abc")
+    await database.execute(
+        revoked_token_table.insert().values(jti="abc", expires_at=time.time() + 60)
+    )
+    assert not await revocations.is_revoked("abc")
+
+    await revocations.refresh()
+
+    assert await revocations.is_revoked("abc")
+
+
+@pytest.mark.anyio
+async def test_refresh_drops_expired(revocations: RevocationList):
+    await revocations.revoke("expired", int(time.time()) - 1)
+    await revocations.revoke("valid", int(time.time()) + 60)
+
+    await revocations.refresh()
+
+    rows = await database.fetch_all(sqlalchemy.select(revoked_token_table.c.jti))
+    assert [row.jti for row in rows] == ["valid"]
+    assert revocations.stats()["revoked_tokens"] == 1
+    assert not await revocations.is_revoked("expired")
+
+
+@pytest.mark.anyio
+async def test_revoke_past_capacity_rebuilds(revocations: RevocationList):
+    expires_at = int(time.time()) + 60
+    for i in range(101):
+        await revocations.revoke(f"token-{i}", expires_at)
+
+    assert await revocations.is_revoked("token-0")
+    assert revocations.stats()["refreshes"] == 1
+    assert revocations._filter.capacity == 202
+
+
+@pytest.mark.anyio
+async def test_concurrent_checks_refresh_once(revocations: RevocationList):
+    await revocations.revoke("abc", int(time.time()) + 60)
+    await revocations.refresh()
+    revocations._refresh_at = 0.0
+
+    results = await asyncio.gather(*(revocations.is_revoked("abc") for _ in range(10)))
+
+    assert all(results)
+    assert revocations.stats()["refreshes"] == 2
@@ -1,6 +1,7 @@
 import pytest
 from jose import jwt
 from storeapi import security
+from storeapi.database import database, user_table
 
 
 def test_access_token_expire_minutes():
@@ -131,4 +132,187 @@ async def test_get_current_user_wrong_type_token(registered_user: dict):
     token = security.create_confirmation_token(registered_user["email"])
 
     with pytest.raises(security.HTTPException):
-        await security.get_current_user(token)
\ No newline at end of file
+        await security.get_current_user(token)
+
+@pytest.mark.anyio
+async def test_get_current_user_cached(registered_user: dict):
+    token = security.create_access_token(registered_user["email"])
+    await security.get_current_user(token)
+    before = security.user_cache_stats()
+
+    user = await security.get_current_user(token)
+
+    assert user.email == registered_user["email"]
+    stats = security.user_cache_stats()
+    assert stats["hits"] == before["hits"] + 1
+    assert stats["misses"] == before["misses"]
+
+
+@pytest.mark.anyio
+async def test_get_current_user_unknown_user_cached():
+    token = security.create_access_token("test@example.net")
+    with pytest.raises(security.HTTPException):
+        await security.get_current_user(token)
+    before = security.user_cache_stats()
+
+    with pytest.raises(security.HTTPException):
+        await security.get_current_user(token)
+
+    stats = security.user_cache_stats()
+    assert stats["negative_hits"] == before["negative_hits"] + 1
+    assert stats["misses"] == before["misses"]
+
+
+@pytest.mark.anyio
+async def test_invalidate_user(registered_user: dict):
+    await security.get_cached_user(registered_user["email"])
+    await security.invalidate_user(registered_user["email"])
+    before = security.user_cache_stats()
+
+    await security.get_cached_user(registered_user["email"])
+
+    assert security.user_cache_stats()["misses"] == before["misses"] + 1
+
+
+def test_create_access_token_with_user_id():
+    token = security.create_access_token("123", user_id=1, token_version=2)
+    assert {"sub": "123", "uid": 1, "ver": 2}.items() <= jwt.decode(
+        token, key=security.SECRET_KEY, algorithms=[security.ALGORITHM]
+    ).items()
+
+
+@pytest.mark.anyio
+async def test_get_current_user_from_claims(registered_user: dict):
+    token = security.create_access_token(
+        registered_user["email"], registered_user["id"]
+    )
+    before = security.user_cache_stats()
+
+    user = await security.get_current_user_from_claims(token)
+
+    assert user == security.User(
+        id=registered_user["id"], email=registered_user["email"]
+    )
+    stats = security.user_cache_stats()
+    assert (stats["hits"], stats["misses"]) == (before["hits"], before["misses"])
+
+
+@pytest.mark.anyio
+async def test_get_current_user_from_claims_without_user_id(registered_user: dict):
+    token = security.create_access_token(registered_user["email"])
+    user = await security.get_current_user_from_claims(token)
+    assert user.id == registered_user["id"]
+
+
+@pytest.mark.anyio
+async def test_get_current_user_from_claims_unknown_user():
+    token = security.create_access_token("test@example.net", user_id=1)
+    with pytest.raises(security.HTTPException) as exc_info:
+        await security.get_current_user_from_claims(token)
+    assert "Could not find user for this token" == exc_info.value.detail
+
+
+@pytest.mark.anyio
+async def test_revoke_user_tokens(registered_user: dict):
+    token = security.create_access_token(
+        registered_user["email"], registered_user["id"]
+    )
+    await security.get_current_user_from_claims(token)
+
+    await security.revoke_user_tokens(registered_user["id"], registered_user["email"])
+
+    dependencies = (security.get_current_user_from_claims, security.get_current_user)
+    for dependency in dependencies:
+        with pytest.raises(security.HTTPException) as exc_info:
+            await dependency(token)
+        assert "Token has been revoked" == exc_info.value.detail
+
+    token = security.create_access_token(
+        registered_user["email"], registered_user["id"], token_version=1
+    )
+    user = await security.get_current_user_from_claims(token)
+    assert user.id == registered_user["id"]
+
+
+@pytest.mark.anyio
+async def test_revoke_token(registered_user: dict):
+    token = security.create_access_token(
+        registered_user["email"], registered_user["id"]
+    )
+    other_token = security.create_access_token(
+        registered_user["email"], registered_user["id"]
+    )
+
+    assert await security.revoke_token(security.decode_token(token, "access"))
+
+    dependencies = (security.get_current_user_from_claims, security.get_current_user)
+    for dependency in dependencies:
+        with pytest.raises(security.HTTPException) as exc_info:
+            await dependency(token)
+        assert "Token has been revoked" == exc_info.value.detail
+        assert (await dependency(other_token)).email == registered_user["email"]
+
+
+@pytest.mark.anyio
+async def test_revoke_token_without_jti():
+    assert not await security.revoke_token({"sub": "test@example.net", "exp": 0})
+
+
+def test_verify_token_cached(mocker):
+    spy = mocker.spy(security.verified_token_cache, "set_nowait")
+    token = security.create_access_token("test@example.com")
+    before = security.verified_token_cache_stats()
+
+    assert security.verify_token(token) == security.verify_token(token)
+
+    stats = security.verified_token_cache_stats()
+    assert stats["misses"] == before["misses"] + 1
+    assert stats["hits"] == before["hits"] + 1
+    # The entry expires with the token.
+    assert 29 * 60 < spy.call_args.kwargs["ttl"] <= 30 * 60
+
+
+def test_verify_token_expired_not_cached(mocker):
+    mocker.patch("storeapi.security.access_token_expire_minutes", return_value=-1)
+    token = security.create_access_token("test@example.com")
+    before = security.verified_token_cache_stats()
+
+    for _ in range(2):
+        with pytest.raises(security.HTTPException):
+            security.verify_token(token)
+
+    assert security.verified_token_cache_stats()["misses"] == before["misses"] + 2
+
+
+@pytest.mark.anyio
+async def test_hash_password_in_pool():
+    before = security.password_hasher.stats()["calls"]
+
+    hashed = await security.hash_password("password")
+
+    assert await security.check_password("password", hashed)
+    assert not await security.check_password("wrong password", hashed)
+    assert security.password_hasher.stats()["calls"] == before + 3
+
+
+def test_create_password_context_rounds(mocker):
+    mocker.patch("storeapi.config.config.PASSWORD_HASH_ROUNDS", {"pbkdf2_sha256": 1000})
+    context = security.create_password_context()
+
+    assert context.hash("password").startswith("$pbkdf2-sha256$1000$")
+    assert context.needs_update(security.get_password_hash("password"))
+
+
+@pytest.mark.anyio
+async def test_authenticate_user_upgrades_hash(confirmed_user: dict, mocker):
+    mocker.patch("storeapi.config.config.PASSWORD_HASH_ROUNDS", {"pbkdf2_sha256": 1000})
+    mocker.patch("security.pwd_context", security.create_password_context())
+
+    await security.authenticate_user(
+        confirmed_user["email"], confirmed_user["password"]
+    )
+
+    query = user_table.select().where(user_table.c.email == confirmed_user["email"])
+    user = await database.fetch_one(query)
+    assert user.password.startswith("$pbkdf2-sha256$1000$")
+    assert security.verify_password(confirmed_user["password"], user.password)
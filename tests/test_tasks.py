@@ -1,3 +1,6 @@
+import json
+from unittest.mock import AsyncMock, Mock
+
 import httpx
 import pytest
 from databases import Database
@@ -5,10 +8,18 @@ from storeapi.database import database, post_table
 from storeapi.tasks import (
     APIResponseError,
     _generate_cute_creature_api,
+    close_http_client,
     generate_and_add_to_post,
+    open_http_client,
+    send_batch_email,
+    send_batched_email,
     send_simple_email,
+    use_http_client,
 )
 
+# Before the autouse mock_httpx_client fixture replaces it.
+RealAsyncClient = httpx.AsyncClient
+
 
 @pytest.mark.anyio
 async def test_send_simple_email(mock_httpx_client):
@@ -16,6 +27,29 @@ async def test_send_simple_email(mock_httpx_client):
     mock_httpx_client.post.assert_called()
 
 
+@pytest.mark.anyio
+async def test_send_simple_email_with_client(mock_httpx_client):
+    client = Mock(post=AsyncMock(return_value=mock_httpx_client.post.return_value))
+
+    await send_simple_email("test@example.net", "Test Subject", "Test Body", client)
+
+    client.post.assert_called_once()
+    mock_httpx_client.post.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_shared_http_client(mocker):
+    mocker.patch("storeapi.tasks.httpx.AsyncClient", RealAsyncClient)
+    await open_http_client()
+    try:
+        async with use_http_client() as first, use_http_client() as second:
+            assert first is second
+            assert not first.is_closed
+    finally:
+        await close_http_client()
+    assert first.is_closed
+
+
 @pytest.mark.anyio
 async def test_send_simple_email_api_error(mock_httpx_client):
     mock_httpx_client.post.return_value = httpx.Response(
@@ -26,6 +60,44 @@ async def test_send_simple_email_api_error(mock_httpx_client):
         await send_simple_email("test@example.net", "Test Subject", "Test Body")
 
 
+@pytest.mark.anyio
+async def test_send_batch_email(mock_httpx_client):
+    recipients = {
+        "a@example.net": {"name": "A"},
+        "b@example.net": {"name": "B"},
+    }
+
+    await send_batch_email("Test Subject", "Hi %recipient.name%", recipients)
+
+    data = mock_httpx_client.post.call_args.kwargs["data"]
+    assert data["to"] == ["a@example.net", "b@example.net"]
+    assert data["text"] == "Hi %recipient.name%"
+    assert json.loads(data["recipient-variables"]) == recipients
+
+
+@pytest.mark.anyio
+async def test_send_batch_email_api_error(mock_httpx_client):
+    mock_httpx_client.post.return_value = httpx.Response(
+        status_code=400, content="", request=httpx.Request("POST", "//")
+    )
+
+    with pytest.raises(APIResponseError) as exc_info:
+        await send_batch_email("Test Subject", "Test Body", {"a@example.net": {}})
+    assert exc_info.value.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_send_batched_email(mock_httpx_client):
+    await send_batched_email(
+        "a@example.net", "Test Subject", "%recipient.url%", url="http://test/"
+    )
+
+    data = mock_httpx_client.post.call_args.kwargs["data"]
+    assert json.loads(data["recipient-variables"]) == {
+        "a@example.net": {"email": "a@example.net", "url": "http://test/"}
+    }
+
+
 @pytest.mark.anyio
 async def test_generate_cute_creature_api_success(mock_httpx_client):
     json_data = {"output_url": "https://example.com/image.jpg"}
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from storeapi.uploads import StreamingUpload
+
+
+class FakeExecutor:
+    """Runs B2 calls on the event loop, parts only once released."""
+
+    def __init__(self):
+        self.calls = []
+        self.uploading = 0
+        self.release = asyncio.Event()
+
+    async def run(self, fn, *args):
+        name = fn.__name__
+        self.calls.append((name, *args))
+        if name == "b2_upload_part":
+            self.uploading += 1
+            await self.release.wait()
+            self.uploading -= 1
+            return f"sha1-{args[1]}"
+        if name == "b2_start_large_file":
+            return "large-file-id"
+        return "https://fakeurl.com"
+
+
+@pytest.mark.anyio
+async def test_parts_in_flight_are_bounded():
+    executor = FakeExecutor()
+    upload = StreamingUpload("big.bin", executor, part_size=2, max_parts_in_flight=2)
+
+    writing = asyncio.create_task(upload.write(b"0123456789"))
+    await asyncio.sleep(0.01)
+
+    # Two parts uploading, the third waits, and so does the rest of the data.
+    assert executor.uploading == 2
+    assert not writing.done()
+
+    executor.release.set()
+    await writing
+    assert await upload.finish() == "https://fakeurl.com"
+
+    parts = [call for call in executor.calls if call[0] == "b2_upload_part"]
+    assert [(number, data) for _, _, number, data in parts] == [
+        (1, b"01"),
+        (2, b"23"),
+        (3, b"45"),
+        (4, b"67"),
+        (5, b"89"),
+    ]
+    assert executor.calls[-1] == (
+        "b2_finish_large_file",
+        "large-file-id",
+        [f"sha1-{number}" for number in range(1, 6)],
+    )
+
+
+@pytest.mark.anyio
+async def test_file_of_one_part_is_uploaded_whole():
+    executor = FakeExecutor()
+    upload = StreamingUpload("small.bin", executor, part_size=4, max_parts_in_flight=2)
+
+    await upload.write(b"01")
+    await upload.write(b"23")
+
+    assert await upload.finish() == "https://fakeurl.com"
+    assert executor.calls == [("b2_upload_bytes", b"0123", "small.bin")]
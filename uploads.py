@@ -0,0 +1,115 @@
+import asyncio
+import logging
+from typing import Optional
+
+from storeapi.config import config
+from storeapi.executors import BoundedExecutor
+from storeapi.libs.b2 import (
+    b2_cancel_large_file,
+    b2_finish_large_file,
+    b2_start_large_file,
+    b2_upload_bytes,
+    b2_upload_part,
+)
+from storeapi.metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+# b2sdk blocks, so every B2 call runs in this pool, shared by all uploads.
+b2_executor = BoundedExecutor(
+    "b2_upload", kind="thread", max_workers=config.B2_UPLOAD_WORKERS
+)
+register_metrics("b2_upload", b2_executor.stats)
+
+
+class StreamingUpload:
+    """Uploads a file to B2 while it is still arriving.
+
+    `write` collects data until it has more than `part_size` bytes and then
+    uploads a part of that size in `executor`, without waiting for it. Once
+    `max_parts_in_flight` parts are uploading, `write` waits for one of them
+    to finish, so an upload holds at most about `max_parts_in_flight + 1`
+    parts in memory however big the file. `finish` uploads the rest and
+    returns the download URL; a file that fits in one part goes up in a
+    single request instead. After an error, call `abort`.
+    """
+
+    def __init__(
+        self,
+        file_name: str,
+        executor: BoundedExecutor,
+        part_size: int,
+        max_parts_in_flight: int,
+    ):
+        self.file_name = file_name
+        self.executor = executor
+        self.part_size = part_size
+        self.size = 0
+        self._buffer = bytearray()
+        self._file_id: Optional[str] = None
+        self._parts: list[asyncio.Task] = []
+        self._slots = asyncio.Semaphore(max_parts_in_flight)
+
+    async def write(self, data: bytes) -> None:
+        self._buffer += data
+        self.size += len(data)
+        # Only more than a part, so a file of exactly one part is no large file.
+        while len(self._buffer) > self.part_size:
+            with memoryview(self._buffer) as view:
+                part = bytes(view[: self.part_size])
+            del self._buffer[: self.part_size]
+            await self._start_part(part)
+
+    async def _start_part(self, data: bytes) -> None:
+        await self._slots.acquire()
+        for task in self._parts:
+            if task.done() and task.exception() is not None:
+                self._slots.release()
+                raise task.exception()
+
+        if self._file_id is None:
+            self._file_id = await self.executor.run(b2_start_large_file, self.file_name)
+        part_number = len(self._parts) + 1
+        self._parts.append(asyncio.create_task(self._upload_part(part_number, data)))
+
+    async def _upload_part(self, part_number: int, data: bytes) -> str:
+        try:
+            return await self.executor.run(
+                b2_upload_part, self._file_id, part_number, data
+            )
+        finally:
+            self._slots.release()
+
+    async def finish(self) -> str:
+        if self._file_id is None:
+            return await self.executor.run(
+                b2_upload_bytes, bytes(self._buffer), self.file_name
+            )
+
+        if self._buffer:
+            await self._start_part(bytes(self._buffer))
+            self._buffer.clear()
+        part_sha1s = await asyncio.gather(*self._parts)
+        logger.debug(f"Uploaded {self.size} bytes in {len(part_sha1s)} parts")
+        return await self.executor.run(
+            b2_finish_large_file, self._file_id, list(part_sha1s)
+        )
+
+    async def abort(self) -> None:
+        for task in self._parts:
+            task.cancel()
+        await asyncio.gather(*self._parts, return_exceptions=True)
+        if self._file_id is not None:
+            try:
+                await self.executor.run(b2_cancel_large_file, self._file_id)
+            except Exception:
+                logger.exception(f"Could not cancel B2 large file {self._file_id}")
+
+
+def create_upload(file_name: str) -> StreamingUpload:
+    return StreamingUpload(
+        file_name,
+        b2_executor,
+        part_size=config.B2_PART_SIZE,
+        max_parts_in_flight=config.B2_UPLOAD_PARTS_IN_FLIGHT,
+    )
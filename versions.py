@@ -0,0 +1,54 @@
+import logging
+from typing import Iterable, Optional
+
+import sqlalchemy
+from sqlalchemy.dialects import sqlite
+from storeapi.database import database, post_table, version_table
+
+logger = logging.getLogger(__name__)
+
+POSTS_VERSION = "posts"
+
+
+async def get_version(name: str) -> int:
+    query = sqlalchemy.select(version_table.c.value).where(
+        version_table.c.name == name
+    )
+    return await database.fetch_val(query) or 0
+
+
+async def get_post_version(post_id: int) -> Optional[int]:
+    """Return the post's version, or None if the post does not exist."""
+    query = sqlalchemy.select(post_table.c.version).where(post_table.c.id == post_id)
+    return await database.fetch_val(query)
+
+
+async def bump_version(name: str) -> None:
+    logger.debug(f"Bumping version '{name}'")
+    query = (
+        sqlite.insert(version_table)
+        .values(name=name, value=1)
+        .on_conflict_do_update(
+            index_elements=[version_table.c.name],
+            set_={"value": version_table.c.value + 1},
+        )
+    )
+    await database.execute(query)
+
+
+async def bump_post_versions(post_ids: Iterable[int]) -> None:
+    """Record a change to some posts, which is also a change to the listings.
+
+    Call it inside the transaction that makes the change.
+    """
+    query = (
+        post_table.update()
+        .where(post_table.c.id.in_(list(post_ids)))
+        .values(version=post_table.c.version + 1)
+    )
+    await database.execute(query)
+    await bump_version(POSTS_VERSION)
+
+
+async def bump_post_version(post_id: int) -> None:
+    await bump_post_versions([post_id])